@@ -5,8 +5,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
 from config import config
+from .replicas import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
 
 root_logger = logging.getLogger()
@@ -29,10 +30,46 @@ def create_app(config_name="development"):
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
 
+    from . import serialization
+    serialization.init_app(app)
+
+    from . import pool
+    from . import replicas
+    pool.configure(app)
+    replicas.configure(app)
     db.init_app(app)
+    pool.init_app(app)
+    replicas.init_app(app)
     migrate.init_app(app, db)
     JWTManager(app)
 
+    from . import revocation
+    revocation.init_app(app)
+
+    from . import catalog
+    catalog.init_app(app)
+
+    from . import upgrades
+    upgrades.init_app(app)
+
+    from . import commands
+    commands.init_app(app)
+
+    from . import passwords
+    passwords.init_app(app)
+
+    from . import idempotency
+    idempotency.init_app(app)
+
+    from . import write_behind
+    write_behind.init_app(app)
+
+    from . import instrumentation
+    instrumentation.init_app(app)
+
+    from . import warmup
+    warmup.init_app(app)
+
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
@@ -1,10 +1,13 @@
-from flask_jwt_extended import create_access_token
+from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity, jwt_required
 from flask import jsonify, request
-from datetime import  timedelta
 from marshmallow import Schema, fields, validate, ValidationError, pre_load
-from werkzeug.security import generate_password_hash, check_password_hash
 from . import api
 from ..models import User
+from ..passwords import password_hasher, HasherBusy
+from ..permissions import admin_required
+from ..revocation import revoke_token, revoke_user
+from ..validation import validator
+from ..write_behind import last_login_buffer
 from app import logger
 
 
@@ -23,7 +26,7 @@ class SignupSchema(Schema):
 
 @api.route('/auth/register', methods=['POST'])
 def signup_user():
-    schema = SignupSchema()
+    schema = validator(SignupSchema)
 
     try:
         data = schema.load(request.json)
@@ -36,7 +39,10 @@ def signup_user():
 
     new_user = User(**data) 
     new_user.email = data['email'].lower() 
-    new_user.password = generate_password_hash(data['password'])
+    try:
+        new_user.password = password_hasher().hash(data['password'])
+    except HasherBusy:
+        return jsonify({"message": "the service is busy, please retry shortly"}), 503, {"Retry-After": "1"}
     try:
         new_user.save_to_db()
     except Exception as e:
@@ -59,7 +65,7 @@ class LoginSchema(Schema):
 
 @api.route('/auth/login', methods=['POST'])
 def login_user():
-    schema = LoginSchema()
+    schema = validator(LoginSchema)
 
     try:
         data = schema.load(request.json)
@@ -70,10 +76,56 @@ def login_user():
     if not existing_user:
         return jsonify({"message": "Invalid email or password"}), 401
 
-    if not check_password_hash(existing_user.password, data['password']):
-        return jsonify({"message": "Invalid email or password"}), 401
+    hasher = password_hasher()
+    try:
+        if not hasher.verify(existing_user.password, data['password']):
+            return jsonify({"message": "Invalid email or password"}), 401
 
-    token = create_access_token(identity=existing_user.id, expires_delta=timedelta(hours=1))
-    existing_user.update_last_login()
+        if hasher.needs_rehash(existing_user.password):
+            existing_user.password = hasher.hash(data['password'])
+            existing_user.save_to_db()
+    except HasherBusy:
+        return jsonify({"message": "the service is busy, please retry shortly"}), 503, {"Retry-After": "1"}
+
+    token = create_access_token(
+        identity=existing_user.id,
+        additional_claims={"is_admin": existing_user.is_admin},
+    )
+    last_login_buffer().record(existing_user.id)
 
     return jsonify({"message": "login successful", "token": token }), 200
+
+
+@api.route('/auth/logout', methods=['POST'])
+@jwt_required()
+def logout_user():
+    revoke_token(get_jwt())
+    return jsonify({"message": "logout successful"}), 200
+
+
+@api.route('/auth/logout-all', methods=['POST'])
+@jwt_required()
+def logout_all_sessions():
+    revoke_user(get_jwt_identity(), get_jwt())
+    return jsonify({"message": "all sessions logged out"}), 200
+
+
+class RevokeSessionsSchema(Schema):
+    user_id = fields.UUID(required=True)
+
+@api.route('/auth/revoke', methods=['POST'])
+@admin_required()
+def revoke_user_sessions():
+    schema = validator(RevokeSessionsSchema)
+
+    try:
+        data = schema.load(request.json)
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+
+    user = User.find_by_id(str(data['user_id']))
+    if not user:
+        return jsonify({"message": "the user was not found"}), 404
+
+    revoke_user(user.id)
+    return jsonify({"message": f"all sessions of {user.email} logged out"}), 200
@@ -1,9 +1,17 @@
-from collections import defaultdict
+import uuid
+from sqlalchemy import insert
 from flask_jwt_extended import jwt_required
-from flask import jsonify, request
+from flask import current_app, jsonify, request
 from marshmallow import Schema, fields, validate, validates_schema, ValidationError, pre_load
 from . import api
 from ..models import db, Plan, PlanInterval, PlanIntervalPrice
+from ..catalog import plan_catalog_cache, mark_catalog_changed
+from ..plan_catalog import (
+    plan_catalog_payload, plan_catalog_statement, stored_plan_catalog, stored_plan_catalog_statement,
+)
+from ..serialization import negotiated_mimetype
+from ..validation import validator
+from ..replicas import read_only, on_primary
 from app import logger
 
 
@@ -64,7 +72,7 @@ class CreatePlanSchema(Schema):
 @api.route('/plan', methods=['POST'])
 @jwt_required()
 def create_plan():
-    schema = CreatePlanSchema()
+    schema = validator(CreatePlanSchema)
 
     try:
         data = schema.load(request.json)
@@ -102,41 +110,109 @@ def create_plan():
     return jsonify({"message": "Plan created", "data": new_plan.to_dict()}), 201
 
 
+class BulkCreatePlanSchema(Schema):
+    plans = fields.List(fields.Dict(), required=True, validate=validate.Length(min=1, error="At least one plan is required"))
+
+
+@api.route('/plan/bulk', methods=['POST'])
+@jwt_required()
+def create_plans_bulk():
+    try:
+        payload = validator(BulkCreatePlanSchema).load(request.json)
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+
+    max_items = current_app.config['PLAN_BULK_MAX_ITEMS']
+    if len(payload['plans']) > max_items:
+        return jsonify({"message": f"A bulk request cannot contain more than {max_items} plans"}), 400
+
+    schema = validator(CreatePlanSchema)
+    results = []
+    valid = []
+    for index, item in enumerate(payload['plans']):
+        try:
+            valid.append((index, schema.load(item)))
+            results.append(None)
+        except ValidationError as err:
+            results.append({"index": index, "status": "error", "errors": err.messages})
+
+    names = [data['name'] for _, data in valid]
+    existing_names = {
+        name for (name,) in db.session.query(Plan.name).filter(Plan.name.in_(names))
+    } if names else set()
+
+    plan_rows, interval_rows, price_rows = [], [], []
+    seen_names = set()
+    for index, data in valid:
+        if data['name'] in existing_names:
+            results[index] = {"index": index, "status": "error", "errors": {"name": [f"Plan with the name {data['name']} already exists"]}}
+            continue
+        if data['name'] in seen_names:
+            results[index] = {"index": index, "status": "error", "errors": {"name": [f"Plan with the name {data['name']} appears more than once in this request"]}}
+            continue
+        seen_names.add(data['name'])
+
+        plan_id = str(uuid.uuid4())
+        plan_rows.append({"id": plan_id, "name": data['name'], "description": data['description']})
+        for interval_data in data['intervals']:
+            interval_id = str(uuid.uuid4())
+            interval_rows.append({
+                "id": interval_id,
+                "plan_id": plan_id,
+                "interval": interval_data['interval'],
+                "interval_count": interval_data['interval_count'],
+            })
+            for price_data in interval_data['prices']:
+                price_rows.append({
+                    "id": str(uuid.uuid4()),
+                    "interval_id": interval_id,
+                    "currency": price_data['currency'].upper(),
+                    "amount": price_data['amount'],
+                })
+        results[index] = {"index": index, "status": "created", "id": plan_id, "name": data['name']}
+
+    if plan_rows:
+        try:
+            db.session.execute(insert(Plan), plan_rows)
+            db.session.execute(insert(PlanInterval), interval_rows)
+            db.session.execute(insert(PlanIntervalPrice), price_rows)
+            mark_catalog_changed(db.session)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error creating plans in bulk: {e}")
+            return jsonify({"message": "your request could not be processed at this time"}), 500
+
+    created = len(plan_rows)
+    failed = len(results) - created
+    status_code = 201 if not failed else (400 if not created else 207)
+    return jsonify({"message": f"{created} plans created, {failed} failed", "results": results}), status_code
+
+
 @api.route('/plan', methods=['GET'])
 @jwt_required()
+@read_only()
 def get_plans():
-    currency = request.args.get('currency', type=str)
-    query = (
-            db.session.query(
-                Plan,
-                PlanInterval,
-                PlanIntervalPrice,
-            )
-            .join(Plan, Plan.id == PlanInterval.plan_id)
-            .join(PlanIntervalPrice, PlanInterval.id == PlanIntervalPrice.interval_id)
-            .filter(Plan.is_active == True)
-            .filter(PlanInterval.is_active == True)
-            .filter(PlanIntervalPrice.is_active == True)
-            )
-    if currency:
-        query = query.filter(PlanIntervalPrice.currency == currency)
-
-
-    plans = query.all()
-
-    output = []
-    included_plans = defaultdict(list)
-    for plan, interval, price in plans:
-        plan_data = plan.to_dict()
-        interval_data = interval.to_dict()
-        price_data = price.to_dict()
-        interval_data['prices'] = [price_data]
-        if plan.id in included_plans:
-            included_plans[plan.id]['intervals'].append(interval_data)
-        else:
-            included_plans[plan.id] = plan_data
-            included_plans[plan.id]['intervals'] = [interval_data]
-    
-    output = sorted(included_plans.values(), key=lambda x: x["created_at"])
-    
-    return jsonify({"message": "Successfully retrieved plans", "plans":output} ), 200
+    # stored currencies are upper case, and MySQL compares them case-insensitively
+    currency = request.args.get('currency', type=str.upper)
+    mimetype = negotiated_mimetype()
+    body = plan_catalog_cache().get(
+        (currency, mimetype),
+        lambda: current_app.json.encode_stored(build_plan_catalog(currency), mimetype),
+    )
+    return current_app.json.make_response(body, mimetype), 200
+
+
+@on_primary
+def build_plan_catalog(currency=None):
+    """The catalog for `currency` as compact JSON: its stored document, or
+    rendered from the catalog tables while plan_catalog has not been built."""
+    encoder = current_app.json
+    document = stored_plan_catalog(
+        currency, db.session.execute(stored_plan_catalog_statement(currency)).all(), encoder
+    )
+    if document is None:
+        document = encoder.encode_document(
+            plan_catalog_payload(db.session.execute(plan_catalog_statement(currency)).all())
+        )
+    return document
@@ -1,10 +1,22 @@
+import uuid
 from datetime import datetime, timezone, timedelta
 from collections import defaultdict
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from flask import jsonify, request
-from marshmallow import Schema, fields, validate, validates_schema, ValidationError, pre_load
+from flask import current_app, jsonify, request, stream_with_context
+from marshmallow import EXCLUDE, Schema, fields, validate, validates_schema, ValidationError, pre_load
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 from . import api
 from ..models import db, Subscription, Plan, PlanInterval, PlanIntervalPrice, PlanUpgrade
+from ..catalog import resolve_price
+from ..counters import subscription_counts
+from ..pagination import encode_cursor, decode_cursor, InvalidCursor
+from ..permissions import admin_required
+from ..proration import prorate, price_change_impact
+from ..idempotency import idempotent
+from ..validation import validator
+from ..replicas import read_only
+from ..upgrades import upgrade_graph
 from app import logger
 
 
@@ -13,8 +25,9 @@ class CreateSubscriptionSchema(Schema):
 
 @api.route('/subscription', methods=['POST'])
 @jwt_required()
+@idempotent()
 def create_subscription():
-    schema = CreateSubscriptionSchema()
+    schema = validator(CreateSubscriptionSchema)
 
     current_user_id = get_jwt_identity()
 
@@ -23,32 +36,17 @@ def create_subscription():
     except ValidationError as err:
         return jsonify(err.messages), 400
 
-    query = (
-            db.session.query(
-                PlanInterval,
-                PlanIntervalPrice,
-                Plan,
-            )
-            .join(PlanIntervalPrice, PlanInterval.id == PlanIntervalPrice.interval_id)
-            .join(Plan, Plan.id == PlanInterval.plan_id)
-            .filter(PlanInterval.is_active == True)
-            .filter(PlanIntervalPrice.is_active == True)
-            .filter(Plan.is_active == True)
-            .filter(PlanIntervalPrice.id == str(data['price_id']))
-        )
-
-
-    res  = query.first()
+    res = resolve_price(data['price_id'])
     if not res:
         return jsonify({"message": "the price id was not found"}), 404
 
 
-    plan_interval, plan_inteval_price, plan = res
+    plan, plan_interval, plan_inteval_price = res
     
 
     existing_active_subscription = Subscription.find_by_params(plan_id = plan.id, user_id=current_user_id , status = 'active')
     if existing_active_subscription:
-        return jsonify({"message": f"You have an active subscription with this plan"}), 400
+        return jsonify({"message": f"You have an active subscription with this plan"}), 409
 
     new_subscription = Subscription()
     new_subscription.user_id = current_user_id
@@ -64,7 +62,14 @@ def create_subscription():
     new_subscription.status = 'active'
     new_subscription.amount_paid = plan_inteval_price.amount
     new_subscription.upgraded_from_subscription_id = None
-    new_subscription.save_to_db()
+    try:
+        new_subscription.save_to_db()
+    except IntegrityError as e:
+        # a concurrent request created it between the check above and this insert
+        db.session.rollback()
+        if not Subscription.is_active_plan_conflict(e):
+            raise
+        return jsonify({"message": f"You have an active subscription with this plan"}), 409
 
 
     return jsonify({"message": "Subscription created", "data": new_subscription.to_dict()}), 201
@@ -76,9 +81,10 @@ class UpgradeSubscriptionSchema(Schema):
 
 @api.route('/subscription_upgrade', methods=['PATCH'])
 @jwt_required()
+@idempotent()
 def upgrade_subcription():
 
-    schema = UpgradeSubscriptionSchema()
+    schema = validator(UpgradeSubscriptionSchema)
 
     try:
         data = schema.load(request.json)
@@ -97,26 +103,12 @@ def upgrade_subcription():
     if existing_active_subscription.interval == 'one_time':
         return jsonify({"message": "You cannot upgrade a one-time subscription"}), 400
 
-    query = (
-            db.session.query(
-                PlanInterval,
-                PlanIntervalPrice,
-                Plan,
-            )
-            .join(PlanIntervalPrice, PlanInterval.id == PlanIntervalPrice.interval_id)
-            .join(Plan, Plan.id == PlanInterval.plan_id)
-            .filter(PlanInterval.is_active == True)
-            .filter(PlanIntervalPrice.is_active == True)
-            .filter(Plan.is_active == True)
-            .filter(PlanIntervalPrice.id == str(data['new_price_id']))
-        )
-
-    res  = query.first()
+    res = resolve_price(data['new_price_id'])
     if not res:
         return jsonify({"message": "the price id was not found"}), 404
 
 
-    new_plan_interval, new_plan_inteval_price, new_plan = res
+    new_plan, new_plan_interval, new_plan_inteval_price = res
 
 
     if new_plan.id == existing_active_subscription.plan_id:
@@ -126,7 +118,7 @@ def upgrade_subcription():
         return jsonify({"message": "You cannot upgrade between different billing intervals"}), 400
 
     
-    is_plan_upgradeable = PlanUpgrade.find_by_params(old_plan_id=existing_active_subscription.plan_id, new_plan_id=new_plan.id, is_active=True)
+    is_plan_upgradeable = upgrade_graph().allows(existing_active_subscription.plan_id, new_plan.id)
     if not is_plan_upgradeable:
         return jsonify({"message": "You cannot upgrade between these plans"}), 400
 
@@ -144,16 +136,18 @@ def upgrade_subcription():
     new_subscription.current_period_end = new_subscription.current_period_start  + Plan.get_interval_days(new_plan_interval.interval, new_plan_interval.interval_count)
     new_subscription.status = 'active'
 
-    total_subscription_days= (existing_active_subscription.current_period_end - existing_active_subscription.current_period_start).days
-
-    amount_paid_per_day = existing_active_subscription.amount_paid / total_subscription_days
-    days_left = (existing_active_subscription.current_period_end.replace(tzinfo=timezone.utc)- datetime.now(timezone.utc)).days
-    if days_left <= 0:
+    proration = prorate(
+        existing_active_subscription.amount_paid,
+        existing_active_subscription.current_period_start,
+        existing_active_subscription.current_period_end,
+        new_plan_inteval_price.amount,
+    )
+    if proration is None:
         return jsonify({"message": "You cannot upgrade a subscription that has already ended"}), 400
 
 
 
-    new_subscription.amount_paid = int(new_plan_inteval_price.amount - (amount_paid_per_day * days_left))
+    new_subscription.amount_paid = proration.charge
     new_subscription.interval = new_plan_interval.interval
 
     new_subscription.upgraded_from_subscription_id = existing_active_subscription.id
@@ -161,7 +155,16 @@ def upgrade_subcription():
     existing_active_subscription.status = 'ended'
     existing_active_subscription.ended_at = datetime.now(timezone.utc)
     existing_active_subscription.save_without_commit()
-    new_subscription.save_to_db()
+    try:
+        new_subscription.save_to_db()
+    except IntegrityError as e:
+        db.session.rollback()
+        if Subscription.is_active_plan_conflict(e):
+            return jsonify({"message": "You have an active subscription with this plan"}), 409
+        return jsonify({"message": "the subscription was changed by another request"}), 409
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({"message": "the subscription was changed by another request"}), 409
 
 
 
@@ -169,6 +172,45 @@ def upgrade_subcription():
 
 
 
+@api.route('/subscription/<uuid:subscription_id>/upgrades', methods=['GET'])
+@jwt_required()
+@read_only()
+def get_subscription_upgrades(subscription_id):
+
+    max_hops_limit = current_app.config['SUBSCRIPTION_UPGRADE_MAX_HOPS']
+    max_hops = request.args.get('max_hops', 1, type=int)
+    if max_hops < 1 or max_hops > max_hops_limit:
+        return jsonify({"message": f"max_hops must be between 1 and {max_hops_limit}"}), 400
+
+    current_user_id = get_jwt_identity()
+
+    subscription = Subscription.find_by_params(id = str(subscription_id), user_id=current_user_id , status = 'active')
+    if not subscription:
+        return jsonify({"message": "the subscription was not found"}), 404
+
+    # the same checks as upgrade_subcription(), answered with an empty list
+    reason = None
+    if subscription.upgraded_from_subscription_id:
+        reason = "You have already upgraded this subscription"
+    elif subscription.interval == 'one_time':
+        reason = "You cannot upgrade a one-time subscription"
+    elif (subscription.current_period_end.replace(tzinfo=timezone.utc) - datetime.now(timezone.utc)).days <= 0:
+        reason = "You cannot upgrade a subscription that has already ended"
+    if reason:
+        return jsonify({"message": reason, "upgrades": []}), 200
+
+    result = []
+    for option in upgrade_graph().eligible(subscription, max_hops=max_hops):
+        result.append({
+            "plan": option.plan._asdict(),
+            "interval": option.interval._asdict(),
+            "price": option.price._asdict(),
+            "path": list(option.path),
+        })
+
+    return jsonify({"message": "Successfully retrieved upgrades", "upgrades": result}), 200
+
+
 class CancelSubscriptionSchema(Schema):
     subscription_id = fields.UUID(required=True)
 
@@ -176,7 +218,7 @@ class CancelSubscriptionSchema(Schema):
 @jwt_required()
 def cancel_sbscription():
 
-    schema = CancelSubscriptionSchema()
+    schema = validator(CancelSubscriptionSchema)
 
     try:
         data = schema.load(request.json)
@@ -191,30 +233,180 @@ def cancel_sbscription():
 
 
     existing_subscription.canceled_at = datetime.now(timezone.utc)
-    existing_subscription.save_to_db()
+    try:
+        existing_subscription.save_to_db()
+    except StaleDataError:
+        db.session.rollback()
+        return jsonify({"message": "the subscription was changed by another request"}), 409
 
     return jsonify({"message": "Successfully canceled subscription", "subscription":existing_subscription.to_dict()} ), 200
 
 
+class ListSubscriptionSchema(Schema):
+    class Meta:
+        unknown = EXCLUDE
+
+    status = fields.Str()
+    plan_id = fields.UUID()
+    limit = fields.Int()
+    cursor = fields.Str()
+
+    @pre_load
+    def drop_empty(self, data, **kwargs):
+        return {key: value for key, value in data.items() if value}
+
+
+def load_subscription_page(args, config):
+    """Parses a subscription listing query string into `(filters, limit, after)`.
+    Raises ValidationError with the 400 response body when it is not valid."""
+    data = validator(ListSubscriptionSchema).load(args)
+
+    filters = {}
+    if 'status' in data:
+        filters['status'] = data['status']
+    if 'plan_id' in data:
+        filters['plan_id'] = str(data['plan_id'])
+
+    limit = data.get('limit', config['SUBSCRIPTION_PAGE_SIZE'])
+    if limit < 1 or limit > config['SUBSCRIPTION_MAX_PAGE_SIZE']:
+        raise ValidationError({"message": f"limit must be between 1 and {config['SUBSCRIPTION_MAX_PAGE_SIZE']}"})
+
+    after = None
+    if 'cursor' in data:
+        try:
+            after = decode_cursor(data['cursor'])
+        except InvalidCursor:
+            raise ValidationError({"message": "the cursor is not valid"})
+
+    return filters, limit, after
+
+
+def subscription_page_payload(subscriptions, limit):
+    """The listing response for a page fetched with `limit + 1` rows."""
+    next_cursor = None
+    if len(subscriptions) > limit:
+        subscriptions = subscriptions[:limit]
+        last = subscriptions[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    result = [subscription.to_dict() for subscription in subscriptions]
+
+    return {"message": "Successfully retrieved subscription", "subscriptions":result, "next_cursor": next_cursor}
+
+
 @api.route('/subscription', methods=['GET'])
 @jwt_required()
+@read_only()
 def get_subscriptions():
 
 
     current_user_id = get_jwt_identity()
 
-    filter = {'user_id': current_user_id}
+    try:
+        filters, limit, after = load_subscription_page(request.args, current_app.config)
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+
+    subscriptions = Subscription.find_page_by_params(limit + 1, after=after, user_id=current_user_id, **filters)
 
-    if request.args.get('status'):
-        filter['status'] = request.args.get('status')
-    if request.args.get('plan_id'):
-        filter['plan_id'] = request.args.get('plan_id')
+    return jsonify(subscription_page_payload(subscriptions, limit)), 200
 
-    subscriptions = Subscription.find_all_by_params( **filter)
 
-    result = []
+class ExportSubscriptionSchema(Schema):
+    since = fields.AwareDateTime(default_timezone=timezone.utc)
+    status = fields.Str(validate=validate.OneOf(['active', 'cancelled', 'ended']))
+    plan_id = fields.UUID()
+    after = fields.UUID()
 
-    for subscription in subscriptions:
-        result.append(subscription.to_dict())
+@api.route('/subscription/export', methods=['GET'])
+@admin_required()
+@read_only()
+def export_subscriptions():
+    schema = validator(ExportSubscriptionSchema)
+
+    try:
+        data = schema.load(request.args)
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+
+    batch_size = current_app.config['SUBSCRIPTION_EXPORT_BATCH_SIZE']
+    subscriptions = Subscription.stream_for_export(batch_size, **data)
+    dumps = current_app.json.dumps
+
+    def generate():
+        # one chunk per batch: a client that drops the connection resumes
+        # with ?after=<id of the last line it received>
+        lines = []
+        for subscription in subscriptions:
+            lines.append(dumps(subscription.to_dict()))
+            if len(lines) == batch_size:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+    return current_app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson'), 200
+
+
+class ProrationImpactSchema(Schema):
+    plan_id = fields.UUID()
+    price_id = fields.UUID()
+    new_price_id = fields.UUID()
+    amount = fields.Int(validate=validate.Range(min=0, error="Amount cannot be negative"))
+
+    @validates_schema
+    def validate_selection(self, data, **kwargs):
+        if 'plan_id' not in data and 'price_id' not in data:
+            raise ValidationError("plan_id or price_id is required", "plan_id")
+        if ('new_price_id' in data) == ('amount' in data):
+            raise ValidationError("exactly one of new_price_id and amount is required", "new_price_id")
+
+@api.route('/subscription/proration-impact', methods=['GET'])
+@admin_required()
+@read_only()
+def get_proration_impact():
+    schema = validator(ProrationImpactSchema)
+
+    try:
+        data = schema.load(request.args)
+    except ValidationError as err:
+        return jsonify(err.messages), 400
+
+    new_amount, interval = data.get('amount'), None
+    if 'new_price_id' in data:
+        res = resolve_price(data['new_price_id'])
+        if not res:
+            return jsonify({"message": "the price id was not found"}), 404
+        _, new_interval, new_price = res
+        new_amount, interval = new_price.amount, new_interval.interval
+
+    impact = price_change_impact(
+        new_amount,
+        plan_id=str(data['plan_id']) if 'plan_id' in data else None,
+        price_id=str(data['price_id']) if 'price_id' in data else None,
+        interval=interval,
+        chunk_size=current_app.config['PRORATION_CHUNK_SIZE'],
+    )
+    return jsonify({"message": "Successfully computed proration impact", "impact": impact}), 200
+
+
+class SubscriptionCountersSchema(Schema):
+    day = fields.Date()
+
+@api.route('/subscription/counters', methods=['GET'])
+@admin_required()
+@read_only()
+def get_subscription_counters():
+    schema = validator(SubscriptionCountersSchema)
+
+    try:
+        data = schema.load(request.args)
+    except ValidationError as err:
+        return jsonify(err.messages), 400
 
-    return jsonify({"message": "Successfully retrieved subscription", "subscriptions":result} ), 200
+    day = data.get('day') or datetime.now(timezone.utc).date()
+    return jsonify({
+        "message": "Successfully retrieved subscription counters",
+        "day": day.isoformat(),
+        "plans": subscription_counts(day),
+    }), 200
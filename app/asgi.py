@@ -0,0 +1,200 @@
+"""Read-only ASGI front for `GET /api/v1/plan` and `GET /api/v1/subscription`,
+served from SQLAlchemy's asyncio engine.
+
+The Flask app is still built, for its config, JWT settings and JSON
+provider, and both fronts share the models, statements, schemas and
+payload builders, so a response is byte for byte the same whichever one
+served it. Every other route only exists on the WSGI app.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from jwt.exceptions import ExpiredSignatureError, PyJWTError
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from marshmallow import ValidationError
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.routing import Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from . import create_app
+from .api.subscription import load_subscription_page, subscription_page_payload
+from .cache import LRUCache
+from .catalog import CATALOG_VERSION_NAME
+from .models import CatalogVersion, Subscription
+from .plan_catalog import (
+    plan_catalog_payload, plan_catalog_statement, stored_plan_catalog, stored_plan_catalog_statement,
+)
+from .pool import async_engine_options
+from .serialization import best_mimetype
+
+ASYNC_DRIVERS = {'mysql': 'aiomysql', 'sqlite': 'aiosqlite'}
+
+
+def async_database_url(url):
+    """`url` with its driver swapped for the asyncio one of the same backend."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"no asyncio driver is configured for {backend!r} databases")
+    return url.set(drivername=f'{backend}+{ASYNC_DRIVERS[backend]}')
+
+
+class CatalogCache:
+    """Encoded plan catalog bodies tagged with the catalog version, which is
+    re-read at most every `check_interval` seconds. Concurrent misses for
+    the same key share one build."""
+
+    def __init__(self, sessions, check_interval, max_entries):
+        self._sessions = sessions
+        self._check_interval = check_interval
+        self._version = None
+        self._checked_at = None
+        self._entries = LRUCache(max_entries)
+        self._builds = {}
+
+    async def version(self):
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self._check_interval:
+            # the other requests keep the last version while this one re-reads it
+            checked_at, self._checked_at = self._checked_at, now
+            try:
+                async with self._sessions() as session:
+                    version = await session.scalar(
+                        select(CatalogVersion.version).where(CatalogVersion.name == CATALOG_VERSION_NAME)
+                    )
+            except BaseException:
+                self._checked_at = checked_at
+                raise
+            self._version = version or 0
+        return self._version
+
+    async def get(self, key, builder):
+        key = (key, await self.version())
+        value = self._entries.get(key)
+        if value is not None:
+            return value
+
+        build = self._builds.get(key)
+        if build is None:
+            build = self._builds[key] = asyncio.ensure_future(builder())
+            build.add_done_callback(lambda done: self._finish(key, done))
+        # a client going away must not cancel the build the others wait on
+        return await asyncio.shield(build)
+
+    def _finish(self, key, build):
+        del self._builds[key]
+        if not build.cancelled() and build.exception() is None:
+            self._entries.set(key, build.result())
+
+
+def _accept(request):
+    return parse_accept_header(request.headers.get('accept'), MIMEAccept)
+
+
+def respond(request, payload, status=200):
+    mimetype = best_mimetype(_accept(request))
+    body = request.app.state.flask_app.json.encode(payload, mimetype)
+    return Response(body, status_code=status, media_type=mimetype, headers={'Vary': 'Accept'})
+
+
+async def authenticate(request):
+    """The identity of a valid access token, or the error response Flask-JWT-Extended
+    would have sent. The revocation filter is built at startup, and a filter
+    hit is looked up in a thread, as it queries the sync engine."""
+    flask_app = request.app.state.flask_app
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme != 'Bearer' or not token:
+        return None, respond(request, {"msg": "Missing Authorization Header"}, 401)
+    try:
+        with flask_app.app_context():
+            decoded = decode_token(token)
+    except ExpiredSignatureError:
+        return None, respond(request, {"msg": "Token has expired"}, 401)
+    except (PyJWTError, JWTExtendedException) as e:
+        return None, respond(request, {"msg": str(e)}, 422)
+    if decoded.get('type') != 'access':
+        return None, respond(request, {"msg": "Only non-refresh tokens are allowed"}, 422)
+    revocations = flask_app.extensions['token_revocations']
+    candidate = revocations.candidate(decoded)
+    if candidate is not None and await run_in_threadpool(revocations.lookup, *candidate):
+        return None, respond(request, {"msg": "Token has been revoked"}, 401)
+    return decoded[flask_app.config['JWT_IDENTITY_CLAIM']], None
+
+
+async def get_plans(request):
+    _, error = await authenticate(request)
+    if error is not None:
+        return error
+
+    state = request.app.state
+    currency = request.query_params.get('currency')
+    if currency is not None:
+        currency = currency.upper()
+    mimetype = best_mimetype(_accept(request))
+
+    async def build():
+        encoder = state.flask_app.json
+        async with state.sessions() as session:
+            stored = (await session.execute(stored_plan_catalog_statement(currency))).all()
+            document = stored_plan_catalog(currency, stored, encoder)
+            if document is None:
+                rows = (await session.execute(plan_catalog_statement(currency))).all()
+                document = encoder.encode_document(plan_catalog_payload(rows))
+        return encoder.encode_stored(document, mimetype)
+
+    body = await state.plan_catalog.get((currency, mimetype), build)
+    return Response(body, media_type=mimetype, headers={'Vary': 'Accept'})
+
+
+async def get_subscriptions(request):
+    current_user_id, error = await authenticate(request)
+    if error is not None:
+        return error
+
+    state = request.app.state
+    try:
+        filters, limit, after = load_subscription_page(request.query_params, state.flask_app.config)
+    except ValidationError as err:
+        return respond(request, err.messages, 400)
+
+    async with state.sessions() as session:
+        subscriptions = (await session.scalars(
+            Subscription.page_statement(limit + 1, after, user_id=current_user_id, **filters)
+        )).all()
+
+    return respond(request, subscription_page_payload(subscriptions, limit))
+
+
+def create_asgi_app(config_name='development', flask_app=None):
+    flask_app = flask_app or create_app(config_name)
+    config = flask_app.config
+    url = config['SQLALCHEMY_DATABASE_URI']
+    engine = create_async_engine(async_database_url(url), **async_engine_options(config, url))
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await run_in_threadpool(flask_app.extensions['token_revocations'].rebuild)
+        yield
+        await engine.dispose()
+
+    app = Starlette(
+        routes=[
+            Route('/api/v1/plan', get_plans, methods=['GET']),
+            Route('/api/v1/subscription', get_subscriptions, methods=['GET']),
+        ],
+        lifespan=lifespan,
+    )
+    app.state.flask_app = flask_app
+    app.state.engine = engine
+    app.state.sessions = sessions
+    app.state.plan_catalog = CatalogCache(
+        sessions, config['CATALOG_VERSION_CHECK_INTERVAL'], config['PLAN_CATALOG_CACHE_MAX_ENTRIES']
+    )
+    return app
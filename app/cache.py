@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into a single execution.
+
+    The first caller for a key runs the function, every caller that arrives
+    while it is running waits for and shares its result (or its exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+
+class VersionedCache:
+    """Bounded LRU cache whose entries are tagged with a version.
+
+    An entry is only served while its version matches the one returned by
+    `version_getter` and, when `ttl` is set, for at most `ttl` seconds. A miss
+    (or a stale entry) is rebuilt once, however many callers are waiting for it.
+    """
+
+    def __init__(self, version_getter, max_entries=64, ttl=None):
+        self._version_getter = version_getter
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def get(self, key, builder):
+        version = self._version_getter()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and (entry[1] is None or entry[1] > time.monotonic()):
+                self._entries.move_to_end(key)
+                return entry[2]
+
+        return self._flight.do((key, version), lambda: self._build(key, version, builder))
+
+    def _build(self, key, version, builder):
+        value = builder()
+        expires_at = time.monotonic() + self._ttl if self._ttl else None
+        with self._lock:
+            self._entries[key] = (version, expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LRUCache:
+    """Bounded, thread-safe LRU map whose entries expire after `ttl` seconds."""
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if entry[0] is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """Stores `value` for the cache's ttl, or for `ttl` seconds when that
+        is shorter."""
+        if self._ttl and (ttl is None or ttl > self._ttl):
+            ttl = self._ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class VersionTracker:
+    """Remembers the last version read from the database for a short while,
+    so hot paths do not pay for a version lookup on every call."""
+
+    def __init__(self, loader, check_interval):
+        self._loader = loader
+        self._check_interval = check_interval
+        self._version = None
+        self._checked_at = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def current(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self._check_interval:
+                return self._version
+            generation = self._generation
+
+        version = self._loader()
+        with self._lock:
+            # a local write landed while we were loading, keep re-checking
+            if generation == self._generation:
+                self._version = version
+                self._checked_at = now
+        return version
+
+    def mark_stale(self):
+        with self._lock:
+            self._generation += 1
+            self._checked_at = None
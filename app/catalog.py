@@ -0,0 +1,129 @@
+from collections import namedtuple
+from flask import current_app, has_app_context
+from sqlalchemy import event, select, update, insert
+from . import db
+from .cache import VersionedCache, VersionTracker
+from .models import CatalogVersion, Plan, PlanInterval, PlanIntervalPrice, PlanUpgrade
+from .replicas import on_primary
+
+
+CATALOG_VERSION_NAME = 'plans'
+CATALOG_MODELS = (Plan, PlanInterval, PlanIntervalPrice, PlanUpgrade)
+
+PlanSnapshot = namedtuple('PlanSnapshot', ['id', 'name', 'description'])
+IntervalSnapshot = namedtuple('IntervalSnapshot', ['id', 'plan_id', 'interval', 'interval_count'])
+PriceSnapshot = namedtuple('PriceSnapshot', ['id', 'interval_id', 'currency', 'amount'])
+
+
+@on_primary
+def load_catalog_version():
+    version = db.session.execute(
+        select(CatalogVersion.version).where(CatalogVersion.name == CATALOG_VERSION_NAME)
+    ).scalar()
+    return version or 0
+
+
+def bump_catalog_version(connection):
+    """Increments the catalog version inside the caller's transaction so the
+    bump only becomes visible to other workers together with the change."""
+    table = CatalogVersion.__table__
+    result = connection.execute(
+        update(table)
+        .where(table.c.name == CATALOG_VERSION_NAME)
+        .values(version=table.c.version + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(name=CATALOG_VERSION_NAME, version=1))
+
+
+def mark_catalog_changed(session):
+    """Bumps the catalog version once per transaction. Called automatically
+    on flush, and explicitly by writes that bypass the unit of work."""
+    if not session.info.get('catalog_changed'):
+        bump_catalog_version(session.connection())
+        session.info['catalog_changed'] = True
+
+
+def catalog_version():
+    return current_app.extensions['catalog_version'].current()
+
+
+def plan_catalog_cache():
+    return current_app.extensions['plan_catalog_cache']
+
+
+@on_primary
+def load_price(price_id):
+    res = (
+            db.session.query(
+                PlanInterval,
+                PlanIntervalPrice,
+                Plan,
+            )
+            .join(PlanIntervalPrice, PlanInterval.id == PlanIntervalPrice.interval_id)
+            .join(Plan, Plan.id == PlanInterval.plan_id)
+            .filter(PlanInterval.is_active == True)
+            .filter(PlanIntervalPrice.is_active == True)
+            .filter(Plan.is_active == True)
+            .filter(PlanIntervalPrice.id == price_id)
+        ).first()
+    if not res:
+        return None
+
+    interval, price, plan = res
+    return (
+        PlanSnapshot(plan.id, plan.name, plan.description),
+        IntervalSnapshot(interval.id, interval.plan_id, interval.interval, interval.interval_count),
+        PriceSnapshot(price.id, price.interval_id, price.currency, price.amount),
+    )
+
+
+def resolve_price(price_id):
+    """Returns an immutable `(plan, interval, price)` snapshot for an active
+    price, or None when the price, its interval or its plan is not active."""
+    price_id = str(price_id)
+    return current_app.extensions['price_resolver_cache'].get(price_id, lambda: load_price(price_id))
+
+
+def init_app(app):
+    app.extensions['catalog_version'] = VersionTracker(
+        load_catalog_version, app.config['CATALOG_VERSION_CHECK_INTERVAL']
+    )
+    app.extensions['plan_catalog_cache'] = VersionedCache(
+        catalog_version, max_entries=app.config['PLAN_CATALOG_CACHE_MAX_ENTRIES']
+    )
+    app.extensions['price_resolver_cache'] = VersionedCache(
+        catalog_version,
+        max_entries=app.config['PRICE_RESOLVER_CACHE_MAX_ENTRIES'],
+        ttl=app.config['PRICE_RESOLVER_CACHE_TTL'],
+    )
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_on_catalog_change(session, flush_context):
+    if session.info.get('catalog_changed'):
+        return
+    touched = session.new | session.dirty | session.deleted
+    if any(isinstance(obj, CATALOG_MODELS) for obj in touched):
+        mark_catalog_changed(session)
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _bump_on_bulk_catalog_change(orm_execute_state):
+    # query.update() / query.delete() skip the flush, catch them here
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, CATALOG_MODELS):
+        mark_catalog_changed(orm_execute_state.session)
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_after_commit(session):
+    if session.info.pop('catalog_changed', False) and has_app_context():
+        current_app.extensions['catalog_version'].mark_stale()
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _reset_after_rollback(session, previous_transaction):
+    session.info.pop('catalog_changed', None)
@@ -0,0 +1,188 @@
+import csv
+import json
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from .lifecycle import sweep_due_subscriptions
+from .idempotency import purge_expired_keys
+from . import db
+from .catalog import mark_catalog_changed, resolve_price
+from .counters import reconcile_subscription_counters
+from .plan_catalog import refresh_plan_catalog
+from .proration import price_change_impact
+from .revenue import backfill_revenue, roll_up_revenue
+from .models import User
+from .revocation import purge_expired_revocations, revoke_user
+
+
+subscriptions_cli = AppGroup('subscriptions', help='Subscription maintenance commands.')
+users_cli = AppGroup('users', help='User administration commands.')
+idempotency_cli = AppGroup('idempotency', help='Idempotency key maintenance commands.')
+catalog_cli = AppGroup('catalog', help='Plan catalog maintenance commands.')
+revenue_cli = AppGroup('revenue', help='Recurring revenue rollup commands.')
+
+
+@subscriptions_cli.command('sweep')
+@click.option('--chunk-size', type=int, default=None, help='Rows transitioned per transaction.')
+@click.option('--pause', type=float, default=None, help='Seconds to sleep between chunks.')
+@click.option('--restart', is_flag=True, help='Ignore the saved checkpoint and scan from the start.')
+@click.option('--watch', type=float, default=None, help='Keep running, sweeping again every N seconds.')
+def sweep(chunk_size, pause, restart, watch):
+    """End or finalize cancellation of subscriptions whose period is over."""
+    chunk_size = chunk_size or current_app.config['SWEEPER_CHUNK_SIZE']
+    pause = current_app.config['SWEEPER_PAUSE'] if pause is None else pause
+
+    def report(total, rate):
+        click.echo(f"swept {total} subscriptions ({rate:.0f} rows/s)")
+
+    while True:
+        stats = sweep_due_subscriptions(chunk_size=chunk_size, pause=pause, resume=not restart, report=report)
+        click.echo(f"done: {stats['swept']} subscriptions in {stats['seconds']:.2f}s ({stats['rows_per_second']:.0f} rows/s)")
+        if watch is None:
+            break
+        restart = False
+        time.sleep(watch)
+
+
+@subscriptions_cli.command('proration-impact')
+@click.option('--plan', 'plan_id', help='Prorate the active subscriptions of this plan.')
+@click.option('--price', 'price_id', help='Prorate the active subscriptions of this price.')
+@click.option('--to-price', 'new_price_id', help='Move them to this active price.')
+@click.option('--amount', type=click.IntRange(min=0), help='Move them to this amount, in minor units, on any interval.')
+@click.option('--chunk-size', type=int, default=None, help='Subscriptions loaded and computed at a time.')
+@click.option('--output', type=click.File('w'), default=None, help='Also write one CSV line per subscription.')
+def proration_impact(plan_id, price_id, new_price_id, amount, chunk_size, output):
+    """What moving every active subscriber of a plan or price to another price would charge today."""
+    if not plan_id and not price_id:
+        raise click.UsageError("--plan or --price is required")
+    if (new_price_id is None) == (amount is None):
+        raise click.UsageError("exactly one of --to-price and --amount is required")
+
+    interval = None
+    if new_price_id:
+        res = resolve_price(new_price_id)
+        if not res:
+            raise click.ClickException(f"no active price {new_price_id}")
+        _, new_interval, new_price = res
+        amount, interval = new_price.amount, new_interval.interval
+
+    on_chunk = None
+    if output:
+        writer = csv.writer(output)
+        writer.writerow(['subscription_id', 'amount_paid', 'eligible', 'credit', 'charge'])
+
+        def on_chunk(chunk):
+            writer.writerows(zip(chunk.ids, chunk.amount_paid.tolist(), chunk.eligible.tolist(), chunk.credit.tolist(), chunk.charge.tolist()))
+
+    started = time.perf_counter()
+    impact = price_change_impact(
+        amount, plan_id=plan_id, price_id=price_id, interval=interval,
+        chunk_size=chunk_size or current_app.config['PRORATION_CHUNK_SIZE'], on_chunk=on_chunk,
+    )
+    impact['seconds'] = round(time.perf_counter() - started, 3)
+    click.echo(json.dumps(impact, indent=2))
+
+
+@subscriptions_cli.command('reconcile-counters')
+@click.option('--fix', is_flag=True, help='Correct the counters that drifted.')
+def reconcile_counters(fix):
+    """Recompute the subscription counters from the subscriptions table and
+    report drift. Also fills the counters in after their migration."""
+    started = time.perf_counter()
+    report = reconcile_subscription_counters(fix=fix)
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    click.echo(json.dumps(report, indent=2))
+
+
+@users_cli.command('set-admin')
+@click.argument('email')
+@click.option('--revoke', is_flag=True, help='Remove admin rights instead of granting them.')
+def set_admin(email, revoke):
+    """Grant or revoke admin rights. Granting applies from the user's next
+    login; revoking also logs the user out everywhere."""
+    user = User.find_by_email(email.strip().lower())
+    if not user:
+        raise click.ClickException(f"no user with email {email}")
+    user.is_admin = not revoke
+    user.save_to_db()
+    if revoke:
+        revoke_user(user.id)
+    click.echo(f"{user.email} is {'no longer' if revoke else 'now'} an admin")
+
+
+@idempotency_cli.command('purge')
+@click.option('--chunk-size', type=int, default=None, help='Rows deleted per transaction.')
+@click.option('--pause', type=float, default=None, help='Seconds to sleep between chunks.')
+def purge(chunk_size, pause):
+    """Delete expired idempotency keys."""
+    chunk_size = chunk_size or current_app.config['SWEEPER_CHUNK_SIZE']
+    pause = current_app.config['SWEEPER_PAUSE'] if pause is None else pause
+    deleted = purge_expired_keys(chunk_size=chunk_size, pause=pause)
+    click.echo(f"deleted {deleted} expired idempotency keys")
+
+
+@users_cli.command('logout')
+@click.argument('email')
+def logout(email):
+    """Revoke every access token issued to a user so far."""
+    user = User.find_by_email(email.strip().lower())
+    if not user:
+        raise click.ClickException(f"no user with email {email}")
+    revoke_user(user.id)
+    click.echo(f"all sessions of {user.email} logged out")
+
+
+@users_cli.command('purge-revocations')
+def purge_revocations():
+    """Delete token revocations whose tokens have all expired."""
+    deleted = purge_expired_revocations()
+    click.echo(f"deleted {deleted} expired token revocations")
+
+
+@catalog_cli.command('rebuild')
+def rebuild_catalog():
+    """Re-render every stored plan catalog document, e.g. right after the
+    plan_catalog migration."""
+    written = refresh_plan_catalog(db.session)
+    mark_catalog_changed(db.session)
+    db.session.commit()
+    click.echo(f"rebuilt {written} plan catalog documents")
+
+
+@revenue_cli.command('rollup')
+@click.option('--workers', type=int, default=None, help='Processes used when the first run backfills.')
+def rollup(workers):
+    """Update the daily MRR rollup with the subscriptions changed since the last run."""
+    started = time.perf_counter()
+    stats = roll_up_revenue(
+        workers=workers or current_app.config['REVENUE_ROLLUP_WORKERS'],
+        chunk_days=current_app.config['REVENUE_ROLLUP_CHUNK_DAYS'],
+    )
+    click.echo(f"rolled up {stats['days']} days into {stats['rows']} rows in {time.perf_counter() - started:.2f}s")
+
+
+@revenue_cli.command('backfill')
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), required=True, help='First day to recompute.')
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), required=True, help='Day after the last one to recompute.')
+@click.option('--workers', type=int, default=None, help='Processes reading the range in parallel.')
+@click.option('--chunk-days', type=int, default=None, help='Days read by one process at a time.')
+def backfill(start, end, workers, chunk_days):
+    """Recompute the daily MRR rollup of a date range."""
+    if end <= start:
+        raise click.UsageError("--end must be after --start")
+    started = time.perf_counter()
+    stats = backfill_revenue(
+        start.date(), end.date(),
+        workers=workers or current_app.config['REVENUE_ROLLUP_WORKERS'],
+        chunk_days=chunk_days or current_app.config['REVENUE_ROLLUP_CHUNK_DAYS'],
+    )
+    click.echo(f"backfilled {stats['days']} days into {stats['rows']} rows in {time.perf_counter() - started:.2f}s")
+
+
+def init_app(app):
+    app.cli.add_command(subscriptions_cli)
+    app.cli.add_command(users_cli)
+    app.cli.add_command(idempotency_cli)
+    app.cli.add_command(catalog_cli)
+    app.cli.add_command(revenue_cli)
@@ -0,0 +1,244 @@
+"""Subscription counts per plan, status and day, maintained in the
+subscription_counters table by the transactions that change subscriptions.
+
+Rows dated `ALL_TIME` hold how many subscriptions of a plan are currently in
+each status. Rows dated any other day hold what happened that day: `active`
+counts subscriptions started, `cancelled` cancellations requested and
+`ended` subscriptions that ended (upgraded or lapsed, not cancelled).
+
+Changes made through the unit of work are counted by flush hooks and
+written just before the transaction commits, each `(plan_id, status, day)`
+to one of `SUBSCRIPTION_COUNTER_SHARDS` rows picked at random, so
+concurrent writers on a busy plan rarely wait on the same row. Bulk writes
+that bypass the unit of work (the lifecycle sweeper) count their changes
+with `record_subscription_change()`; any other drift is found and fixed by
+`reconcile_subscription_counters()`.
+"""
+import random
+from collections import Counter, defaultdict, namedtuple
+from datetime import date, datetime, timezone
+from flask import current_app
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects import mysql, sqlite
+from . import db
+from .models import Subscription, SubscriptionCounter
+
+
+ALL_TIME = date(1970, 1, 1)
+STATUSES = ('active', 'cancelled', 'ended')
+
+SubscriptionState = namedtuple('SubscriptionState', ['plan_id', 'status', 'created_at', 'canceled_at', 'ended_at'])
+
+
+def _day(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def counter_keys(state):
+    """The `(plan_id, status, day)` counters a subscription in `state` adds one to."""
+    plan_id = str(state.plan_id)
+    keys = [(plan_id, state.status, ALL_TIME), (plan_id, 'active', _day(state.created_at))]
+    if state.canceled_at is not None:
+        keys.append((plan_id, 'cancelled', _day(state.canceled_at)))
+    if state.status == 'ended' and state.ended_at is not None:
+        keys.append((plan_id, 'ended', _day(state.ended_at)))
+    return keys
+
+
+def record_subscription_change(session, before=None, after=None):
+    """Counts a subscription moving from state `before` to `after` in the
+    session's transaction, None standing for a subscription that does not
+    exist (yet, or any more)."""
+    deltas = session.info.setdefault('subscription_counter_deltas', Counter())
+    if before is not None:
+        deltas.subtract(counter_keys(before))
+    if after is not None:
+        deltas.update(counter_keys(after))
+
+
+def _committed(state, name):
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.added:
+        return None
+    return getattr(state.obj(), name)
+
+
+def _current_state(subscription):
+    return SubscriptionState(
+        subscription.plan_id, subscription.status, subscription.created_at,
+        subscription.canceled_at, subscription.ended_at,
+    )
+
+
+def _committed_state(subscription):
+    state = inspect(subscription)
+    return SubscriptionState(*(_committed(state, name) for name in SubscriptionState._fields))
+
+
+def write_counter_deltas(session, deltas, shards=1):
+    """Adds `deltas`, a `{(plan_id, status, day): delta}` mapping, to the
+    counters with one upsert, each to a random one of `shards` rows."""
+    now = datetime.now(timezone.utc)
+    values = [
+        {"plan_id": plan_id, "status": status, "day": day, "shard": random.randrange(shards),
+         "count": delta, "created_at": now, "updated_at": now}
+        # a fixed order keeps concurrent upserts from deadlocking
+        for (plan_id, status, day), delta in sorted(deltas.items())
+        if delta
+    ]
+    if not values:
+        return 0
+
+    table = SubscriptionCounter.__table__
+    if session.connection().dialect.name == 'mysql':
+        statement = mysql.insert(table)
+        statement = statement.on_duplicate_key_update(
+            count=table.c['count'] + statement.inserted['count'], updated_at=statement.inserted.updated_at,
+        )
+    else:
+        statement = sqlite.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.plan_id, table.c.status, table.c.day, table.c.shard],
+            set_={"count": table.c['count'] + statement.excluded['count'], "updated_at": statement.excluded.updated_at},
+        )
+    session.execute(statement, values)
+    return len(values)
+
+
+def subscription_counts(day=None):
+    """Per plan, how many subscriptions are in each status and what happened
+    on `day` (today, in UTC, by default), read from the counters alone."""
+    day = day or datetime.now(timezone.utc).date()
+    rows = db.session.execute(
+        select(SubscriptionCounter.plan_id, SubscriptionCounter.status, SubscriptionCounter.day, func.sum(SubscriptionCounter.count))
+        .where(SubscriptionCounter.day.in_([ALL_TIME, day]))
+        .group_by(SubscriptionCounter.plan_id, SubscriptionCounter.status, SubscriptionCounter.day)
+    ).all()
+
+    plans = {}
+    for plan_id, status, row_day, count in rows:
+        plan = plans.get(plan_id)
+        if plan is None:
+            plan = plans[plan_id] = {
+                "plan_id": plan_id,
+                "subscriptions": dict.fromkeys(STATUSES, 0),
+                "day": {"started": 0, "cancelled": 0, "ended": 0},
+            }
+        if row_day == ALL_TIME:
+            plan["subscriptions"][status] = int(count)
+        else:
+            plan["day"]["started" if status == 'active' else status] = int(count)
+    return [plans[plan_id] for plan_id in sorted(plans)]
+
+
+def _as_date(value):
+    # func.date() gives a date on MySQL and a string on SQLite
+    return value if isinstance(value, date) else date.fromisoformat(str(value))
+
+
+def expected_counters(session):
+    """The counters recomputed from the subscriptions table, as a Counter."""
+    expected = Counter()
+    for plan_id, status, count in session.execute(
+        select(Subscription.plan_id, Subscription.status, func.count()).group_by(Subscription.plan_id, Subscription.status)
+    ):
+        expected[(str(plan_id), status, ALL_TIME)] += count
+
+    daily = (
+        ('active', Subscription.created_at, None),
+        ('cancelled', Subscription.canceled_at, Subscription.canceled_at.is_not(None)),
+        ('ended', Subscription.ended_at, (Subscription.status == 'ended') & Subscription.ended_at.is_not(None)),
+    )
+    for status, column, condition in daily:
+        day = func.date(column)
+        statement = select(Subscription.plan_id, day, func.count()).group_by(Subscription.plan_id, day)
+        if condition is not None:
+            statement = statement.where(condition)
+        for plan_id, value, count in session.execute(statement):
+            expected[(str(plan_id), status, _as_date(value))] += count
+    return expected
+
+
+def stored_counters(session):
+    counted = Counter()
+    for plan_id, status, day, count in session.execute(
+        select(SubscriptionCounter.plan_id, SubscriptionCounter.status, SubscriptionCounter.day, func.sum(SubscriptionCounter.count))
+        .group_by(SubscriptionCounter.plan_id, SubscriptionCounter.status, SubscriptionCounter.day)
+    ):
+        counted[(str(plan_id), status, day)] += int(count)
+    return counted
+
+
+def reconcile_subscription_counters(fix=False):
+    """Recomputes every counter from the subscriptions table and reports the
+    ones that drifted. With `fix`, the difference is added to them in the
+    same transaction, which leaves changes committed meanwhile counted."""
+    session = db.session
+    expected = expected_counters(session)
+    counted = stored_counters(session)
+
+    drift = []
+    corrections = {}
+    for key in sorted(expected.keys() | counted.keys()):
+        if expected[key] != counted[key]:
+            plan_id, status, day = key
+            drift.append({
+                "plan_id": plan_id, "status": status, "day": None if day == ALL_TIME else day.isoformat(),
+                "expected": expected[key], "counted": counted[key],
+            })
+            corrections[key] = expected[key] - counted[key]
+
+    if fix and corrections:
+        write_counter_deltas(session, corrections)
+        session.commit()
+    else:
+        session.rollback()
+    return {"counters": len(expected), "drifted": len(drift), "fixed": bool(fix and drift), "drift": drift}
+
+
+@event.listens_for(db.session, 'after_flush')
+def _count_flushed_subscriptions(session, flush_context):
+    for obj in session.new:
+        if isinstance(obj, Subscription):
+            record_subscription_change(session, after=_current_state(obj))
+    for obj in session.dirty:
+        if isinstance(obj, Subscription) and session.is_modified(obj, include_collections=False):
+            record_subscription_change(session, before=_committed_state(obj), after=_current_state(obj))
+    for obj in session.deleted:
+        if isinstance(obj, Subscription):
+            record_subscription_change(session, before=_committed_state(obj))
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _count_bulk_inserted_subscriptions(orm_execute_state):
+    # insert(Subscription) executed with a list of rows; bulk updates and
+    # deletes are left to their callers and reconciliation
+    mapper = orm_execute_state.bind_mapper
+    if not orm_execute_state.is_insert or mapper is None or not issubclass(mapper.class_, Subscription):
+        return
+    parameters = orm_execute_state.parameters
+    if isinstance(parameters, dict):
+        parameters = [parameters]
+    now = datetime.now(timezone.utc)
+    for row in parameters or ():
+        if 'plan_id' in row and 'status' in row:
+            record_subscription_change(orm_execute_state.session, after=SubscriptionState(
+                row['plan_id'], row['status'], row.get('created_at') or now, row.get('canceled_at'), row.get('ended_at'),
+            ))
+
+
+@event.listens_for(db.session, 'before_commit')
+def _write_before_commit(session):
+    session.flush()
+    deltas = session.info.pop('subscription_counter_deltas', None)
+    if deltas:
+        write_counter_deltas(session, deltas, current_app.config['SUBSCRIPTION_COUNTER_SHARDS'])
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _reset_after_rollback(session, previous_transaction):
+    session.info.pop('subscription_counter_deltas', None)
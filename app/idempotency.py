@@ -0,0 +1,192 @@
+import hashlib
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from flask import current_app, jsonify, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .cache import LRUCache
+from .models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+StoredResponse = namedtuple('StoredResponse', ['request_hash', 'status_code', 'body', 'mimetype', 'expires_at'])
+
+
+def _request_hash():
+    digest = hashlib.sha256()
+    digest.update(f'{request.method} {request.path}\n'.encode())
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def _expires_at(now):
+    return now + timedelta(seconds=current_app.config['IDEMPOTENCY_KEY_TTL'])
+
+
+def _key_filter(user_id, key):
+    return and_(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+
+
+def load_response(user_id, key, now):
+    """The stored response for a key that finished and has not expired."""
+    row = db.session.execute(
+        select(
+            IdempotencyKey.request_hash,
+            IdempotencyKey.status_code,
+            IdempotencyKey.response_body,
+            IdempotencyKey.response_mimetype,
+            IdempotencyKey.expires_at,
+        )
+        .where(_key_filter(user_id, key))
+        .where(IdempotencyKey.status_code.is_not(None))
+        .where(IdempotencyKey.expires_at > now)
+    ).first()
+    if row is None:
+        return None
+    expires_at = row.expires_at if row.expires_at.tzinfo else row.expires_at.replace(tzinfo=timezone.utc)
+    return StoredResponse(row.request_hash, row.status_code, bytes(row.response_body), row.response_mimetype, expires_at)
+
+
+def claim(user_id, key, request_hash, now):
+    """Inserts an in-progress row for the key, first clearing it if it expired
+    or was left in progress by a request that died. Returns False when
+    another request holds the key."""
+    config = current_app.config
+    stale_claim = now - timedelta(seconds=config['IDEMPOTENCY_LOCK_TIMEOUT'])
+    db.session.execute(
+        delete(IdempotencyKey)
+        .where(_key_filter(user_id, key))
+        .where(or_(
+            IdempotencyKey.expires_at <= now,
+            and_(IdempotencyKey.status_code.is_(None), IdempotencyKey.created_at < stale_claim),
+        ))
+    )
+    try:
+        db.session.execute(insert(IdempotencyKey).values(
+            user_id=user_id,
+            key=key,
+            request_hash=request_hash,
+            expires_at=_expires_at(now),
+        ))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+
+def release(user_id, key):
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(_key_filter(user_id, key)))
+    db.session.commit()
+
+
+def store(user_id, key, stored):
+    db.session.execute(
+        update(IdempotencyKey)
+        .where(_key_filter(user_id, key))
+        .values(status_code=stored.status_code, response_body=stored.body, response_mimetype=stored.mimetype)
+    )
+    db.session.commit()
+
+
+def _remember(cache, user_id, key, stored, now):
+    """Caches `stored` until the row expires, so no worker replays a
+    response the table no longer has."""
+    cache.set((user_id, key), stored, ttl=(stored.expires_at - now).total_seconds())
+
+
+def _replay(stored, request_hash):
+    if stored.request_hash != request_hash:
+        return jsonify({"message": "this Idempotency-Key was already used for a different request"}), 422
+    response = current_app.response_class(stored.body, status=stored.status_code, mimetype=stored.mimetype)
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent():
+    """Makes a JWT-protected view replay its first response for requests that
+    repeat an `Idempotency-Key` header, without running the view again.
+
+    Keys are scoped to the user, remembered for IDEMPOTENCY_KEY_TTL seconds
+    and tied to the method, path and body they were first used with. Server
+    errors are not stored, so those requests can be retried with the same key.
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if key is None:
+                return fn(*args, **kwargs)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                return jsonify({"message": f"{IDEMPOTENCY_HEADER} must be between 1 and {MAX_KEY_LENGTH} characters"}), 400
+
+            user_id = get_jwt_identity()
+            request_hash = _request_hash()
+            now = datetime.now(timezone.utc)
+            cache = current_app.extensions['idempotency_cache']
+
+            stored = cache.get((user_id, key))
+            if stored is None or stored.expires_at <= now:
+                stored = load_response(user_id, key, now)
+                if stored is not None:
+                    _remember(cache, user_id, key, stored, now)
+            if stored is not None:
+                return _replay(stored, request_hash)
+
+            if not claim(user_id, key, request_hash, now):
+                return jsonify({"message": "a request with this Idempotency-Key is still being processed"}), 409, {"Retry-After": "1"}
+
+            try:
+                response = current_app.make_response(fn(*args, **kwargs))
+            except Exception:
+                release(user_id, key)
+                raise
+
+            if response.status_code >= 500:
+                release(user_id, key)
+                return response
+
+            stored = StoredResponse(request_hash, response.status_code, response.get_data(), response.mimetype, _expires_at(now))
+            store(user_id, key, stored)
+            _remember(cache, user_id, key, stored, now)
+            return response
+        return decorator
+    return wrapper
+
+
+def purge_expired_keys(now=None, chunk_size=1000, pause=0):
+    """Deletes expired keys oldest first, about `chunk_size` rows per
+    transaction, walking idx_expires_at. Returns the number of rows deleted."""
+    now = now or datetime.now(timezone.utc)
+    total = 0
+    while True:
+        boundary = db.session.execute(
+            select(IdempotencyKey.expires_at)
+            .where(IdempotencyKey.expires_at <= now)
+            .order_by(IdempotencyKey.expires_at)
+            .offset(chunk_size - 1)
+            .limit(1)
+        ).scalar()
+        result = db.session.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.expires_at <= (boundary or now))
+        )
+        db.session.commit()
+        total += result.rowcount
+        if boundary is None:
+            return total
+        if pause:
+            time.sleep(pause)
+
+
+def init_app(app):
+    app.extensions['idempotency_cache'] = LRUCache(
+        max_entries=app.config['IDEMPOTENCY_CACHE_MAX_ENTRIES'], ttl=app.config['IDEMPOTENCY_KEY_TTL']
+    )
@@ -0,0 +1,104 @@
+import json
+import logging
+import time
+from collections import Counter
+from flask import current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+sql_logger = logging.getLogger('app.sql')
+slow_query_logger = logging.getLogger('app.sql.slow')
+
+
+class RequestSQLStats:
+    __slots__ = ('count', 'seconds', 'statements', 'started')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+        self.started = time.perf_counter()
+
+
+def _parameter_shape(parameters):
+    # types only: bound values may be personal data
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return [f'{len(parameters)} rows', _parameter_shape(parameters[0])]
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_query_started', None)
+    if started is None or not has_app_context() or 'sql_instrumentation' not in current_app.extensions:
+        return
+    elapsed = time.perf_counter() - started
+
+    stats = g.get('sql_stats')
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        stats.statements[statement] += 1
+
+    if elapsed * 1000 >= current_app.config['SQL_SLOW_QUERY_MS']:
+        slow_query_logger.warning(json.dumps({
+            "event": "slow_query",
+            "duration_ms": round(elapsed * 1000, 2),
+            "statement": statement,
+            "parameters": _parameter_shape(parameters),
+            "executemany": executemany,
+            "endpoint": request.endpoint if has_request_context() else None,
+        }))
+
+
+def _start_request():
+    g.sql_stats = RequestSQLStats()
+
+
+def _finish_request(response):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+
+    total_ms = (time.perf_counter() - stats.started) * 1000
+    db_ms = stats.seconds * 1000
+    response.headers.add(
+        'Server-Timing', f'db;dur={db_ms:.2f};desc="{stats.count} queries", total;dur={total_ms:.2f}'
+    )
+
+    config = current_app.config
+    repeated = {
+        statement[:200]: count for statement, count in stats.statements.items()
+        if count >= config['SQL_REPEATED_STATEMENT_THRESHOLD']
+    }
+    if stats.count > config['SQL_QUERY_BUDGET'] or repeated:
+        sql_logger.warning(json.dumps({
+            "event": "query_budget_exceeded" if stats.count > config['SQL_QUERY_BUDGET'] else "repeated_statement",
+            "method": request.method,
+            "endpoint": request.endpoint,
+            "path": request.path,
+            "queries": stats.count,
+            "budget": config['SQL_QUERY_BUDGET'],
+            "db_ms": round(db_ms, 2),
+            "repeated_statements": repeated,
+        }))
+    return response
+
+
+def init_app(app):
+    if not app.config['SQL_INSTRUMENTATION']:
+        return
+    app.extensions['sql_instrumentation'] = True
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
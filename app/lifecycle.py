@@ -0,0 +1,121 @@
+import json
+import time
+from datetime import datetime, timezone
+from sqlalchemy import and_, case, select, tuple_, update
+from . import db
+from .counters import SubscriptionState, record_subscription_change
+from .models import JobCheckpoint, Subscription
+from app import logger
+
+
+SWEEP_CHECKPOINT = 'subscription_lifecycle_sweep'
+
+
+def load_checkpoint(name):
+    checkpoint = JobCheckpoint.find_by_name(name)
+    if not checkpoint or not checkpoint.value:
+        return None
+    value = json.loads(checkpoint.value)
+    return datetime.fromisoformat(value['current_period_end']), value['id']
+
+
+def save_checkpoint(name, current_period_end, id):
+    checkpoint = JobCheckpoint.find_by_name(name) or JobCheckpoint(name=name)
+    checkpoint.value = json.dumps({"current_period_end": current_period_end.isoformat(), "id": id})
+    checkpoint.save_without_commit()
+
+
+def clear_checkpoint(name):
+    checkpoint = JobCheckpoint.find_by_name(name)
+    if checkpoint and checkpoint.value:
+        checkpoint.value = None
+        checkpoint.save_without_commit()
+
+
+def sweep_due_subscriptions(now=None, chunk_size=1000, pause=0, resume=True, checkpoint_name=SWEEP_CHECKPOINT, report=None):
+    """Moves active subscriptions whose current period has ended to `cancelled`
+    (when `canceled_at` is set) or `ended`, `chunk_size` rows per transaction.
+
+    Due rows are walked in (current_period_end, id) order through
+    idx_status_current_period_end, and the last row of every chunk is
+    committed as a checkpoint together with the chunk, so an interrupted run
+    picks up where it stopped. A run that reaches the end clears the
+    checkpoint, so the next one scans from the start again and picks up rows
+    that became due behind it (backdated periods, late commits). One-time
+    subscriptions never lapse and are left alone.
+
+    A chunk is read with SELECT ... FOR UPDATE, so no upgrade or cancel can
+    change its rows before they are updated and counted as they were read.
+    """
+    now = now or datetime.now(timezone.utc)
+    position = load_checkpoint(checkpoint_name) if resume else None
+
+    total = 0
+    started = time.monotonic()
+    while True:
+        query = (
+            select(
+                Subscription.id, Subscription.current_period_end,
+                Subscription.plan_id, Subscription.created_at, Subscription.canceled_at,
+            )
+            .where(Subscription.status == 'active')
+            .where(Subscription.current_period_end <= now)
+            .where(Subscription.interval != 'one_time')
+            .order_by(Subscription.current_period_end, Subscription.id)
+            .limit(chunk_size)
+            .with_for_update()
+        )
+        if position:
+            query = query.where(tuple_(Subscription.current_period_end, Subscription.id) > tuple(position))
+
+        rows = db.session.execute(query).all()
+        if not rows:
+            clear_checkpoint(checkpoint_name)
+            db.session.commit()
+            break
+
+        ids = [row.id for row in rows]
+        result = db.session.execute(
+            update(Subscription)
+            .where(and_(Subscription.id.in_(ids), Subscription.status == 'active'))
+            .values(
+                status=case((Subscription.canceled_at.isnot(None), 'cancelled'), else_='ended'),
+                ended_at=Subscription.current_period_end,
+                # the time of the chunk rather than of the sweep, which
+                # may be older than the revenue rollup's watermark by now
+                updated_at=datetime.now(timezone.utc),
+                version=Subscription.version + 1,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        for row in rows:
+            record_subscription_change(
+                db.session,
+                before=SubscriptionState(row.plan_id, 'active', row.created_at, row.canceled_at, None),
+                after=SubscriptionState(
+                    row.plan_id, 'ended' if row.canceled_at is None else 'cancelled',
+                    row.created_at, row.canceled_at, row.current_period_end,
+                ),
+            )
+        position = (rows[-1].current_period_end, rows[-1].id)
+        if len(rows) < chunk_size:
+            clear_checkpoint(checkpoint_name)
+        else:
+            save_checkpoint(checkpoint_name, *position)
+        db.session.commit()
+
+        total += result.rowcount
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else float(total)
+        if report:
+            report(total, rate)
+        else:
+            logger.info(f"Swept {total} subscriptions ({rate:.0f} rows/s)")
+
+        if len(rows) < chunk_size:
+            break
+        if pause:
+            time.sleep(pause)
+
+    elapsed = time.monotonic() - started
+    return {"swept": total, "seconds": elapsed, "rows_per_second": total / elapsed if elapsed else float(total)}
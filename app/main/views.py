@@ -0,0 +1,24 @@
+import os
+from flask import current_app, jsonify
+from . import main
+from ..permissions import admin_required
+from ..pool import pool_stats
+from ..warmup import warm_up
+
+
+@main.route('/internal/pool', methods=['GET'])
+@admin_required()
+def get_pool_stats():
+    # per worker process: repeat the request to sample other workers
+    replicas = current_app.extensions['replica_router'].status()
+    return jsonify({"pid": os.getpid(), "pools": pool_stats(), "replicas": replicas}), 200
+
+
+@main.route('/internal/ready', methods=['GET'])
+def get_readiness():
+    # unauthenticated, for load balancer health checks; a warm-up that failed
+    # is retried here
+    state = current_app.extensions['warm_up']
+    if state.error is not None:
+        warm_up(current_app._get_current_object())
+    return jsonify(state.as_dict()), 200 if state.ready else 503
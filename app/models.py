@@ -1,10 +1,11 @@
-import uuid
-from sqlalchemy.dialects.mysql import CHAR
+from sqlalchemy.dialects.mysql import CHAR, LONGBLOB
 from sqlalchemy.orm import relationship
-from sqlalchemy import (Column, String, Text, Integer, Boolean, Enum, Index, DateTime, ForeignKey, UniqueConstraint, CheckConstraint, func)
+from sqlalchemy import (Column, Computed, String, Text, Integer, BigInteger, Boolean, LargeBinary, Enum, Index, Date, DateTime, ForeignKey, UniqueConstraint, CheckConstraint, func, select, tuple_, false)
 from datetime import datetime, timezone, timedelta
 from dateutil.relativedelta import relativedelta
 from . import db
+from .types import BinaryUUID, new_uuid
+from .serialization import format_datetime, format_isoformat
 
 
 
@@ -12,8 +13,8 @@ from . import db
 class BaseModel(db.Model):
     """Base data model for all objects"""
     __abstract__ = True
-    created_at = Column(DateTime(timezone=True), default=datetime.now(timezone.utc), nullable=False)
-    updated_at = Column(DateTime(timezone=True), default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc), nullable=False)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
+    updated_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc), nullable=False)
 
     def save_to_db(self):
         db.session.add(self)
@@ -33,12 +34,13 @@ class BaseModel(db.Model):
 
 class User(BaseModel):
     __tablename__ = 'users'
-    id = Column(CHAR(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(BinaryUUID, primary_key=True, default=new_uuid)
     first_name = Column(String(100))
     last_name = Column(String(100))
     email = Column(String(100), nullable=False)
     password = Column(String(255), nullable=False)
     last_login = Column(DateTime, nullable=True)
+    is_admin = Column(Boolean, default=False, server_default=false(), nullable=False)
 
     __table_args__ = (
             Index(
@@ -54,9 +56,9 @@ class User(BaseModel):
             "first_name": self.first_name,
             "last_name": self.last_name,
             "email": self.email,
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S") if self.created_at else None,
-            "updated_at": self.updated_at.strftime("%Y-%m-%d %H:%M:%S") if self.updated_at else None,
-            "last_login": self.last_login.strftime("%Y-%m-%d %H:%M:%S") if self.last_login else None,
+            "created_at": format_datetime(self.created_at),
+            "updated_at": format_datetime(self.updated_at),
+            "last_login": format_datetime(self.last_login),
         }
 
     @classmethod
@@ -72,15 +74,11 @@ class User(BaseModel):
     def find_by_email(cls, email):
         return cls.query.filter_by(email=email).first()
 
-    def update_last_login(self):
-        self.last_login = datetime.now(timezone.utc)
-        self.save_to_db()
-
 
 class Plan(BaseModel):
     __tablename__ = 'plans'
 
-    id = Column(CHAR(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(BinaryUUID, primary_key=True, default=new_uuid)
     name = Column(String(100), nullable=False)
     description = Column(Text, nullable=True)
     is_active = Column(Boolean, default=True)
@@ -126,8 +124,8 @@ class Plan(BaseModel):
             "name": self.name,
             "description": self.description,
             "is_active": self.is_active,
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S") if self.created_at else None,
-            "updated_at": self.updated_at.strftime("%Y-%m-%d %H:%M:%S") if self.updated_at else None,
+            "created_at": format_datetime(self.created_at),
+            "updated_at": format_datetime(self.updated_at),
             # "intervals": [interval.to_dict() for interval in self.intervals]  # Serialize plan intervals
         }
 
@@ -136,8 +134,8 @@ class Plan(BaseModel):
 class PlanInterval(BaseModel):
     __tablename__ = 'plan_intervals'
 
-    id = Column(CHAR(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    plan_id = Column(CHAR(36), ForeignKey('plans.id'), nullable=False)
+    id = Column(BinaryUUID, primary_key=True, default=new_uuid)
+    plan_id = Column(BinaryUUID, ForeignKey('plans.id'), nullable=False)
 
     interval = Column(Enum( 'one_time', 'day', 'week', 'month', 'year'), nullable=False)
     interval_count = Column(Integer, nullable=False)
@@ -160,16 +158,16 @@ class PlanInterval(BaseModel):
             "interval": self.interval,
             "interval_count": self.interval_count,
             "is_active": self.is_active,
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S") if self.created_at else None,
-            "updated_at": self.updated_at.strftime("%Y-%m-%d %H:%M:%S") if self.updated_at else None,
+            "created_at": format_datetime(self.created_at),
+            "updated_at": format_datetime(self.updated_at),
             # "prices": [price.to_dict() for price in self.prices]  # Serialize plan interval prices
         }
 
 class PlanIntervalPrice(BaseModel):
     __tablename__ = 'plan_interval_prices'
 
-    id = Column(CHAR(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    interval_id = Column(CHAR(36), ForeignKey('plan_intervals.id'), nullable=False)
+    id = Column(BinaryUUID, primary_key=True, default=new_uuid)
+    interval_id = Column(BinaryUUID, ForeignKey('plan_intervals.id'), nullable=False)
     currency = Column(CHAR(3), nullable=False) 
     amount = Column(Integer, nullable=False)
     is_active = Column(Boolean, default=True)
@@ -195,15 +193,15 @@ class PlanIntervalPrice(BaseModel):
             "interval_id": self.interval_id,
             "currency": self.currency,
             "amount": self.amount,
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S") if self.created_at else None,
-            "updated_at": self.updated_at.strftime("%Y-%m-%d %H:%M:%S") if self.updated_at else None,
+            "created_at": format_datetime(self.created_at),
+            "updated_at": format_datetime(self.updated_at),
         }
 
 class PlanUpgrade(BaseModel):
     __tablename__ = "plan_upgrades"
 
-    old_plan_id = Column(CHAR(36), ForeignKey("plans.id"), primary_key=True)
-    new_plan_id = Column(CHAR(36), ForeignKey("plans.id"), primary_key=True)
+    old_plan_id = Column(BinaryUUID, ForeignKey("plans.id"), primary_key=True)
+    new_plan_id = Column(BinaryUUID, ForeignKey("plans.id"), primary_key=True)
     is_active = Column(Boolean, default=True, nullable=False)
 
     @classmethod
@@ -211,28 +209,137 @@ class PlanUpgrade(BaseModel):
         return cls.query.filter_by(**kwargs).first()
 
 
+class CatalogVersion(BaseModel):
+    __tablename__ = "catalog_versions"
+
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+
+
+class PlanCatalog(BaseModel):
+    """A pre-rendered `GET /plan` response for one currency, or for all of
+    them under "*", kept up to date by app.plan_catalog."""
+    __tablename__ = "plan_catalog"
+
+    currency = Column(String(3), primary_key=True)
+    document = Column(LargeBinary().with_variant(LONGBLOB(), 'mysql'), nullable=False)
+
+
+class SubscriptionCounter(BaseModel):
+    """One shard of a subscription count, kept up to date by app.counters.
+    The real count of `(plan_id, status, day)` is the sum over its shards."""
+    __tablename__ = "subscription_counters"
+
+    plan_id = Column(BinaryUUID, ForeignKey('plans.id'), primary_key=True)
+    status = Column(Enum('active', 'cancelled', 'ended'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    shard = Column(Integer, primary_key=True, autoincrement=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('idx_subscription_counters_day', 'day'),
+    )
+
+
+class RevenueRollup(BaseModel):
+    """Recurring revenue moved on one day in one currency, in minor units per
+    month, and the totals at the end of that day. Built by app.revenue."""
+    __tablename__ = "revenue_rollups"
+
+    day = Column(Date, primary_key=True)
+    currency = Column(String(3), primary_key=True)
+    mrr = Column(BigInteger, nullable=False, default=0)
+    new_mrr = Column(BigInteger, nullable=False, default=0)
+    expansion_mrr = Column(BigInteger, nullable=False, default=0)
+    churned_mrr = Column(BigInteger, nullable=False, default=0)
+    active_subscriptions = Column(Integer, nullable=False, default=0)
+    new_subscriptions = Column(Integer, nullable=False, default=0)
+    churned_subscriptions = Column(Integer, nullable=False, default=0)
+
+
+class JobCheckpoint(BaseModel):
+    __tablename__ = "job_checkpoints"
+
+    name = Column(String(100), primary_key=True)
+    value = Column(Text, nullable=True)
+
+    @classmethod
+    def find_by_name(cls, name):
+        return cls.query.filter_by(name=name).first()
+
+
+class IdempotencyKey(BaseModel):
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(BinaryUUID, primary_key=True)
+    key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=True)
+    response_body = Column(LargeBinary, nullable=True)
+    response_mimetype = Column(String(100), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index('idx_expires_at', 'expires_at'),
+    )
+
+
+class TokenRevocation(BaseModel):
+    """A revoked access token (`jti`), or, when `jti` is null, every token of
+    `user_id` issued before `issued_before`, a whole second. Rows are only needed
+    until `expires_at`, after which the tokens they cover have expired."""
+    __tablename__ = "token_revocations"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    jti = Column(String(36), nullable=True)
+    user_id = Column(BinaryUUID, nullable=True)
+    issued_before = Column(DateTime(timezone=True), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        Index('idx_token_revocations_jti', 'jti'),
+        Index('idx_token_revocations_user_id', 'user_id'),
+        Index('idx_token_revocations_created_at', 'created_at'),
+        Index('idx_token_revocations_expires_at', 'expires_at'),
+    )
+
+
 class Subscription(BaseModel):
     __tablename__ = 'subscriptions'
 
-    id = Column(CHAR(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = Column(CHAR(36), ForeignKey('users.id'), nullable=False)
-    plan_id = Column(CHAR(36), ForeignKey('plans.id'), nullable=False)
-    price_id = Column(CHAR(36), ForeignKey('plan_interval_prices.id'), nullable=False)
+    id = Column(BinaryUUID, primary_key=True, default=new_uuid)
+    user_id = Column(BinaryUUID, ForeignKey('users.id'), nullable=False)
+    plan_id = Column(BinaryUUID, ForeignKey('plans.id'), nullable=False)
+    price_id = Column(BinaryUUID, ForeignKey('plan_interval_prices.id'), nullable=False)
     interval = Column(Enum( 'one_time', 'day', 'week', 'month', 'year'), nullable=False)
     current_period_start = Column(DateTime(timezone=True), nullable=False)
     current_period_end = Column(DateTime(timezone=True), nullable=True)
     status = Column(Enum( 'active', 'cancelled', 'ended'), nullable=False)
     amount_paid = Column(Integer, nullable=False)
-    upgraded_from_subscription_id = Column(CHAR(36), ForeignKey('subscriptions.id'), nullable=True)
+    upgraded_from_subscription_id = Column(BinaryUUID, ForeignKey('subscriptions.id'), nullable=True)
     canceled_at = Column(DateTime(timezone=True), nullable=True)
     ended_at = Column(DateTime(timezone=True), nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    # plan_id while the subscription is active, NULL otherwise: the unique
+    # index on (user_id, active_plan_id) allows one active subscription per plan
+    active_plan_id = Column(BinaryUUID, Computed("CASE WHEN status = 'active' THEN plan_id END", persisted=False))
+
+    __mapper_args__ = {
+        "version_id_col": version,
+    }
 
     __table_args__ = (
-        Index('idx_user_id', 'user_id'),
+        Index('uq_user_active_plan', 'user_id', 'active_plan_id', unique=True),
+        Index('uq_upgraded_from_subscription_id', 'upgraded_from_subscription_id', unique=True),
+        Index('idx_user_id', 'user_id', 'created_at', 'id'),
         Index('idx_plan_id', 'plan_id'),
-        Index('idx_user_id_status', 'user_id', 'status'),
+        Index('idx_user_id_status', 'user_id', 'status', 'created_at', 'id'),
         Index('idx_plan_id_status', 'plan_id', 'status'),
-        Index('idx_user_id_plan_id', 'user_id', 'plan_id')
+        Index('idx_user_id_plan_id', 'user_id', 'plan_id', 'created_at', 'id'),
+        Index('idx_status_current_period_end', 'status', 'current_period_end'),
+        Index('idx_subscriptions_created_at', 'created_at'),
+        Index('idx_subscriptions_ended_at', 'ended_at'),
+        Index('idx_subscriptions_updated_at', 'updated_at'),
     )
 
     def to_dict(self):
@@ -240,13 +347,13 @@ class Subscription(BaseModel):
             "id": self.id,
             "user_id": self.user_id,
             "plan_id": self.plan_id,
-            "current_period_start": self.current_period_start.isoformat() if self.current_period_start else None,
-            "current_period_end": self.current_period_end.isoformat() if self.current_period_end else None,
+            "current_period_start": format_isoformat(self.current_period_start),
+            "current_period_end": format_isoformat(self.current_period_end),
             "status": self.status,
             "amount_paid": self.amount_paid,
             "upgraded_from_subscription_id": self.upgraded_from_subscription_id,
-            "canceled_at": self.canceled_at.isoformat() if self.canceled_at else None,
-            "ended_at": self.ended_at.isoformat() if self.ended_at else None,
+            "canceled_at": format_isoformat(self.canceled_at),
+            "ended_at": format_isoformat(self.ended_at),
         }
 
     @classmethod
@@ -255,4 +362,36 @@ class Subscription(BaseModel):
 
     @classmethod
     def find_all_by_params(cls, **kwargs):
-        return cls.query.filter_by(**kwargs).all()
\ No newline at end of file
+        return cls.query.filter_by(**kwargs).all()
+
+    @staticmethod
+    def is_active_plan_conflict(error):
+        """Whether an IntegrityError was raised by uq_user_active_plan. MySQL
+        names the index in its message, SQLite the columns."""
+        return 'active_plan' in str(getattr(error, 'orig', error))
+
+    @classmethod
+    def stream_for_export(cls, batch_size, after=None, since=None, **kwargs):
+        """Yields subscriptions matching `kwargs` in id order, fetched
+        `batch_size` rows at a time through a server-side cursor where the
+        driver supports one. `after` resumes past that id and `since` keeps
+        rows updated at or after it."""
+        query = cls.query.filter_by(**kwargs)
+        if after:
+            query = query.filter(cls.id > after)
+        if since:
+            query = query.filter(cls.updated_at >= since)
+        return iter(query.order_by(cls.id).yield_per(batch_size))
+
+    @classmethod
+    def find_page_by_params(cls, limit, after=None, **kwargs):
+        """Returns up to `limit` subscriptions ordered by (created_at, id),
+        starting strictly after the `(created_at, id)` pair given in `after`."""
+        return db.session.scalars(cls.page_statement(limit, after, **kwargs)).all()
+
+    @classmethod
+    def page_statement(cls, limit, after=None, **kwargs):
+        statement = select(cls).filter_by(**kwargs)
+        if after:
+            statement = statement.filter(tuple_(cls.created_at, cls.id) > tuple(after))
+        return statement.order_by(cls.created_at, cls.id).limit(limit)
@@ -0,0 +1,22 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, id):
+    raw = json.dumps([created_at.isoformat(), id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(uuid.UUID(str(id)))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(cursor)) from e
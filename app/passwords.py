@@ -0,0 +1,97 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full, so the caller can shed load
+    instead of piling more work onto a saturated pool."""
+
+
+def _running_under_gevent():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('threading')
+
+
+def _make_executor(kind, workers):
+    if kind == 'process':
+        return ProcessPoolExecutor(max_workers=workers)
+    if _running_under_gevent():
+        # monkey patched threads are greenlets, so the KDF would still run on
+        # the hub; gevent's pool runs it on a real OS thread and lets the
+        # waiting greenlet yield
+        from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+        return GeventThreadPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hasher')
+
+
+class PasswordHasher:
+    """Runs password hashing and verification on a bounded executor.
+
+    `executor` is one of `thread`, `process` or `inline` (no offloading). At
+    most `max_pending` jobs may be queued or running at once; past that,
+    `HasherBusy` is raised immediately.
+    """
+
+    def __init__(self, executor='thread', workers=2, max_pending=64, method=None):
+        self._kind = executor
+        self._workers = workers
+        self._method = method
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._method_prefix = None
+
+    def _submit(self, fn, *args):
+        if self._kind == 'inline':
+            return fn(*args)
+
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            if self._executor is None:
+                with self._executor_lock:
+                    if self._executor is None:
+                        self._executor = _make_executor(self._kind, self._workers)
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def _method_args(self):
+        return (self._method,) if self._method else ()
+
+    def hash(self, password):
+        return self._submit(generate_password_hash, password, *self._method_args())
+
+    def verify(self, password_hash, password):
+        return self._submit(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when `password_hash` was made with other parameters than the
+        ones currently configured."""
+        if self._method_prefix is None:
+            sample = generate_password_hash('', *self._method_args())
+            self._method_prefix = sample.split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._method_prefix
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def password_hasher():
+    return current_app.extensions['password_hasher']
+
+
+def init_app(app):
+    app.extensions['password_hasher'] = PasswordHasher(
+        executor=app.config['PASSWORD_HASHER_EXECUTOR'],
+        workers=app.config['PASSWORD_HASHER_WORKERS'],
+        max_pending=app.config['PASSWORD_HASHER_MAX_PENDING'],
+        method=app.config['PASSWORD_HASH_METHOD'],
+    )
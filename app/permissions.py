@@ -0,0 +1,17 @@
+from functools import wraps
+from flask import jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt
+
+
+def admin_required():
+    """Like `jwt_required()`, but the token must also carry the `is_admin`
+    claim, which login sets for users flagged as administrators."""
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            verify_jwt_in_request()
+            if not get_jwt().get('is_admin'):
+                return jsonify({"message": "admin access required"}), 403
+            return fn(*args, **kwargs)
+        return decorator
+    return wrapper
@@ -0,0 +1,197 @@
+"""The `GET /api/v1/plan` catalog, materialized in the plan_catalog table as
+one pre-rendered document per currency, plus one for every currency under
+`ALL_CURRENCIES`.
+
+Documents are refreshed inside the transaction that changes the catalog,
+just before it commits, and only for the plans it touched: their rows are
+re-read and spliced into the stored documents. Bulk `query.update()` /
+`query.delete()` calls on catalog models cannot say which plans they hit,
+so they rebuild every document instead, as does `flask catalog rebuild`.
+"""
+import json
+from collections import defaultdict
+from flask import current_app
+from sqlalchemy import delete, event, insert, select
+from . import db
+from .models import Plan, PlanCatalog, PlanInterval, PlanIntervalPrice
+
+
+ALL_CURRENCIES = '*'
+CATALOG_MESSAGE = "Successfully retrieved plans"
+
+
+def plan_catalog_statement(currency=None, plan_ids=None):
+    """Every active `(plan, interval, price)` row, optionally in one currency
+    or of some plans only."""
+    statement = (
+            select(
+                Plan,
+                PlanInterval,
+                PlanIntervalPrice,
+            )
+            .join(PlanInterval, Plan.id == PlanInterval.plan_id)
+            .join(PlanIntervalPrice, PlanInterval.id == PlanIntervalPrice.interval_id)
+            .filter(Plan.is_active == True)
+            .filter(PlanInterval.is_active == True)
+            .filter(PlanIntervalPrice.is_active == True)
+            )
+    if currency:
+        statement = statement.filter(PlanIntervalPrice.currency == currency)
+    if plan_ids is not None:
+        statement = statement.filter(Plan.id.in_(plan_ids))
+    return statement
+
+
+def plan_catalog_plans(rows):
+    # every plan and interval is serialized once, however many price rows it joins to
+    included_plans = {}
+    included_intervals = {}
+    for plan, interval, price in rows:
+        plan_data = included_plans.get(plan.id)
+        if plan_data is None:
+            plan_data = included_plans[plan.id] = plan.to_dict()
+            plan_data['intervals'] = []
+
+        interval_data = included_intervals.get(interval.id)
+        if interval_data is None:
+            interval_data = included_intervals[interval.id] = interval.to_dict()
+            interval_data['prices'] = []
+            plan_data['intervals'].append(interval_data)
+
+        interval_data['prices'].append(price.to_dict())
+
+    return sorted(included_plans.values(), key=lambda x: x["created_at"])
+
+
+def plan_catalog_payload(rows):
+    return {"message": CATALOG_MESSAGE, "plans": plan_catalog_plans(rows)}
+
+
+def stored_plan_catalog_statement(currency=None):
+    """The stored documents needed to answer for `currency`: its own and the
+    all-currencies one, which tells an unknown currency from a table that
+    was never built."""
+    return select(PlanCatalog.currency, PlanCatalog.document).where(
+        PlanCatalog.currency.in_({currency or ALL_CURRENCIES, ALL_CURRENCIES})
+    )
+
+
+def stored_plan_catalog(currency, rows, encoder):
+    """The stored document for `currency` out of `stored_plan_catalog_statement()`
+    rows, an empty catalog when no plan has a price in it, or None when the
+    table has not been built yet."""
+    documents = dict(rows)
+    if ALL_CURRENCIES not in documents:
+        return None
+    document = documents.get(currency or ALL_CURRENCIES)
+    if document is None:
+        document = encoder.encode_document({"message": CATALOG_MESSAGE, "plans": []})
+    return document
+
+
+def refresh_plan_catalog(session, plan_ids=None):
+    """Re-renders the stored documents in the session's transaction: only
+    the plans in `plan_ids`, spliced into the documents that hold or should
+    hold them, or every document when `plan_ids` is None (or the table has
+    not been built yet). Returns the number of documents written."""
+    table = PlanCatalog.__table__
+    stored = None
+    if plan_ids is not None:
+        # locks the documents, so concurrent refreshes do not lose each other's plans
+        stored = dict(session.execute(select(table.c.currency, table.c.document).with_for_update()).all())
+        if ALL_CURRENCIES not in stored:
+            plan_ids = stored = None
+
+    rows = session.execute(plan_catalog_statement(plan_ids=plan_ids)).all() if plan_ids is None or plan_ids else []
+    by_currency = defaultdict(list)
+    for row in rows:
+        by_currency[row[2].currency].append(row)
+    fresh = {currency: plan_catalog_plans(currency_rows) for currency, currency_rows in by_currency.items()}
+    fresh[ALL_CURRENCIES] = plan_catalog_plans(rows)
+
+    if stored is None:
+        documents = fresh
+        session.execute(delete(table))
+    else:
+        documents = {}
+        for currency in stored.keys() | fresh.keys():
+            plans = json.loads(stored[currency])['plans'] if currency in stored else []
+            kept = [plan for plan in plans if plan['id'] not in plan_ids]
+            if len(kept) == len(plans) and not fresh.get(currency):
+                continue
+            documents[currency] = sorted(kept + fresh.get(currency, []), key=lambda x: x["created_at"])
+        if documents:
+            session.execute(delete(table).where(table.c.currency.in_(documents)))
+
+    encode = current_app.json.encode_document
+    values = [
+        {"currency": currency, "document": encode({"message": CATALOG_MESSAGE, "plans": plans})}
+        for currency, plans in documents.items()
+        if plans or currency == ALL_CURRENCIES
+    ]
+    if values:
+        session.execute(insert(table), values)
+    return len(documents)
+
+
+def _changes(session):
+    return session.info.setdefault('plan_catalog_changes', {"plans": set(), "intervals": set(), "rebuild": False})
+
+
+@event.listens_for(db.session, 'after_flush')
+def _collect_flushed_plans(session, flush_context):
+    changes = None
+    for obj in session.new | session.dirty | session.deleted:
+        if isinstance(obj, Plan):
+            changes = changes or _changes(session)
+            changes["plans"].add(str(obj.id))
+        elif isinstance(obj, PlanInterval):
+            changes = changes or _changes(session)
+            changes["plans"].add(str(obj.plan_id))
+        elif isinstance(obj, PlanIntervalPrice):
+            changes = changes or _changes(session)
+            changes["intervals"].add(str(obj.interval_id))
+
+
+@event.listens_for(db.session, 'do_orm_execute')
+def _collect_bulk_plans(orm_execute_state):
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or not issubclass(mapper.class_, (Plan, PlanInterval, PlanIntervalPrice)):
+        return
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        _changes(orm_execute_state.session)["rebuild"] = True
+    elif orm_execute_state.is_insert:
+        # insert(Model) executed with a list of rows, as the bulk endpoint does
+        key, target = {Plan: ('id', "plans"), PlanInterval: ('plan_id', "plans"), PlanIntervalPrice: ('interval_id', "intervals")}[mapper.class_]
+        parameters = orm_execute_state.parameters
+        if isinstance(parameters, dict):
+            parameters = [parameters]
+        changes = _changes(orm_execute_state.session)
+        if not parameters or any(key not in row for row in parameters):
+            changes["rebuild"] = True
+        else:
+            changes[target].update(str(row[key]) for row in parameters)
+
+
+@event.listens_for(db.session, 'before_commit')
+def _refresh_before_commit(session):
+    # commit() only flushes after this hook, the pending changes must be seen here
+    session.flush()
+    if 'plan_catalog_changes' not in session.info:
+        return
+    changes = session.info.pop('plan_catalog_changes')
+    if changes["rebuild"]:
+        refresh_plan_catalog(session)
+        return
+    plan_ids = changes["plans"]
+    if changes["intervals"]:
+        plan_ids |= {
+            str(plan_id) for plan_id in
+            session.execute(select(PlanInterval.plan_id).where(PlanInterval.id.in_(changes["intervals"]))).scalars()
+        }
+    refresh_plan_catalog(session, plan_ids)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _reset_after_rollback(session, previous_transaction):
+    session.info.pop('plan_catalog_changes', None)
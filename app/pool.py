@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+import weakref
+from sqlalchemy import event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from . import db
+
+
+class PoolStats:
+    """Counters for one connection pool in one worker process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.timeouts = 0
+        self.overflow_checkouts = 0
+        self.max_overflow_seen = 0
+        self.connects = 0
+        self.invalidations = 0
+
+    def record_checkout(self, waited, overflowed, overflow):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            if overflowed:
+                self.overflow_checkouts += 1
+            self.max_overflow_seen = max(self.max_overflow_seen, overflow)
+
+    def record_timeout(self, waited):
+        with self._lock:
+            self.timeouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def record(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def as_dict(self):
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_ms_total": round(self.wait_seconds * 1000, 3),
+                "wait_ms_avg": round(self.wait_seconds * 1000 / attempts, 3) if attempts else 0.0,
+                "wait_ms_max": round(self.max_wait_seconds * 1000, 3),
+                "overflow_checkouts": self.overflow_checkouts,
+                "max_overflow_seen": self.max_overflow_seen,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """A QueuePool that records how long checkouts wait, how often they spill
+    into overflow connections and how often they time out."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        overflow = self.overflow()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.stats.record_timeout(time.perf_counter() - started)
+            raise
+        # overflow() counts up from -pool_size, it is positive once past the pool size
+        after = self.overflow()
+        self.stats.record_checkout(time.perf_counter() - started, after > max(overflow, 0), max(after, 0))
+        return connection
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool, InstrumentedQueuePool):
+    """The same instrumentation for engines created by `create_async_engine`."""
+
+
+def _in_memory_sqlite(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config, url, options=None):
+    """Engine options for `url` from the DB_POOL_* settings, on top of
+    `options`, which win."""
+    options = dict(options or {})
+    options.setdefault('pool_pre_ping', config['DB_POOL_PRE_PING'])
+    if url and not _in_memory_sqlite(url):
+        # one connection per greenlet a worker can run at once
+        options.setdefault('poolclass', InstrumentedQueuePool)
+        options.setdefault('pool_size', config['DB_POOL_SIZE'] or config['WEB_WORKER_CONNECTIONS'])
+        options.setdefault('max_overflow', config['DB_MAX_OVERFLOW'])
+        options.setdefault('pool_timeout', config['DB_POOL_TIMEOUT'])
+        options.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+        # idle connections past the working set age out instead of all going stale together
+        options.setdefault('pool_use_lifo', True)
+    return options
+
+
+def async_engine_options(config, url):
+    """`engine_options` for an asyncio engine on `url`."""
+    options = engine_options(config, url)
+    if options.get('poolclass') is InstrumentedQueuePool:
+        options['poolclass'] = InstrumentedAsyncQueuePool
+    return options
+
+
+def configure(app):
+    """Fills in SQLALCHEMY_ENGINE_OPTIONS from the DB_POOL_* settings. Has to
+    run before `db.init_app`; options set explicitly in the config win."""
+    config = app.config
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(
+        config, config.get('SQLALCHEMY_DATABASE_URI'), config.get('SQLALCHEMY_ENGINE_OPTIONS')
+    )
+
+
+_engines = weakref.WeakSet()
+
+
+def dispose_inherited_connections():
+    """Drops the pooled connections of every engine without closing them.
+    Runs in every forked child: connections inherited from the parent must
+    not be used by the child, nor closed by it, the parent may still be
+    using them. Calling it again is harmless."""
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=dispose_inherited_connections)
+
+
+def _watch(engine):
+    if engine in _engines:
+        return
+    _engines.add(engine)
+
+    def on_connect(dbapi_connection, connection_record):
+        stats = getattr(engine.pool, 'stats', None)
+        if stats is not None:
+            stats.record('connects')
+
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        stats = getattr(engine.pool, 'stats', None)
+        if stats is not None:
+            stats.record('invalidations')
+
+    event.listen(engine, 'connect', on_connect)
+    event.listen(engine, 'invalidate', on_invalidate)
+
+
+def pool_stats():
+    """Stats for every engine of the current app, keyed by bind name."""
+    result = {}
+    for bind, engine in db.engines.items():
+        pool = engine.pool
+        stats = {"pool": type(pool).__name__, "status": pool.status()}
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=max(pool.overflow(), 0),
+                max_overflow=pool._max_overflow,
+                timeout=pool.timeout(),
+            )
+        if isinstance(pool, InstrumentedQueuePool):
+            stats.update(pool.stats.as_dict())
+        result[bind or 'default'] = stats
+    return result
+
+
+def init_app(app):
+    with app.app_context():
+        for engine in db.engines.values():
+            _watch(engine)
@@ -0,0 +1,193 @@
+import itertools
+import logging
+import threading
+import time
+from functools import wraps
+from flask import current_app, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+
+def replica_lag(connection):
+    """Seconds the replica is behind its primary, 0 when it is not replicating
+    from anything (a local stand-in) and None when replication is broken."""
+    if connection.dialect.name != 'mysql':
+        return 0
+    status = connection.execute(text('SHOW REPLICA STATUS')).mappings().first()
+    if status is None:
+        return 0
+    lag = status.get('Seconds_Behind_Source')
+    return None if lag is None else float(lag)
+
+
+class _Replica:
+    def __init__(self, engine):
+        self.engine = engine
+        self.healthy = False
+        self.lag = None
+        self.checked_at = None
+        self.lock = threading.Lock()
+
+
+class ReplicaRouter:
+    """Hands out replica engines round robin, skipping replicas that failed
+    their last health check: unreachable, or more than `max_lag` seconds
+    behind. Each replica is re-checked at most every `check_interval`
+    seconds, by whichever request needs it first."""
+
+    def __init__(self, engines, max_lag, check_interval, lag_probe=replica_lag):
+        self._replicas = [_Replica(engine) for engine in engines]
+        self._max_lag = max_lag
+        self._check_interval = check_interval
+        self._lag_probe = lag_probe
+        self._counter = itertools.count()
+
+    def __bool__(self):
+        return bool(self._replicas)
+
+    def pick(self):
+        """A usable replica engine, or None to fall back to the primary."""
+        count = len(self._replicas)
+        start = next(self._counter)
+        for offset in range(count):
+            replica = self._replicas[(start + offset) % count]
+            if self._usable(replica):
+                return replica.engine
+        return None
+
+    def _usable(self, replica):
+        checked_at = replica.checked_at
+        if checked_at is None or time.monotonic() - checked_at >= self._check_interval:
+            # only one request re-checks, the others go by the last result
+            if replica.lock.acquire(blocking=checked_at is None):
+                try:
+                    self.check(replica)
+                finally:
+                    replica.lock.release()
+        return replica.healthy
+
+    def check(self, replica):
+        try:
+            with replica.engine.connect() as connection:
+                lag = self._lag_probe(connection)
+        except SQLAlchemyError as e:
+            logger.warning(f"Replica {replica.engine.url!r} is unreachable: {e}")
+            replica.healthy, replica.lag = False, None
+        else:
+            replica.healthy = lag is not None and lag <= self._max_lag
+            replica.lag = lag
+            if not replica.healthy:
+                logger.warning(f"Replica {replica.engine.url!r} is lagging ({lag}s), reading from the primary")
+        replica.checked_at = time.monotonic()
+
+    def mark_down(self, engine):
+        for replica in self._replicas:
+            if replica.engine is engine:
+                replica.healthy = False
+                replica.checked_at = time.monotonic()
+
+    def status(self):
+        return [
+            {"url": replica.engine.url.render_as_string(hide_password=True), "healthy": replica.healthy, "lag": replica.lag}
+            for replica in self._replicas
+        ]
+
+
+class RoutingSession(Session):
+    """Sends the reads of `read_only()` views to a replica. The first write
+    of the request, and everything after it, goes to the primary, as does
+    anything run under `on_primary`."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engine = super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+        info = self.info
+        if bind is not None or not info.get('read_only') or info.get('wrote') or info.get('primary') or self._flushing:
+            return engine
+        if engine is not self._db.engines.get(None):
+            return engine
+
+        # one replica for the whole request; False once it fell back to the primary
+        replica = info.get('replica')
+        if replica is None and has_app_context():
+            router = current_app.extensions.get('replica_router')
+            replica = info['replica'] = (router.pick() if router else None) or False
+        return replica or engine
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _stick_to_primary_after_flush(session, flush_context):
+    if session.info.get('read_only'):
+        session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _stick_to_primary_on_write(orm_execute_state):
+    info = orm_execute_state.session.info
+    if info.get('read_only') and not orm_execute_state.is_select:
+        info['wrote'] = True
+
+
+def read_only():
+    """Lets the view's queries run on a replica."""
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            from . import db
+            info = db.session.info
+            info['read_only'] = True
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                for key in ('read_only', 'replica', 'wrote'):
+                    info.pop(key, None)
+        return decorator
+    return wrapper
+
+
+def on_primary(fn):
+    """Runs `fn` against the primary even inside a `read_only()` view, for
+    loads whose result is cached and must not come from a lagging replica."""
+    @wraps(fn)
+    def decorator(*args, **kwargs):
+        from . import db
+        info = db.session.info
+        nested = info.get('primary', False)
+        info['primary'] = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            info['primary'] = nested
+    return decorator
+
+
+def configure(app):
+    """Registers every URL in SQLALCHEMY_REPLICA_URLS as a bind with the
+    same pool settings as the primary. Has to run before `db.init_app`."""
+    from .pool import engine_options
+    urls = app.config['SQLALCHEMY_REPLICA_URLS']
+    if urls:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        for index, url in enumerate(urls):
+            binds[f'{REPLICA_BIND_PREFIX}{index}'] = dict(engine_options(app.config, url), url=url)
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def init_app(app):
+    from . import db
+    with app.app_context():
+        engines = [
+            db.engines[f'{REPLICA_BIND_PREFIX}{index}'] for index in range(len(app.config['SQLALCHEMY_REPLICA_URLS']))
+        ]
+    router = ReplicaRouter(engines, app.config['REPLICA_MAX_LAG'], app.config['REPLICA_CHECK_INTERVAL'])
+    app.extensions['replica_router'] = router
+
+    for engine in engines:
+        def on_error(context, engine=engine):
+            if context.is_disconnect or context.connection is None:
+                router.mark_down(engine)
+        event.listen(engine, 'handle_error', on_error)
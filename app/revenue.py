@@ -0,0 +1,295 @@
+"""Daily recurring revenue per currency, rolled up into revenue_rollups.
+
+Each recurring subscription is worth its `amount_paid` normalized to a
+month (`monthly_amount()`), from the day it is created until the day it
+ends. A day's row holds what moved that day:
+
+- `new_mrr`: subscriptions started that are not upgrades,
+- `expansion_mrr`: upgrades, what the new subscription is worth less what
+  the one it replaced was (negative for a cheaper one),
+- `churned_mrr`: subscriptions that ended without being upgraded,
+
+and `mrr` / `active_subscriptions`, the running totals at the end of the
+day. Days without movement have no row: the totals of a day are those of
+the latest row on or before it. Days are UTC.
+
+`roll_up_revenue()` only reads subscriptions updated since its last run
+(the watermark is a JobCheckpoint) and recomputes the days they touched;
+`backfill_revenue()` recomputes a date range, optionally spread over a
+process pool.
+"""
+import json
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta, timezone
+from fractions import Fraction
+from functools import lru_cache
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import bindparam, create_engine, delete, func, insert, or_, select, update
+from sqlalchemy.orm import Session, aliased
+from . import db
+from .models import JobCheckpoint, Plan, PlanInterval, PlanIntervalPrice, RevenueRollup, Subscription
+
+
+ROLLUP_CHECKPOINT = 'revenue_rollup'
+# rows committed by other transactions while a run was reading are picked
+# up by the next one
+WATERMARK_OVERLAP = timedelta(seconds=10)
+# the mean Gregorian month, in days
+DAYS_PER_MONTH = Fraction(146097, 4800)
+FLOWS = ('new_mrr', 'expansion_mrr', 'churned_mrr', 'new_subscriptions', 'churned_subscriptions')
+
+
+@lru_cache(maxsize=65536)
+def monthly_amount(amount, interval, interval_count):
+    """`amount` paid every `interval_count` `interval`s as a monthly figure,
+    rounded to minor units, with the period lengths `Plan.get_interval_days`
+    gives. None for one-time payments, which are not recurring. Cached, as
+    most subscriptions share a handful of prices."""
+    period = Plan.get_interval_days(interval, interval_count)
+    if isinstance(period, relativedelta):
+        months = Fraction(period.years * 12 + period.months)
+    elif isinstance(period, timedelta) and period:
+        months = Fraction(period.days) / DAYS_PER_MONTH
+    else:
+        return None
+    return round(amount / months)
+
+
+def _day(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.date()
+
+
+def _start_of(day):
+    return datetime.combine(day, time.min, timezone.utc)
+
+
+def compute_flows(session, start, end):
+    """The movements of every day in `[start, end)`, as
+    `{(day, currency): {flow: amount}}`, read from the subscriptions
+    created or ended in the range."""
+    flows = defaultdict(lambda: dict.fromkeys(FLOWS, 0))
+    lower, upper = _start_of(start), _start_of(end)
+    previous, previous_price, previous_interval = aliased(Subscription), aliased(PlanIntervalPrice), aliased(PlanInterval)
+
+    price = aliased(PlanIntervalPrice)
+    plan_interval = aliased(PlanInterval)
+    started = (
+        select(
+            Subscription.created_at, Subscription.amount_paid, Subscription.interval, plan_interval.interval_count, price.currency,
+            previous.amount_paid, previous.interval, previous_interval.interval_count, previous_price.currency,
+        )
+        .join(price, price.id == Subscription.price_id)
+        .join(plan_interval, plan_interval.id == price.interval_id)
+        .outerjoin(previous, previous.id == Subscription.upgraded_from_subscription_id)
+        .outerjoin(previous_price, previous_price.id == previous.price_id)
+        .outerjoin(previous_interval, previous_interval.id == previous_price.interval_id)
+        .where(Subscription.interval != 'one_time')
+        .where(Subscription.created_at >= lower, Subscription.created_at < upper)
+    )
+    for created_at, amount, interval, count, currency, old_amount, old_interval, old_count, old_currency in session.execute(started):
+        bucket = flows[(_day(created_at), currency)]
+        value = monthly_amount(amount, interval, count)
+        if old_amount is not None and old_currency == currency:
+            bucket['expansion_mrr'] += value - monthly_amount(old_amount, old_interval, old_count)
+        else:
+            bucket['new_mrr'] += value
+            bucket['new_subscriptions'] += 1
+
+    following, following_price = aliased(Subscription), aliased(PlanIntervalPrice)
+    ended = (
+        select(Subscription.ended_at, Subscription.amount_paid, Subscription.interval, plan_interval.interval_count, price.currency, following_price.currency)
+        .join(price, price.id == Subscription.price_id)
+        .join(plan_interval, plan_interval.id == price.interval_id)
+        .outerjoin(following, following.upgraded_from_subscription_id == Subscription.id)
+        .outerjoin(following_price, following_price.id == following.price_id)
+        .where(Subscription.interval != 'one_time')
+        .where(Subscription.ended_at >= lower, Subscription.ended_at < upper)
+    )
+    for ended_at, amount, interval, count, currency, next_currency in session.execute(ended):
+        # an upgrade in the same currency is counted as expansion instead
+        if next_currency == currency:
+            continue
+        bucket = flows[(_day(ended_at), currency)]
+        bucket['churned_mrr'] += monthly_amount(amount, interval, count)
+        bucket['churned_subscriptions'] += 1
+
+    return dict(flows)
+
+
+def _write_flows(session, days, flows):
+    """Replaces the rows of `days` (a `(start, end)` range or a set) with
+    `flows`, leaving their totals to `_roll_forward()`."""
+    table = RevenueRollup.__table__
+    if isinstance(days, tuple):
+        session.execute(delete(table).where(table.c.day >= days[0], table.c.day < days[1]))
+    elif days:
+        session.execute(delete(table).where(table.c.day.in_(days)))
+    rows = [
+        dict(bucket, day=day, currency=currency, mrr=0, active_subscriptions=0)
+        for (day, currency), bucket in sorted(flows.items())
+        if any(bucket.values())
+    ]
+    if rows:
+        session.execute(insert(table), rows)
+
+
+def _opening_balance(session, day):
+    """MRR and active subscriptions per currency at the start of `day`, read
+    from the subscriptions table."""
+    boundary = _start_of(day)
+    price, plan_interval = aliased(PlanIntervalPrice), aliased(PlanInterval)
+    statement = (
+        select(Subscription.amount_paid, Subscription.interval, plan_interval.interval_count, price.currency)
+        .join(price, price.id == Subscription.price_id)
+        .join(plan_interval, plan_interval.id == price.interval_id)
+        .where(Subscription.interval != 'one_time')
+        .where(Subscription.created_at < boundary)
+        .where(or_(Subscription.ended_at.is_(None), Subscription.ended_at >= boundary))
+    )
+    balance = defaultdict(lambda: [0, 0])
+    for amount, interval, count, currency in session.execute(statement.execution_options(yield_per=10000)):
+        balance[currency][0] += monthly_amount(amount, interval, count)
+        balance[currency][1] += 1
+    return balance
+
+
+def _roll_forward(session, day):
+    """Recomputes the running totals of every row from `day` on, starting
+    from the latest earlier row of each currency, or from the subscriptions
+    table when the rollup has no earlier row at all."""
+    table = RevenueRollup.__table__
+    latest = (
+        select(table.c.currency, func.max(table.c.day).label('day'))
+        .where(table.c.day < day).group_by(table.c.currency).subquery()
+    )
+    previous = session.execute(
+        select(table.c.currency, table.c.mrr, table.c.active_subscriptions)
+        .join(latest, (latest.c.currency == table.c.currency) & (latest.c.day == table.c.day))
+    ).all()
+    if previous:
+        totals = defaultdict(lambda: [0, 0], {currency: [mrr, active] for currency, mrr, active in previous})
+    else:
+        totals = _opening_balance(session, day)
+
+    values = []
+    for row in session.execute(select(table).where(table.c.day >= day).order_by(table.c.day, table.c.currency)):
+        total = totals[row.currency]
+        total[0] += row.new_mrr + row.expansion_mrr - row.churned_mrr
+        total[1] += row.new_subscriptions - row.churned_subscriptions
+        values.append({"b_day": row.day, "b_currency": row.currency, "mrr": total[0], "active_subscriptions": total[1]})
+    if values:
+        session.execute(
+            update(table)
+            .where(table.c.day == bindparam('b_day'), table.c.currency == bindparam('b_currency'))
+            .values(mrr=bindparam('mrr'), active_subscriptions=bindparam('active_subscriptions')),
+            values,
+        )
+    return len(values)
+
+
+_worker_engine = None
+
+
+def _init_worker(database_url):
+    global _worker_engine
+    _worker_engine = create_engine(database_url)
+
+
+def _compute_range(start, end):
+    with Session(_worker_engine) as session:
+        return compute_flows(session, start, end)
+
+
+def _ranges(start, end, chunk_days):
+    while start < end:
+        yield start, min(end, start + timedelta(days=chunk_days))
+        start += timedelta(days=chunk_days)
+
+
+def backfill_revenue(start, end, workers=1, chunk_days=31):
+    """Recomputes the rows of every day in `[start, end)` and the totals of
+    every later row, in one transaction. The range is read `chunk_days` at
+    a time, by a pool of `workers` processes when there is more than one,
+    each with its own connection."""
+    ranges = list(_ranges(start, end, chunk_days))
+    flows = {}
+    if workers > 1 and len(ranges) > 1:
+        url = db.engine.url.render_as_string(hide_password=False)
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), initializer=_init_worker, initargs=(url,)) as pool:
+            for result in pool.map(_compute_range, *zip(*ranges)):
+                flows.update(result)
+    else:
+        for range_start, range_end in ranges:
+            flows.update(compute_flows(db.session, range_start, range_end))
+
+    _write_flows(db.session, (start, end), flows)
+    _roll_forward(db.session, start)
+    db.session.commit()
+    return {"days": (end - start).days, "rows": sum(1 for bucket in flows.values() if any(bucket.values()))}
+
+
+def load_watermark():
+    checkpoint = JobCheckpoint.find_by_name(ROLLUP_CHECKPOINT)
+    if not checkpoint or not checkpoint.value:
+        return None
+    return datetime.fromisoformat(json.loads(checkpoint.value)['updated_at'])
+
+
+def save_watermark(value):
+    checkpoint = JobCheckpoint.find_by_name(ROLLUP_CHECKPOINT) or JobCheckpoint(name=ROLLUP_CHECKPOINT)
+    checkpoint.value = json.dumps({"updated_at": value.isoformat()})
+    checkpoint.save_without_commit()
+
+
+def _contiguous(days):
+    days = sorted(days)
+    start = previous = days[0]
+    for day in days[1:]:
+        if day != previous + timedelta(days=1):
+            yield start, previous + timedelta(days=1)
+            start = day
+        previous = day
+    yield start, previous + timedelta(days=1)
+
+
+def roll_up_revenue(now=None, workers=1, chunk_days=31):
+    """Brings the rollup up to date with the subscriptions updated since the
+    last run, recomputing only the days they were created or ended on. The
+    first run backfills every day since the first subscription."""
+    now = now or datetime.now(timezone.utc)
+    watermark = load_watermark()
+
+    if watermark is None:
+        first = db.session.execute(select(func.min(Subscription.created_at))).scalar()
+        stats = {"days": 0, "rows": 0}
+        if first is not None:
+            stats = backfill_revenue(_day(first), _day(now) + timedelta(days=1), workers=workers, chunk_days=chunk_days)
+        save_watermark(now)
+        db.session.commit()
+        return dict(stats, subscriptions=None)
+
+    changed = db.session.execute(
+        select(Subscription.created_at, Subscription.ended_at)
+        .where(Subscription.updated_at >= watermark - WATERMARK_OVERLAP)
+        .execution_options(yield_per=10000)
+    )
+    days = set()
+    subscriptions = 0
+    for created_at, ended_at in changed:
+        subscriptions += 1
+        days.add(_day(created_at))
+        if ended_at is not None:
+            days.add(_day(ended_at))
+
+    flows = {}
+    for start, end in _contiguous(days) if days else ():
+        flows.update(compute_flows(db.session, start, end))
+    _write_flows(db.session, days, flows)
+    if days:
+        _roll_forward(db.session, min(days))
+    save_watermark(now)
+    db.session.commit()
+    return {"days": len(days), "rows": sum(1 for bucket in flows.values() if any(bucket.values())), "subscriptions": subscriptions}
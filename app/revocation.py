@@ -0,0 +1,251 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+from sqlalchemy import and_, delete, or_, select
+from . import db
+from .models import TokenRevocation
+from app import logger
+
+
+# rows committed by other workers while a refresh was reading are picked up
+# by the next one
+REFRESH_OVERLAP = timedelta(seconds=10)
+
+
+class BloomFilter:
+    """Set membership with no false negatives and about `error_rate` false
+    positives while it holds at most `capacity` keys."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        """Adds `key`; `count` only grows when it sets a new bit, so adding a
+        key again (or one the filter already seemed to hold) is free."""
+        added = False
+        for position in self._positions(key):
+            byte, bit = position >> 3, 1 << (position & 7)
+            if not self._bits[byte] & bit:
+                self._bits[byte] |= bit
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, key):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+def _key(jti, user_id):
+    if jti is not None:
+        return f'jti:{jti}'
+    return f'user:{user_id}'
+
+
+class RevocationList:
+    """Answers "is this token revoked?" from a per-worker Bloom filter over
+    the token_revocations table, so the common case, a token that was never
+    revoked, costs no query. Only filter hits are looked up in the table.
+
+    Revocations made by this worker are added to the filter immediately; a
+    background thread picks up everyone else's every `refresh_interval`
+    seconds and rebuilds the filter every `rebuild_interval` seconds, or
+    once it is over capacity, dropping revocations whose tokens expired.
+    With `refresh_interval` set to 0 no thread is started and the filter is
+    only reloaded by calling `refresh()` or `rebuild()`.
+    """
+
+    def __init__(self, app, capacity=100000, error_rate=0.001, refresh_interval=2, rebuild_interval=300):
+        self._app = app
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._refresh_interval = refresh_interval
+        self._rebuild_interval = rebuild_interval
+        self._filter = None
+        self._refreshed_until = None
+        self._built_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def is_revoked(self, payload):
+        candidate = self.candidate(payload)
+        return candidate is not None and self.lookup(*candidate)
+
+    def candidate(self, payload):
+        """The `(jti, user_id, iat)` that `lookup()` has to check for
+        `payload`, or None when the filter rules out a revocation. Only
+        builds the filter, with a query, on its first use."""
+        if self._filter is None:
+            self.rebuild()
+        if self._refresh_interval:
+            self._ensure_thread()
+
+        jti = payload.get('jti')
+        user_id = payload.get(self._app.config['JWT_IDENTITY_CLAIM'])
+        bloom = self._filter
+        token_hit = jti is not None and _key(jti, None) in bloom
+        user_hit = user_id is not None and _key(None, user_id) in bloom
+        if not (token_hit or user_hit):
+            return None
+        return jti if token_hit else None, user_id if user_hit else None, payload.get('iat')
+
+    def lookup(self, jti, user_id, iat):
+        """Whether a revocation of `jti`, or of the tokens of `user_id` issued
+        at `iat`, is stored and unexpired."""
+        conditions = []
+        if jti is not None:
+            conditions.append(TokenRevocation.jti == jti)
+        if user_id is not None:
+            issued_at = datetime.fromtimestamp(iat or 0, timezone.utc)
+            conditions.append(and_(
+                TokenRevocation.jti.is_(None),
+                TokenRevocation.user_id == user_id,
+                TokenRevocation.issued_before > issued_at,
+            ))
+        with self._app.app_context():
+            with db.engine.connect() as connection:
+                return connection.execute(
+                    select(TokenRevocation.id)
+                    .where(or_(*conditions))
+                    .where(TokenRevocation.expires_at > datetime.now(timezone.utc))
+                    .limit(1)
+                ).first() is not None
+
+    def add(self, jti=None, user_id=None):
+        """Adds a revocation that was just committed by this worker."""
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(_key(jti, user_id))
+
+    def _load(self, since=None):
+        now = datetime.now(timezone.utc)
+        statement = select(TokenRevocation.jti, TokenRevocation.user_id).where(TokenRevocation.expires_at > now)
+        if since is not None:
+            statement = statement.where(TokenRevocation.created_at >= since)
+        with self._app.app_context():
+            with db.engine.connect() as connection:
+                return now, connection.execute(statement).all()
+
+    def refresh(self):
+        """Adds the revocations committed since the last refresh."""
+        if self._filter is None:
+            return self.rebuild()
+        started, rows = self._load(self._refreshed_until - REFRESH_OVERLAP)
+        with self._lock:
+            for jti, user_id in rows:
+                self._filter.add(_key(jti, user_id))
+            self._refreshed_until = started
+        return len(rows)
+
+    def rebuild(self):
+        """Replaces the filter with one holding only unexpired revocations."""
+        started, rows = self._load()
+        bloom = BloomFilter(max(self._capacity, 2 * len(rows)), self._error_rate)
+        for jti, user_id in rows:
+            bloom.add(_key(jti, user_id))
+        with self._lock:
+            self._filter = bloom
+            self._refreshed_until = started
+            self._built_at = time.monotonic()
+        return len(rows)
+
+    def _ensure_thread(self):
+        # threads do not survive a fork, so a forked worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='token-revocations', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self._refresh_interval)
+            try:
+                bloom = self._filter
+                if time.monotonic() - self._built_at >= self._rebuild_interval or bloom.count > bloom.capacity:
+                    self.rebuild()
+                else:
+                    self.refresh()
+            except Exception as e:
+                logger.error(f"Error refreshing token revocations: {e}")
+
+
+def revocation_list():
+    return current_app.extensions['token_revocations']
+
+
+def _token_revocation(payload):
+    return TokenRevocation(
+        jti=payload['jti'],
+        user_id=payload.get(current_app.config['JWT_IDENTITY_CLAIM']),
+        expires_at=datetime.fromtimestamp(payload['exp'], timezone.utc),
+    )
+
+
+def revoke_token(payload):
+    """Revokes one access token until it expires."""
+    revocation = _token_revocation(payload)
+    revocation.save_to_db()
+    revocation_list().add(jti=revocation.jti)
+
+
+def revoke_user(user_id, payload=None):
+    """Revokes every access token issued to `user_id` before the current
+    second, and the token `payload` when the user revokes their own.
+
+    `iat` is in whole seconds, so a token issued later in this second, such
+    as one from logging in again straight away, stays valid; the caller's
+    token is revoked by its `jti` instead."""
+    now = datetime.now(timezone.utc)
+    revocation = TokenRevocation(
+        user_id=user_id,
+        issued_before=now.replace(microsecond=0),
+        expires_at=now + current_app.config['JWT_ACCESS_TOKEN_EXPIRES'],
+    )
+    revocation.save_without_commit()
+    if payload is not None:
+        _token_revocation(payload).save_without_commit()
+    revocation.commit()
+    revocation_list().add(user_id=user_id)
+    if payload is not None:
+        revocation_list().add(jti=payload['jti'])
+
+
+def purge_expired_revocations(now=None):
+    now = now or datetime.now(timezone.utc)
+    result = db.session.execute(delete(TokenRevocation).where(TokenRevocation.expires_at <= now))
+    db.session.commit()
+    return result.rowcount
+
+
+def init_app(app):
+    revocations = app.extensions['token_revocations'] = RevocationList(
+        app,
+        capacity=app.config['TOKEN_REVOCATION_FILTER_CAPACITY'],
+        error_rate=app.config['TOKEN_REVOCATION_FILTER_ERROR_RATE'],
+        refresh_interval=app.config['TOKEN_REVOCATION_REFRESH_INTERVAL'],
+        rebuild_interval=app.config['TOKEN_REVOCATION_REBUILD_INTERVAL'],
+    )
+
+    jwt = app.extensions['flask-jwt-extended']
+
+    @jwt.token_in_blocklist_loader
+    def is_token_revoked(jwt_header, jwt_payload):
+        return revocations.is_revoked(jwt_payload)
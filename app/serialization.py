@@ -0,0 +1,109 @@
+from flask import request, has_request_context
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the stdlib encoder is used instead
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - responses are always JSON then
+    msgpack = None
+
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+
+def format_datetime(value):
+    """`YYYY-MM-DD HH:MM:SS`, as `strftime("%Y-%m-%d %H:%M:%S")` renders it,
+    without parsing a format string."""
+    if value is None:
+        return None
+    return f"{value.year:04d}-{value.month:02d}-{value.day:02d} {value.hour:02d}:{value.minute:02d}:{value.second:02d}"
+
+
+def format_isoformat(value):
+    if value is None:
+        return None
+    return value.isoformat()
+
+
+def best_mimetype(accept_mimetypes):
+    """MessagePack when `accept_mimetypes` prefers it and msgpack is installed."""
+    if msgpack is None:
+        return JSON_MIMETYPE
+    return accept_mimetypes.best_match([JSON_MIMETYPE, MSGPACK_MIMETYPE], default=JSON_MIMETYPE)
+
+
+def negotiated_mimetype():
+    if not has_request_context():
+        return JSON_MIMETYPE
+    return best_mimetype(request.accept_mimetypes)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Encodes with orjson when it is installed and negotiates MessagePack
+    responses through the `Accept` header.
+
+    Output matches the default provider: sorted keys, compact separators
+    (indented in debug mode) and datetimes as HTTP dates.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        return self._orjson_dumps(obj, indent=kwargs.get('indent')).decode()
+
+    def _orjson_dumps(self, obj, indent=None):
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def encode(self, obj, mimetype=JSON_MIMETYPE):
+        """Returns the response body for `obj` in the given format as bytes."""
+        if mimetype == MSGPACK_MIMETYPE:
+            return msgpack.packb(obj, default=self.default)
+
+        indent = self._indent()
+        if orjson is None:
+            if indent:
+                return f"{super().dumps(obj, indent=indent)}\n".encode()
+            return f"{super().dumps(obj, separators=(',', ':'))}\n".encode()
+        return self._orjson_dumps(obj, indent=indent) + b"\n"
+
+    def _indent(self):
+        return 2 if (self.compact is None and self._app.debug) or self.compact is False else None
+
+    def encode_document(self, obj):
+        """Compact JSON bytes for a response body that is stored pre-rendered
+        and served later through `encode_stored()`."""
+        if orjson is None:
+            return super().dumps(obj, separators=(',', ':')).encode()
+        return self._orjson_dumps(obj)
+
+    def encode_stored(self, document, mimetype=JSON_MIMETYPE):
+        """The response body for an `encode_document()` document, the same
+        bytes `encode()` gives for the object. Compact JSON is served as is,
+        without decoding it."""
+        if mimetype == JSON_MIMETYPE and self._indent() is None:
+            return document + b"\n"
+        return self.encode(self.loads(document), mimetype)
+
+    def make_response(self, body, mimetype, status=None):
+        response = self._app.response_class(body, status=status, mimetype=mimetype)
+        response.vary.add('Accept')
+        return response
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        mimetype = negotiated_mimetype()
+        return self.make_response(self.encode(obj, mimetype), mimetype)
+
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
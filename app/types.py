@@ -0,0 +1,36 @@
+import uuid
+from sqlalchemy.types import BINARY, TypeDecorator
+
+
+class BinaryUUID(TypeDecorator):
+    """Stores a UUID in 16 bytes while the application keeps working with
+    canonical `xxxxxxxx-xxxx-xxxx-xxxx-xxxxxxxxxxxx` strings.
+
+    Byte order is the plain RFC 4122 order, so ordering by the column matches
+    ordering by the string form.
+    """
+
+    impl = BINARY(16)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, uuid.UUID):
+            return value.bytes
+        return uuid.UUID(str(value)).bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return str(uuid.UUID(bytes=bytes(value)))
+
+    def process_literal_param(self, value, dialect):
+        # only used when rendering SQL with literal binds (offline mode)
+        if value is None:
+            return 'NULL'
+        return f"X'{uuid.UUID(str(value)).hex}'"
+
+
+def new_uuid():
+    return str(uuid.uuid4())
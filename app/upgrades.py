@@ -0,0 +1,101 @@
+from collections import defaultdict, deque, namedtuple
+from flask import current_app
+from . import db
+from .cache import VersionedCache
+from .catalog import catalog_version, PlanSnapshot, IntervalSnapshot, PriceSnapshot
+from .models import Plan, PlanInterval, PlanIntervalPrice, PlanUpgrade
+from .replicas import on_primary
+
+
+UpgradeOption = namedtuple('UpgradeOption', ['plan', 'interval', 'price', 'path'])
+
+
+class UpgradeGraph:
+    """Immutable view of the active upgrade edges between plans, together
+    with the active prices every plan can be bought at."""
+
+    def __init__(self, edges, prices):
+        self._edges = {old: tuple(sorted(new)) for old, new in edges.items()}
+        self._prices = {plan_id: tuple(options) for plan_id, options in prices.items()}
+
+    def allows(self, old_plan_id, new_plan_id):
+        return new_plan_id in self._edges.get(old_plan_id, ())
+
+    def reachable(self, plan_id, max_hops=1):
+        """Returns `{target_plan_id: path}` for every plan reachable in at most
+        `max_hops` upgrades, where `path` is the shortest chain of plan ids
+        from `plan_id` (excluded) to the target (included)."""
+        paths = {plan_id: ()}
+        queue = deque([plan_id])
+        while queue:
+            current = queue.popleft()
+            path = paths[current]
+            if len(path) >= max_hops:
+                continue
+            for target in self._edges.get(current, ()):
+                if target not in paths:
+                    paths[target] = path + (target,)
+                    queue.append(target)
+        del paths[plan_id]
+        return paths
+
+    def shortest_path(self, old_plan_id, new_plan_id, max_hops=None):
+        return self.reachable(old_plan_id, max_hops or len(self._edges) or 1).get(new_plan_id)
+
+    def prices(self, plan_id):
+        """The active `(plan, interval, price)` snapshots of a plan."""
+        return self._prices.get(plan_id, ())
+
+    def eligible(self, subscription, max_hops=1):
+        """Every target price `subscription` can be upgraded to, applying the
+        same rules as the upgrade endpoint: same billing interval, active plan,
+        interval and price, and no cheaper than what was paid."""
+        options = []
+        for target, path in self.reachable(subscription.plan_id, max_hops).items():
+            for plan, interval, price in self.prices(target):
+                if interval.interval != subscription.interval or price.amount < subscription.amount_paid:
+                    continue
+                options.append(UpgradeOption(plan, interval, price, path))
+        options.sort(key=lambda option: (len(option.path), option.price.amount, option.plan.name, option.price.currency))
+        return options
+
+
+@on_primary
+def load_upgrade_graph():
+    edges = defaultdict(set)
+    for old_plan_id, new_plan_id in (
+            db.session.query(PlanUpgrade.old_plan_id, PlanUpgrade.new_plan_id)
+            .filter(PlanUpgrade.is_active == True)
+            ):
+        edges[old_plan_id].add(new_plan_id)
+
+    rows = (
+            db.session.query(
+                Plan.id, Plan.name, Plan.description,
+                PlanInterval.id, PlanInterval.interval, PlanInterval.interval_count,
+                PlanIntervalPrice.id, PlanIntervalPrice.currency, PlanIntervalPrice.amount,
+            )
+            .join(PlanInterval, Plan.id == PlanInterval.plan_id)
+            .join(PlanIntervalPrice, PlanInterval.id == PlanIntervalPrice.interval_id)
+            .filter(Plan.is_active == True)
+            .filter(PlanInterval.is_active == True)
+            .filter(PlanIntervalPrice.is_active == True)
+            )
+    prices = defaultdict(list)
+    for plan_id, name, description, interval_id, interval, interval_count, price_id, currency, amount in rows:
+        prices[plan_id].append((
+            PlanSnapshot(plan_id, name, description),
+            IntervalSnapshot(interval_id, plan_id, interval, interval_count),
+            PriceSnapshot(price_id, interval_id, currency, amount),
+        ))
+    return UpgradeGraph(edges, prices)
+
+
+def upgrade_graph():
+    """The upgrade graph for the current catalog version, loaded at most once
+    per version however many requests ask for it."""
+    return current_app.extensions['upgrade_graph'].get('graph', load_upgrade_graph)
+
+
+def init_app(app):
+    app.extensions['upgrade_graph'] = VersionedCache(catalog_version, max_entries=1)
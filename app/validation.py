@@ -0,0 +1,78 @@
+"""Request schemas, built once per process.
+
+Instantiating a marshmallow schema copies its declared fields (and, for
+nested ones, builds the nested schemas on first use), which the endpoints
+used to pay on every request. `validator()` returns one shared object per
+schema class instead. Sharing is safe across threads and greenlets: a
+marshmallow 4 `load()` keeps its state (the error store, the result) in
+locals and only reads the schema.
+
+Flat schemas, whose fields are all scalars and which have no hooks or
+schema validators (`{price_id}`, `{subscription_id, new_price_id}`...),
+get a `FlatValidator`: the same field `deserialize()` calls and error
+messages, without marshmallow's load machinery around them. Every other
+schema is loaded by its shared marshmallow instance.
+"""
+from collections.abc import Mapping
+from functools import lru_cache
+from marshmallow import EXCLUDE, RAISE, ValidationError, fields
+from marshmallow.utils import missing
+
+
+SCALAR_FIELDS = (
+    fields.UUID, fields.String, fields.Integer, fields.Boolean, fields.Date,
+    fields.DateTime, fields.Decimal, fields.Float,
+)
+
+
+class FlatValidator:
+    """Loads data into a dict like `schema.load(data)` does, for a schema
+    `is_flat()` accepts, raising the same ValidationError messages."""
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.fields = [
+            (field.data_key if field.data_key is not None else name, field.attribute or name, field)
+            for name, field in schema.load_fields.items()
+        ]
+        self.known = frozenset(data_key for data_key, _, _ in self.fields)
+        self.raise_unknown = schema.unknown == RAISE
+        self.type_error = schema.error_messages["type"]
+        self.unknown_error = schema.error_messages["unknown"]
+
+    def load(self, data):
+        if not isinstance(data, Mapping):
+            raise ValidationError({"_schema": [self.type_error]}, data=data)
+
+        result, errors = {}, {}
+        for data_key, attribute, field in self.fields:
+            try:
+                value = field.deserialize(data.get(data_key, missing), data_key, data)
+            except ValidationError as err:
+                errors[data_key] = err.messages
+                continue
+            if value is not missing:
+                result[attribute] = value
+        if self.raise_unknown:
+            for key in data:
+                if key not in self.known:
+                    errors[key] = [self.unknown_error]
+        if errors:
+            raise ValidationError(errors, data=data, valid_data=result)
+        return result
+
+
+def is_flat(schema):
+    if schema.many or schema.partial or schema.unknown not in (RAISE, EXCLUDE):
+        return False
+    if any(schema._hooks.values()):
+        return False
+    return all(isinstance(field, SCALAR_FIELDS) for field in schema.load_fields.values())
+
+
+@lru_cache(maxsize=None)
+def validator(schema_class):
+    """The process-wide validator of `schema_class`: a `FlatValidator` when
+    the schema is flat, its shared instance otherwise. Both have `load()`."""
+    schema = schema_class()
+    return FlatValidator(schema) if is_flat(schema) else schema
@@ -0,0 +1,160 @@
+"""Warm-up of a worker before it takes traffic.
+
+A fresh worker used to open its database connections and build its caches
+on its first requests, which were slow while every worker was cold during a
+deploy. `warm_up()` does that work up front: it opens each engine's
+pool_size connections, loads the catalog version, the plan catalog of every
+stored currency, the upgrade graph and the token revocation filter, builds
+the request validators and the password hasher's method prefix, and times
+each step.
+
+The gunicorn config (`gunicorn.conf.py`) runs it in every worker before the
+worker accepts connections. `GET /internal/ready` answers 503 until it has
+succeeded when `WARM_UP_REQUIRED` is set (production), and retries a failed
+warm-up when asked.
+"""
+import os
+import threading
+import time
+from marshmallow import Schema
+from sqlalchemy import select, text
+from sqlalchemy.pool import QueuePool
+from . import db
+from app import logger
+
+
+class WarmUpState:
+    """Whether this worker is ready, and how long getting there took."""
+
+    def __init__(self, required):
+        self.required = required
+        self.startup = {}
+        self.steps = None
+        self.seconds = None
+        self.error = None
+        self.lock = threading.Lock()
+
+    @property
+    def ready(self):
+        if self.steps is None:
+            return not self.required
+        return self.error is None
+
+    def record_startup(self, **seconds):
+        """Records how long the process took to import and create the app."""
+        self.startup.update({name: round(value, 4) for name, value in seconds.items()})
+
+    def as_dict(self):
+        return {
+            "ready": self.ready,
+            "pid": os.getpid(),
+            "startup": self.startup,
+            "warm_up": {"seconds": self.seconds, "steps": self.steps, "error": self.error},
+        }
+
+
+def open_connections():
+    """Checks out pool_size connections of every engine at once, so the pool
+    keeps them open, and pings each. Returns how many were opened."""
+    opened = 0
+    for engine in db.engines.values():
+        size = engine.pool.size() if isinstance(engine.pool, QueuePool) else 1
+        connections = []
+        try:
+            for _ in range(max(size, 1)):
+                connection = engine.connect()
+                connections.append(connection)
+                connection.execute(text('SELECT 1'))
+        finally:
+            for connection in connections:
+                connection.close()
+        opened += len(connections)
+    return opened
+
+
+def prime_plan_catalog():
+    """Caches the JSON plan catalog of every currency that has a stored
+    document, as `GET /api/v1/plan` would. Returns how many were cached."""
+    from flask import current_app
+    from .api.plan import build_plan_catalog
+    from .catalog import plan_catalog_cache
+    from .models import PlanCatalog
+    from .plan_catalog import ALL_CURRENCIES
+    from .serialization import JSON_MIMETYPE
+
+    currencies = db.session.execute(select(PlanCatalog.currency)).scalars().all()
+    keys = [None] + [currency for currency in currencies if currency != ALL_CURRENCIES]
+    for currency in keys:
+        plan_catalog_cache().get(
+            (currency, JSON_MIMETYPE),
+            lambda currency=currency: current_app.json.encode_stored(build_plan_catalog(currency), JSON_MIMETYPE),
+        )
+    return len(keys)
+
+
+def build_validators():
+    from .api import auth, plan, subscription
+    from .validation import validator
+
+    built = 0
+    for module in (auth, plan, subscription):
+        for value in vars(module).values():
+            if isinstance(value, type) and issubclass(value, Schema) and value.__module__ == module.__name__:
+                validator(value)
+                built += 1
+    return built
+
+
+def _steps():
+    """`(name, step, counted)`: counted steps return how many items they
+    warmed."""
+    from .catalog import catalog_version
+    from .passwords import password_hasher
+    from .revocation import revocation_list
+    from .upgrades import upgrade_graph
+
+    return (
+        ('connections', open_connections, True),
+        ('catalog_version', catalog_version, False),
+        ('plan_catalog', prime_plan_catalog, True),
+        ('upgrade_graph', upgrade_graph, False),
+        ('token_revocations', lambda: revocation_list().rebuild(), True),
+        ('validators', build_validators, True),
+        # the first needs_rehash() otherwise hashes a password inside a login
+        ('password_hasher', lambda: password_hasher().needs_rehash(''), False),
+    )
+
+
+def warm_up(app):
+    """Runs every warm-up step in an app context, unless an earlier call
+    succeeded. Returns the state; a failed step is logged and recorded, and
+    leaves the worker not ready."""
+    state = app.extensions['warm_up']
+    with state.lock:
+        if state.steps is not None and state.error is None:
+            return state
+
+        steps, started = {}, time.perf_counter()
+        try:
+            with app.app_context():
+                try:
+                    for name, step, counted in _steps():
+                        step_started = time.perf_counter()
+                        result = step()
+                        steps[name] = {"seconds": round(time.perf_counter() - step_started, 4)}
+                        if counted:
+                            steps[name]["count"] = result
+                finally:
+                    db.session.remove()
+        except Exception as e:
+            logger.error(f"Warm-up failed: {e}")
+            state.error = str(e)
+        else:
+            state.error = None
+        state.steps = steps
+        state.seconds = round(time.perf_counter() - started, 4)
+    return state
+
+
+def init_app(app):
+    app.extensions['warm_up'] = WarmUpState(app.config['WARM_UP_REQUIRED'])
@@ -0,0 +1,124 @@
+import atexit
+import os
+import threading
+import weakref
+from datetime import datetime, timezone
+from flask import current_app
+from sqlalchemy import bindparam, or_, update
+from . import db
+from .models import User
+from app import logger
+
+
+# one exit handler per process, flushing every buffer still alive, however
+# many apps were created
+_buffers = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_at_exit():
+    for buffer in list(_buffers):
+        buffer._flush_at_exit()
+
+
+class LastLoginBuffer:
+    """Buffers `User.last_login` timestamps in memory and writes them in
+    batches, off the login request path.
+
+    A background thread flushes every `flush_interval` seconds, or as soon as
+    `max_pending` users are waiting. With `flush_interval` set to 0 no thread
+    is started and the buffer only flushes when full or when `flush()` is
+    called. Pending timestamps are also flushed at interpreter exit.
+    """
+
+    def __init__(self, app, flush_interval=5, max_pending=500):
+        self._app = app
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        _buffers.add(self)
+
+    def record(self, user_id, timestamp=None):
+        timestamp = timestamp or datetime.now(timezone.utc)
+        with self._lock:
+            if user_id not in self._pending or self._pending[user_id] < timestamp:
+                self._pending[user_id] = timestamp
+            full = len(self._pending) >= self._max_pending
+
+        if self._flush_interval:
+            self._ensure_thread()
+            if full:
+                self._wakeup.set()
+        elif full:
+            self.flush()
+
+    def _ensure_thread(self):
+        # threads do not survive a fork, so a forked worker starts its own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='last-login-flusher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self._flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing last login timestamps: {e}")
+
+    def _flush_at_exit(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing last login timestamps at exit: {e}")
+
+    def flush(self):
+        """Writes every pending timestamp in one transaction and returns the
+        number of users written."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            users = User.__table__
+            statement = (
+                update(users)
+                .where(users.c.id == bindparam('user_id'))
+                .where(or_(users.c.last_login.is_(None), users.c.last_login < bindparam('timestamp')))
+                .values(last_login=bindparam('timestamp'))
+            )
+            rows = [{"user_id": user_id, "timestamp": timestamp} for user_id, timestamp in pending.items()]
+            try:
+                with self._app.app_context():
+                    with db.engine.begin() as connection:
+                        connection.execute(statement, rows)
+            except Exception:
+                with self._lock:
+                    for user_id, timestamp in pending.items():
+                        if user_id not in self._pending or self._pending[user_id] < timestamp:
+                            self._pending[user_id] = timestamp
+                raise
+            return len(rows)
+
+
+def last_login_buffer():
+    return current_app.extensions['last_login_buffer']
+
+
+def init_app(app):
+    app.extensions['last_login_buffer'] = LastLoginBuffer(
+        app,
+        flush_interval=app.config['LAST_LOGIN_FLUSH_INTERVAL'],
+        max_pending=app.config['LAST_LOGIN_MAX_PENDING'],
+    )
@@ -0,0 +1,5 @@
+import os
+from app.asgi import create_asgi_app
+
+env = os.getenv('FLASK_ENV', 'development')
+app = create_asgi_app(env)
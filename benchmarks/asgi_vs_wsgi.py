@@ -0,0 +1,142 @@
+"""Serves the read endpoints from gunicorn+gevent (server:app) and from
+uvicorn (asgi:app) in turn, against the same database, and measures both
+under the same concurrent load.
+
+    python benchmarks/asgi_vs_wsgi.py --clients 32 --duration 10
+
+Requires gunicorn, gevent and uvicorn. Results are printed as JSON.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.common import ROOT, free_port, make_app, summarize
+
+SECRET_KEY = os.environ.get('SECRET_KEY', 'benchmark-secret-key-benchmark-secret')
+PATHS = ['/plan', '/subscription?limit=50']
+
+
+def seed(database_url, subscriptions):
+    from flask_jwt_extended import create_access_token
+    from app import db
+    from app.models import User, Plan, PlanInterval, PlanIntervalPrice, Subscription
+
+    app = make_app(database_url, SECRET_KEY=SECRET_KEY)
+    with app.app_context():
+        db.create_all()
+        user = User(first_name='Async', last_name='Reader', email='reader@example.com', password='x')
+        db.session.add(user)
+        prices = []
+        for i in range(20):
+            plan = Plan(name=f'Plan {i}', description='benchmark plan')
+            interval = PlanInterval(plan=plan, interval='month', interval_count=1)
+            prices.append(PlanIntervalPrice(interval=interval, currency='USD', amount=1000 + i))
+            db.session.add(plan)
+        db.session.flush()
+        start = datetime.now(timezone.utc)
+        for i in range(subscriptions):
+            price = prices[i % len(prices)]
+            db.session.add(Subscription(
+                user_id=user.id, plan_id=price.interval.plan_id, price_id=price.id, interval='month',
+                current_period_start=start - timedelta(days=i), current_period_end=start - timedelta(days=i - 30),
+                status='ended', amount_paid=price.amount,
+            ))
+        db.session.commit()
+        return create_access_token(identity=user.id, expires_delta=timedelta(hours=1))
+
+
+def get(url, token):
+    req = urllib.request.Request(url, headers={'Authorization': f'Bearer {token}'})
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def command(stack, port, clients, workers):
+    bind = f'127.0.0.1:{port}'
+    if stack == 'wsgi':
+        return [sys.executable, '-m', 'gunicorn', 'server:app', '--worker-class', 'gevent',
+                '--worker-connections', str(clients + 10), '-w', str(workers), '-b', bind]
+    return [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+            '--workers', str(workers), '--no-access-log']
+
+
+def run(stack, database_url, token, duration, clients, workers):
+    port = free_port()
+    env = dict(os.environ, FLASK_ENV='production', DATABASE_URL=database_url, SECRET_KEY=SECRET_KEY,
+               WEB_WORKER_CONNECTIONS=str(clients))
+    server = subprocess.Popen(command(stack, port, clients, workers), cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}/api/v1'
+    results = []
+    try:
+        for _ in range(100):
+            try:
+                get(f'{base}/plan', token)
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        for path in PATHS:
+            stop = threading.Event()
+            latencies, errors = [], []
+
+            def client():
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    status = get(f'{base}{path}', token)
+                    if status == 200:
+                        latencies.append(time.perf_counter() - started)
+                    else:
+                        errors.append(status)
+
+            threads = [threading.Thread(target=client) for _ in range(clients)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            time.sleep(duration)
+            stop.set()
+            for thread in threads:
+                thread.join()
+            results.append(dict(summarize(latencies, time.perf_counter() - started, len(errors)),
+                                stack=stack, route=f'GET {path}'))
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--stacks', nargs='+', default=['wsgi', 'asgi'], choices=['wsgi', 'asgi'])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--clients', type=int, default=32, help='concurrent clients')
+    parser.add_argument('--workers', type=int, default=1, help='server worker processes')
+    parser.add_argument('--subscriptions', type=int, default=500, help='subscriptions of the reading user')
+    parser.add_argument('--database-url', help='defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f'sqlite:///{os.path.join(tmp, "bench.db")}'
+        token = seed(database_url, args.subscriptions)
+        results = []
+        for stack in args.stacks:
+            results += run(stack, database_url, token, args.duration, args.clients, args.workers)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
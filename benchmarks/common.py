@@ -0,0 +1,53 @@
+import os
+import socket
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def make_app(database_url, **settings):
+    """Builds the app with the production settings pointed at `database_url`."""
+    from app import create_app
+    from config import config, ProductionConfig
+
+    settings.setdefault('SECRET_KEY', ProductionConfig.SECRET_KEY or 'benchmark-secret-key-benchmark-secret-key')
+    config['benchmark'] = type('BenchmarkConfig', (ProductionConfig,), dict(settings, SQLALCHEMY_DATABASE_URI=database_url))
+    return create_app('benchmark')
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Latencies are in seconds; the summary is in requests/s and ms."""
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p95_ms': ms(percentile(latencies, 95)),
+        'p99_ms': ms(percentile(latencies, 99)),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,41 @@
+"""Prints the per-route change between two benchmarks.run reports.
+
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import json
+
+METRICS = ['throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms']
+
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return 'n/a'
+    return f'{(after - before) / before * 100:+.1f}%'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = {result['route']: result for result in json.load(f)['results']}
+    with open(args.after) as f:
+        after = {result['route']: result for result in json.load(f)['results']}
+
+    print(f"{'route':40} " + ' '.join(f'{metric:>22}' for metric in METRICS))
+    for route, result in after.items():
+        previous = before.get(route)
+        cells = []
+        for metric in METRICS:
+            if previous is None:
+                cells.append(f'{result[metric]!s:>22}')
+            else:
+                cells.append(f'{result[metric]!s:>12} {change(previous[metric], result[metric]):>9}')
+        print(f'{route:40} ' + ' '.join(cells))
+
+
+if __name__ == '__main__':
+    main()
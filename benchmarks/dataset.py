@@ -0,0 +1,156 @@
+"""Seeds a synthetic dataset with multi-row inserts.
+
+    python -m benchmarks.dataset --database-url sqlite:///bench.db --scale 100k
+
+Every user gets the same password (PASSWORD), so any seeded user can log in.
+Each user owns SUBSCRIPTIONS_PER_USER subscriptions on consecutive plans: an
+ended one, the active subscription it was upgraded to, and two more active
+ones, every fifth of them cancelled.
+"""
+import argparse
+import random
+from datetime import datetime, timedelta, timezone
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models import User, Plan, PlanInterval, PlanIntervalPrice, PlanUpgrade, Subscription
+from app.types import new_uuid
+from benchmarks.common import make_app
+
+SCALES = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+
+PASSWORD = 'benchmark-password'
+PLANS = 50
+CURRENCIES = {'USD': 100, 'EUR': 92, 'GBP': 80}
+INTERVALS = [('month', 1, 10), ('year', 1, 100)]
+SUBSCRIPTIONS_PER_USER = 4
+CHUNK_SIZE = 5_000
+
+
+def _insert(model, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(insert(model), rows[start:start + CHUNK_SIZE])
+
+
+def seed_catalog(now):
+    """Returns, per plan index, the plan id and its {interval: {currency: (price_id, amount)}}."""
+    plans, intervals, prices, upgrades, catalog = [], [], [], [], []
+    for index in range(PLANS):
+        plan_id = new_uuid()
+        plans.append({'id': plan_id, 'name': f'Benchmark Plan {index:03d}', 'description': 'synthetic plan',
+                      'created_at': now + timedelta(seconds=index)})
+        plan_prices = {}
+        for interval, count, multiplier in INTERVALS:
+            interval_id = new_uuid()
+            intervals.append({'id': interval_id, 'plan_id': plan_id, 'interval': interval, 'interval_count': count})
+            plan_prices[interval] = {}
+            for currency, rate in CURRENCIES.items():
+                amount = (500 + index * 100) * multiplier * rate // 100
+                price_id = new_uuid()
+                prices.append({'id': price_id, 'interval_id': interval_id, 'currency': currency, 'amount': amount})
+                plan_prices[interval][currency] = (price_id, amount)
+        catalog.append((plan_id, plan_prices))
+
+    for index in range(PLANS - 1):
+        upgrades.append({'old_plan_id': catalog[index][0], 'new_plan_id': catalog[index + 1][0]})
+        if index + 2 < PLANS:
+            upgrades.append({'old_plan_id': catalog[index][0], 'new_plan_id': catalog[index + 2][0]})
+
+    _insert(Plan, plans)
+    _insert(PlanInterval, intervals)
+    _insert(PlanIntervalPrice, prices)
+    _insert(PlanUpgrade, upgrades)
+    return catalog
+
+
+def seed_users(count, now, prefix='bench-user'):
+    password = generate_password_hash(PASSWORD)
+    users = [
+        {'id': new_uuid(), 'first_name': 'Bench', 'last_name': str(index),
+         'email': f'{prefix}-{index}@example.com', 'password': password, 'created_at': now}
+        for index in range(count)
+    ]
+    _insert(User, users)
+    return [user['id'] for user in users]
+
+
+def subscription_row(user_id, plan, interval, currency, start, status, **extra):
+    plan_id, plan_prices = plan
+    price_id, amount = plan_prices[interval][currency]
+    row = {
+        'id': new_uuid(),
+        'user_id': user_id,
+        'plan_id': plan_id,
+        'price_id': price_id,
+        'interval': interval,
+        'current_period_start': start,
+        'current_period_end': start + relativedelta(months=1 if interval == 'month' else 12),
+        'status': status,
+        'amount_paid': amount,
+        'created_at': start,
+    }
+    row.update(extra)
+    return row
+
+
+def seed_subscriptions(user_ids, catalog, count, now, rng):
+    rows = []
+    remaining = count
+    for user_index, user_id in enumerate(user_ids):
+        if remaining <= 0:
+            break
+        base = (user_index * 7) % (PLANS - SUBSCRIPTIONS_PER_USER)
+        currency = list(CURRENCIES)[user_index % len(CURRENCIES)]
+        start = now - timedelta(days=rng.randint(40, 400))
+        ended = subscription_row(user_id, catalog[base], 'month', currency, start, 'ended',
+                                 ended_at=start + timedelta(days=10))
+        user_rows = [
+            ended,
+            subscription_row(user_id, catalog[base + 1], 'month', currency, start + timedelta(days=10), 'active',
+                             upgraded_from_subscription_id=ended['id']),
+        ]
+        for offset in (2, 3):
+            created = now - timedelta(days=rng.randint(0, 25), seconds=rng.randint(0, 86_400))
+            canceled_at = created + timedelta(days=1) if (user_index + offset) % 5 == 0 else None
+            user_rows.append(subscription_row(user_id, catalog[base + offset], 'month', currency, created, 'active',
+                                              canceled_at=canceled_at))
+
+        user_rows = user_rows[:remaining]
+        remaining -= len(user_rows)
+        rows.extend(user_rows)
+        if len(rows) >= CHUNK_SIZE:
+            _insert(Subscription, rows)
+            rows = []
+    _insert(Subscription, rows)
+
+
+def seed(scale, seed_value=0):
+    """Seeds `scale` subscriptions (a number or a SCALES key) inside the
+    current app context and returns the plan catalog and seeded user ids."""
+    subscriptions = SCALES.get(scale, scale) if isinstance(scale, str) else scale
+    subscriptions = int(subscriptions)
+    rng = random.Random(seed_value)
+    now = datetime.now(timezone.utc)
+
+    catalog = seed_catalog(now - timedelta(days=500))
+    user_ids = seed_users(max(1, -(-subscriptions // SUBSCRIPTIONS_PER_USER)), now - timedelta(days=500))
+    seed_subscriptions(user_ids, catalog, subscriptions, now, rng)
+    db.session.commit()
+    return catalog, user_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True)
+    parser.add_argument('--scale', default='1k', help=f'one of {", ".join(SCALES)} or a number of subscriptions')
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    with app.app_context():
+        db.create_all()
+        seed(args.scale)
+
+
+if __name__ == '__main__':
+    main()
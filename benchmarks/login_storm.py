@@ -0,0 +1,129 @@
+"""Measures GET /api/v1/plan latency while a storm of logins hits the same
+gunicorn+gevent worker, once per password hasher executor.
+
+    python benchmarks/login_storm.py --executors inline thread --duration 10
+
+Requires gunicorn and gevent. Results are printed as JSON.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.common import ROOT, free_port, make_app, percentile
+
+EMAIL = 'storm@example.com'
+PASSWORD = 'storm-password'
+
+
+def seed(database_url):
+    from werkzeug.security import generate_password_hash
+    from app import db
+    from app.models import User, Plan, PlanInterval, PlanIntervalPrice
+
+    app = make_app(database_url)
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(first_name='Storm', last_name='User', email=EMAIL, password=generate_password_hash(PASSWORD)))
+        for i in range(20):
+            plan = Plan(name=f'Plan {i}', description='benchmark plan')
+            interval = PlanInterval(plan=plan, interval='month', interval_count=1)
+            PlanIntervalPrice(interval=interval, currency='USD', amount=1000 + i)
+            db.session.add(plan)
+        db.session.commit()
+
+
+def request(url, body=None, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def run(executor, database_url, duration, logins, readers):
+    port = free_port()
+    env = dict(os.environ, FLASK_ENV='production', DATABASE_URL=database_url,
+               SECRET_KEY=os.environ.get('SECRET_KEY', 'benchmark-secret-key-benchmark-secret'),
+               PASSWORD_HASHER_EXECUTOR=executor)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'server:app', '--worker-class', 'gevent',
+         '--worker-connections', str(logins + readers + 10), '-w', '1', '-b', f'127.0.0.1:{port}'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base = f'http://127.0.0.1:{port}/api/v1'
+    try:
+        for _ in range(100):
+            try:
+                status, body = request(f'{base}/auth/login', {'email': EMAIL, 'password': PASSWORD})
+                break
+            except OSError:
+                time.sleep(0.1)
+        token = json.loads(body)['token']
+
+        stop = threading.Event()
+        read_latencies, login_latencies = [], []
+
+        def reader():
+            while not stop.is_set():
+                started = time.perf_counter()
+                request(f'{base}/plan', token=token)
+                read_latencies.append(time.perf_counter() - started)
+
+        def login():
+            while not stop.is_set():
+                started = time.perf_counter()
+                request(f'{base}/auth/login', {'email': EMAIL, 'password': PASSWORD})
+                login_latencies.append(time.perf_counter() - started)
+
+        threads = [threading.Thread(target=reader) for _ in range(readers)]
+        threads += [threading.Thread(target=login) for _ in range(logins)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {
+        'executor': executor,
+        'plan_reads': len(read_latencies),
+        'plan_read_p50_ms': round(percentile(read_latencies, 50) * 1000, 2),
+        'plan_read_p99_ms': round(percentile(read_latencies, 99) * 1000, 2),
+        'logins': len(login_latencies),
+        'login_p99_ms': round(percentile(login_latencies, 99) * 1000, 2) if login_latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--executors', nargs='+', default=['inline', 'thread'])
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--logins', type=int, default=8, help='concurrent login clients')
+    parser.add_argument('--readers', type=int, default=4, help='concurrent plan read clients')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f'sqlite:///{os.path.join(tmp, "bench.db")}'
+        seed(database_url)
+        results = [run(executor, database_url, args.duration, args.logins, args.readers) for executor in args.executors]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Times bulk proration: the vectorized computation against the per-row one
+on synthetic arrays, and, with --database-url, the whole price change impact
+over every active subscription of a database seeded by benchmarks.dataset.
+
+    python -m benchmarks.proration --rows 1000000
+    python -m benchmarks.proration --database-url sqlite:///bench.db --amount 5000
+
+Results are printed as JSON.
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from app.proration import prorate, prorate_batch, price_change_impact, DAY_US
+from benchmarks.common import make_app
+
+SCALAR_SAMPLE = 100_000
+
+
+def synthetic(rows, seed=7):
+    rng = np.random.default_rng(seed)
+    now = int(datetime.now(timezone.utc).timestamp() * 1_000_000)
+    start = now - rng.integers(0, 30 * DAY_US, rows)
+    end = start + rng.choice([30, 31, 365], rows) * DAY_US
+    return rng.integers(100, 100_000, rows), start, end, now
+
+
+def compute(rows, new_amount):
+    amount_paid, start, end, now = synthetic(rows)
+
+    started = time.perf_counter()
+    eligible, credit, charge = prorate_batch(amount_paid, start, end, new_amount, now)
+    batch_seconds = time.perf_counter() - started
+
+    sample = min(rows, SCALAR_SAMPLE)
+    to_datetime = lambda micros: datetime.fromtimestamp(micros / 1_000_000, timezone.utc)
+    now_datetime = to_datetime(now)
+    inputs = [(int(amount_paid[i]), to_datetime(start[i]), to_datetime(end[i])) for i in range(sample)]
+    started = time.perf_counter()
+    for paid, period_start, period_end in inputs:
+        prorate(paid, period_start, period_end, new_amount, now=now_datetime)
+    scalar_seconds = (time.perf_counter() - started) * rows / sample
+
+    return {
+        'rows': rows,
+        'eligible': int(eligible.sum()),
+        'charge_total': int(charge[eligible].sum()),
+        'batch_seconds': round(batch_seconds, 4),
+        'scalar_seconds_estimated': round(scalar_seconds, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--amount', type=int, default=5000, help='new amount, in minor units')
+    parser.add_argument('--database-url', help='a database seeded with benchmarks.dataset')
+    parser.add_argument('--chunk-size', type=int, default=50_000)
+    args = parser.parse_args()
+
+    report = {'compute': compute(args.rows, args.amount)}
+    if args.database_url:
+        app = make_app(args.database_url)
+        with app.app_context():
+            started = time.perf_counter()
+            impact = price_change_impact(args.amount, chunk_size=args.chunk_size)
+            report['database'] = dict(impact, seconds=round(time.perf_counter() - started, 3))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Times the MRR rollup on a database seeded by benchmarks.dataset: a full
+backfill with one process and with a pool, then an incremental run after a
+small batch of changes.
+
+    python -m benchmarks.dataset --database-url sqlite:///bench.db --scale 100k
+    python -m benchmarks.revenue --database-url sqlite:///bench.db --workers 4
+
+Results are printed as JSON.
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, func, select, update
+from app import db
+from app.models import JobCheckpoint, RevenueRollup, Subscription
+from app.revenue import ROLLUP_CHECKPOINT, WATERMARK_OVERLAP, backfill_revenue, roll_up_revenue
+from benchmarks.common import make_app
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return dict(result, seconds=round(time.perf_counter() - started, 3))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True, help='a database seeded with benchmarks.dataset')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--chunk-days', type=int, default=31)
+    parser.add_argument('--changes', type=int, default=1000, help='subscriptions ended before the incremental run')
+    args = parser.parse_args()
+
+    app = make_app(args.database_url)
+    with app.app_context():
+        now = datetime.now(timezone.utc)
+        start = db.session.execute(select(func.min(Subscription.created_at))).scalar().date()
+        end = now.date() + timedelta(days=1)
+
+        report = {'subscriptions': db.session.execute(select(func.count()).select_from(Subscription)).scalar()}
+        report['backfill_serial'] = timed(lambda: backfill_revenue(start, end, workers=1, chunk_days=args.chunk_days))
+        report['backfill_parallel'] = timed(lambda: backfill_revenue(start, end, workers=args.workers, chunk_days=args.chunk_days))
+
+        db.session.execute(delete(JobCheckpoint).where(JobCheckpoint.name == ROLLUP_CHECKPOINT))
+        db.session.execute(delete(RevenueRollup))
+        db.session.commit()
+        # the dataset was seeded moments ago: the first run's watermark is
+        # moved past its rows so that only the changes below are read again
+        watermark = now + WATERMARK_OVERLAP
+        roll_up_revenue(now=watermark, workers=args.workers, chunk_days=args.chunk_days)
+
+        ids = db.session.execute(
+            select(Subscription.id).where(Subscription.status == 'active').limit(args.changes)
+        ).scalars().all()
+        db.session.execute(
+            update(Subscription).where(Subscription.id.in_(ids))
+            .values(status='ended', ended_at=now, updated_at=watermark + WATERMARK_OVERLAP, version=Subscription.version + 1)
+        )
+        db.session.commit()
+        report['incremental'] = timed(lambda: roll_up_revenue(now=watermark + WATERMARK_OVERLAP))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""Drives every /api/v1 route against a freshly seeded database and reports
+throughput and p50/p95/p99 latency per route as JSON.
+
+    python -m benchmarks.run --scale 1k --requests 200 --output before.json
+    python -m benchmarks.run --database-url mysql+pymysql://root:@localhost:3306/bench --scale 100k --wsgi
+
+Without --database-url a temporary SQLite file is used. The database is
+created and seeded by the run, so point --database-url at an empty schema.
+Requests go through the Flask test client, or through a local threaded WSGI
+server with --wsgi. Compare two result files with benchmarks.compare.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from flask_jwt_extended import create_access_token
+from sqlalchemy import insert
+from werkzeug.serving import make_server
+from app import db
+from app.models import Subscription
+from benchmarks import dataset
+from benchmarks.common import free_port, git_commit, make_app, summarize
+
+
+class Context:
+    def __init__(self, app, catalog, user_ids):
+        self.app = app
+        self.catalog = catalog
+        self.user_ids = user_ids
+        self.run_id = str(int(time.time() * 1000))
+
+    def headers(self, user_id, **claims):
+        return {'Authorization': f'Bearer {create_access_token(identity=user_id, additional_claims=claims)}'}
+
+    def fresh_users(self, count, tag):
+        return dataset.seed_users(count, datetime.now(timezone.utc), prefix=f'bench-{tag}-{self.run_id}')
+
+    def price(self, plan_index, interval='month', currency='USD'):
+        return self.catalog[plan_index % len(self.catalog)][1][interval][currency]
+
+
+def plan_payload(name):
+    return {
+        'name': name,
+        'description': 'benchmark plan',
+        'intervals': [
+            {'interval': 'month', 'interval_count': 1, 'prices': [{'currency': 'USD', 'amount': 1000}, {'currency': 'EUR', 'amount': 900}]},
+            {'interval': 'year', 'interval_count': 1, 'prices': [{'currency': 'USD', 'amount': 10000}]},
+        ],
+    }
+
+
+def active_subscriptions(ctx, user_ids, plan_index):
+    now = datetime.now(timezone.utc)
+    rows = [
+        dataset.subscription_row(user_id, ctx.catalog[plan_index], 'month', 'USD', now - timedelta(days=5), 'active')
+        for user_id in user_ids
+    ]
+    db.session.execute(insert(Subscription), rows)
+    return [row['id'] for row in rows]
+
+
+def get_plans(ctx, n):
+    headers = ctx.headers(ctx.user_ids[0])
+    return [('GET', '/api/v1/plan', None, headers)] * n
+
+
+def get_plans_by_currency(ctx, n):
+    headers = ctx.headers(ctx.user_ids[0])
+    return [('GET', '/api/v1/plan?currency=USD', None, headers)] * n
+
+
+def get_subscriptions(ctx, n):
+    return [('GET', '/api/v1/subscription', None, ctx.headers(ctx.user_ids[i % len(ctx.user_ids)])) for i in range(n)]
+
+
+def export_subscriptions(ctx, n):
+    headers = ctx.headers(ctx.user_ids[0], is_admin=True)
+    return [('GET', '/api/v1/subscription/export?status=active', None, headers)] * n
+
+
+def proration_impact(ctx, n):
+    headers = ctx.headers(ctx.user_ids[0], is_admin=True)
+    price_id, _ = ctx.price(1)
+    return [('GET', f'/api/v1/subscription/proration-impact?plan_id={ctx.catalog[0][0]}&new_price_id={price_id}', None, headers)] * n
+
+
+def subscription_counters(ctx, n):
+    headers = ctx.headers(ctx.user_ids[0], is_admin=True)
+    return [('GET', '/api/v1/subscription/counters', None, headers)] * n
+
+
+def login(ctx, n):
+    return [
+        ('POST', '/api/v1/auth/login', {'email': f'bench-user-{i % len(ctx.user_ids)}@example.com', 'password': dataset.PASSWORD}, None)
+        for i in range(n)
+    ]
+
+
+def register(ctx, n):
+    return [
+        ('POST', '/api/v1/auth/register',
+         {'first_name': 'Bench', 'last_name': 'Register', 'email': f'bench-register-{ctx.run_id}-{i}@example.com', 'password': 'benchmark'},
+         None)
+        for i in range(n)
+    ]
+
+
+def logout(ctx, n):
+    return [('POST', '/api/v1/auth/logout', None, ctx.headers(ctx.user_ids[i % len(ctx.user_ids)])) for i in range(n)]
+
+
+def logout_all(ctx, n):
+    # fresh users, so no request revokes a token another one is about to use
+    return [('POST', '/api/v1/auth/logout-all', None, ctx.headers(user_id)) for user_id in ctx.fresh_users(n, 'logout-all')]
+
+
+def revoke_sessions(ctx, n):
+    headers = ctx.headers(ctx.user_ids[0], is_admin=True)
+    return [('POST', '/api/v1/auth/revoke', {'user_id': user_id}, headers) for user_id in ctx.fresh_users(n, 'revoke')]
+
+
+def create_plan(ctx, n):
+    headers = ctx.headers(ctx.user_ids[0])
+    return [('POST', '/api/v1/plan', plan_payload(f'Bench {ctx.run_id} {i}'), headers) for i in range(n)]
+
+
+def create_plans_bulk(ctx, n):
+    headers = ctx.headers(ctx.user_ids[0])
+    return [
+        ('POST', '/api/v1/plan/bulk', {'plans': [plan_payload(f'Bulk {ctx.run_id} {i} {j}') for j in range(10)]}, headers)
+        for i in range(n)
+    ]
+
+
+def create_subscription(ctx, n):
+    user_ids = ctx.fresh_users(n, 'subscribe')
+    return [
+        ('POST', '/api/v1/subscription', {'price_id': ctx.price(i)[0]}, ctx.headers(user_id))
+        for i, user_id in enumerate(user_ids)
+    ]
+
+
+def replay_subscription(ctx, n):
+    # one client retrying the same request: the first runs, the rest replay
+    user_id = ctx.fresh_users(1, 'replay')[0]
+    headers = dict(ctx.headers(user_id), **{'Idempotency-Key': f'bench-{ctx.run_id}'})
+    return [('POST', '/api/v1/subscription', {'price_id': ctx.price(0)[0]}, headers)] * n
+
+
+def upgrade_subscription(ctx, n):
+    user_ids = ctx.fresh_users(n, 'upgrade')
+    subscription_ids = active_subscriptions(ctx, user_ids, 0)
+    return [
+        ('PATCH', '/api/v1/subscription_upgrade', {'subscription_id': subscription_id, 'new_price_id': ctx.price(1)[0]}, ctx.headers(user_id))
+        for user_id, subscription_id in zip(user_ids, subscription_ids)
+    ]
+
+
+def subscription_upgrades(ctx, n):
+    user_ids = ctx.fresh_users(n, 'upgrades')
+    subscription_ids = active_subscriptions(ctx, user_ids, 0)
+    return [
+        ('GET', f'/api/v1/subscription/{subscription_id}/upgrades?max_hops=3', None, ctx.headers(user_id))
+        for user_id, subscription_id in zip(user_ids, subscription_ids)
+    ]
+
+
+def cancel_subscription(ctx, n):
+    user_ids = ctx.fresh_users(n, 'cancel')
+    subscription_ids = active_subscriptions(ctx, user_ids, 0)
+    return [
+        ('PATCH', '/api/v1/subscription', {'subscription_id': subscription_id}, ctx.headers(user_id))
+        for user_id, subscription_id in zip(user_ids, subscription_ids)
+    ]
+
+
+SCENARIOS = [
+    ('GET /api/v1/plan', get_plans),
+    ('GET /api/v1/plan?currency', get_plans_by_currency),
+    ('GET /api/v1/subscription', get_subscriptions),
+    ('GET /api/v1/subscription/export', export_subscriptions),
+    ('GET /api/v1/subscription/proration-impact', proration_impact),
+    ('GET /api/v1/subscription/counters', subscription_counters),
+    ('POST /api/v1/auth/login', login),
+    ('POST /api/v1/auth/register', register),
+    ('POST /api/v1/auth/logout', logout),
+    ('POST /api/v1/auth/logout-all', logout_all),
+    ('POST /api/v1/auth/revoke', revoke_sessions),
+    ('POST /api/v1/plan', create_plan),
+    ('POST /api/v1/plan/bulk', create_plans_bulk),
+    ('POST /api/v1/subscription', create_subscription),
+    ('POST /api/v1/subscription (Idempotency-Key replay)', replay_subscription),
+    ('GET /api/v1/subscription/<id>/upgrades', subscription_upgrades),
+    ('PATCH /api/v1/subscription_upgrade', upgrade_subscription),
+    ('PATCH /api/v1/subscription', cancel_subscription),
+]
+
+
+class TestClientTransport:
+    def __init__(self, app):
+        self.app = app
+        self.local = threading.local()
+
+    def __call__(self, method, path, body, headers):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        return client.open(path, method=method, json=body, headers=headers).status_code
+
+
+class WSGITransport:
+    def __init__(self, app):
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self.server = make_server('127.0.0.1', free_port(), app, threaded=True)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def __call__(self, method, path, body, headers):
+        headers = dict(headers or {}, **{'Content-Type': 'application/json'})
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def close(self):
+        self.server.shutdown()
+
+
+def drive(transport, specs, concurrency):
+    latencies, errors = [], []
+    pending = iter(specs)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                spec = next(pending, None)
+            if spec is None:
+                return
+            started = time.perf_counter()
+            status = transport(*spec)
+            latency = time.perf_counter() - started
+            with lock:
+                latencies.append(latency)
+                if status >= 400:
+                    errors.append(status)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, time.perf_counter() - started, len(errors))
+
+
+def run(database_url, scale, requests, concurrency, use_wsgi, only=None):
+    app = make_app(database_url)
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        catalog, user_ids = dataset.seed(scale)
+        seed_seconds = time.perf_counter() - started
+
+        ctx = Context(app, catalog, user_ids)
+        transport = WSGITransport(app) if use_wsgi else TestClientTransport(app)
+        results = []
+        try:
+            for name, build in SCENARIOS:
+                if only and name not in only:
+                    continue
+                specs = build(ctx, requests)
+                db.session.commit()
+                result = drive(transport, specs, concurrency)
+                results.append(dict(route=name, **result))
+        finally:
+            if use_wsgi:
+                transport.close()
+        dialect = db.engine.dialect.name
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'database': dialect,
+            'scale': scale,
+            'seed_seconds': round(seed_seconds, 2),
+            'requests_per_route': requests,
+            'concurrency': concurrency,
+            'transport': 'wsgi' if use_wsgi else 'test_client',
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url')
+    parser.add_argument('--scale', default='1k', help=f'one of {", ".join(dataset.SCALES)} or a number of subscriptions')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--wsgi', action='store_true', help='go through a local WSGI server instead of the test client')
+    parser.add_argument('--route', action='append', help='only run the named route (repeatable)')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f'sqlite:///{os.path.join(tmp, "benchmark.db")}'
+        report = run(database_url, args.scale, args.requests, args.concurrency, args.wsgi, args.route)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Times a worker's startup in fresh processes, on a database seeded by
+benchmarks.dataset: importing the app, creating it, warming it up, and the
+first and second `GET /api/v1/plan` of a worker started cold and of one that
+warmed up first. Also lists the slowest imports of the app package
+(`-X importtime`).
+
+    python -m benchmarks.dataset --database-url sqlite:///bench.db --scale 1k
+    python -m benchmarks.startup --database-url sqlite:///bench.db --repeat 5
+
+Results are printed as JSON, medians over the runs, in seconds.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app('production')
+created = time.perf_counter()
+if {warm}:
+    from app.warmup import warm_up
+    warm_up(app)
+warmed = time.perf_counter()
+
+from flask_jwt_extended import create_access_token
+with app.app_context():
+    headers = {{'Authorization': 'Bearer ' + create_access_token(identity='startup-benchmark')}}
+client = app.test_client()
+requests = []
+for _ in range(2):
+    request_started = time.perf_counter()
+    assert client.get('/api/v1/plan', headers=headers).status_code == 200
+    requests.append(time.perf_counter() - request_started)
+print(json.dumps({{
+    'import': imported - started, 'create_app': created - imported, 'warm_up': warmed - created,
+    'first_request': requests[0], 'second_request': requests[1],
+}}))
+"""
+
+
+def probe(env, warm):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE.format(warm=warm)], cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env, count=10):
+    """The modules `import app` spends the most time on, among those it
+    imports itself."""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, env=env, check=True, capture_output=True, text=True,
+    ).stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # nested imports are indented two spaces per level under the
+        # module that triggered them, after one separating space
+        if len(name) - len(name.lstrip()) == 3:
+            imports.append((int(cumulative) / 1_000_000, name.strip()))
+    return [{'module': name, 'seconds': round(seconds, 4)} for seconds, name in sorted(imports, reverse=True)[:count]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True, help='a database seeded with benchmarks.dataset')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    env = dict(os.environ, FLASK_ENV='production', DATABASE_URL=args.database_url,
+               SECRET_KEY=os.environ.get('SECRET_KEY', 'benchmark-secret-key-benchmark-secret'))
+    report = {}
+    for name, warm in (('cold', False), ('warmed', True)):
+        runs = [probe(env, warm) for _ in range(args.repeat)]
+        report[name] = {key: round(statistics.median(run[key] for run in runs), 4) for key in runs[0]}
+    report['slowest_imports'] = slowest_imports(env)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Times request validation per schema, on a valid and an invalid payload
+each: a schema instantiated per request, as the endpoints used to do, one
+instance reused, and the shared validator `app.validation` gives them (the
+same instance, or a `FlatValidator` for flat schemas).
+
+    python -m benchmarks.validation --loops 20000
+
+Results are printed as JSON, in microseconds per load.
+"""
+import argparse
+import json
+import time
+import uuid
+from marshmallow import ValidationError
+from app.api.auth import LoginSchema, RevokeSessionsSchema, SignupSchema
+from app.api.plan import BulkCreatePlanSchema, CreatePlanSchema
+from app.api.subscription import (
+    CancelSubscriptionSchema, CreateSubscriptionSchema, ExportSubscriptionSchema, ListSubscriptionSchema,
+    ProrationImpactSchema, SubscriptionCountersSchema, UpgradeSubscriptionSchema,
+)
+from app.validation import FlatValidator, validator
+
+ID = str(uuid.uuid4())
+PLAN = {
+    "name": " Premium ", "description": "All features",
+    "intervals": [
+        {"interval": "month", "interval_count": 1, "prices": [{"currency": "USD", "amount": 1000}, {"currency": "EUR", "amount": 900}]},
+        {"interval": "year", "interval_count": 1, "prices": [{"currency": "USD", "amount": 10000}]},
+    ],
+}
+
+# schema: (valid payload, invalid payload)
+CASES = {
+    CreateSubscriptionSchema: ({"price_id": ID}, {"price_id": "nope"}),
+    UpgradeSubscriptionSchema: ({"subscription_id": ID, "new_price_id": ID}, {"subscription_id": ID}),
+    CancelSubscriptionSchema: ({"subscription_id": ID}, {"subscription_id": ID, "extra": 1}),
+    RevokeSessionsSchema: ({"user_id": ID}, {}),
+    ExportSubscriptionSchema: ({"status": "active", "plan_id": ID}, {"status": "paused"}),
+    SubscriptionCountersSchema: ({"day": "2025-01-31"}, {"day": "yesterday"}),
+    ListSubscriptionSchema: ({"status": "active", "limit": "20"}, {"limit": "many"}),
+    ProrationImpactSchema: ({"plan_id": ID, "amount": "4900"}, {"amount": "-1"}),
+    SignupSchema: (
+        {"first_name": " Ada ", "last_name": "Lovelace", "email": "ada@example.com", "password": "secret1"},
+        {"first_name": "Ada", "email": "ada"},
+    ),
+    LoginSchema: ({"email": " ada@example.com ", "password": "secret1"}, {"email": "ada"}),
+    CreatePlanSchema: (PLAN, dict(PLAN, intervals=PLAN["intervals"] * 2)),
+    BulkCreatePlanSchema: ({"plans": [PLAN] * 10}, {"plans": []}),
+}
+
+
+def per_load(load, data, loops):
+    started = time.perf_counter()
+    for _ in range(loops):
+        try:
+            load(data)
+        except ValidationError:
+            pass
+    return round((time.perf_counter() - started) / loops * 1_000_000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--loops', type=int, default=20000)
+    args = parser.parse_args()
+
+    report = {}
+    for schema_class, payloads in CASES.items():
+        shared, instance = validator(schema_class), schema_class()
+        result = {'path': 'flat' if isinstance(shared, FlatValidator) else 'shared schema'}
+        for name, data in zip(('valid', 'invalid'), payloads):
+            result[name] = {
+                'per_request_us': per_load(lambda data: schema_class().load(data), data, args.loops),
+                'reused_schema_us': per_load(instance.load, data, args.loops),
+                'shared_us': per_load(shared.load, data, args.loops),
+            }
+        report[schema_class.__name__] = result
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,53 @@
 import os
+from datetime import timedelta
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
+    CATALOG_VERSION_CHECK_INTERVAL = float(os.environ.get('CATALOG_VERSION_CHECK_INTERVAL', 5))
+    PLAN_CATALOG_CACHE_MAX_ENTRIES = 64
+    PRICE_RESOLVER_CACHE_MAX_ENTRIES = 4096
+    PRICE_RESOLVER_CACHE_TTL = 300
+    LAST_LOGIN_FLUSH_INTERVAL = float(os.environ.get('LAST_LOGIN_FLUSH_INTERVAL', 5))
+    LAST_LOGIN_MAX_PENDING = int(os.environ.get('LAST_LOGIN_MAX_PENDING', 500))
+    PASSWORD_HASHER_EXECUTOR = os.environ.get('PASSWORD_HASHER_EXECUTOR', 'thread')
+    PASSWORD_HASHER_WORKERS = int(os.environ.get('PASSWORD_HASHER_WORKERS', 2))
+    PASSWORD_HASHER_MAX_PENDING = int(os.environ.get('PASSWORD_HASHER_MAX_PENDING', 64))
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD')
+    PLAN_BULK_MAX_ITEMS = 5000
+    SUBSCRIPTION_PAGE_SIZE = 50
+    SUBSCRIPTION_MAX_PAGE_SIZE = 200
+    SUBSCRIPTION_UPGRADE_MAX_HOPS = 5
+    SUBSCRIPTION_EXPORT_BATCH_SIZE = int(os.environ.get('SUBSCRIPTION_EXPORT_BATCH_SIZE', 1000))
+    PRORATION_CHUNK_SIZE = int(os.environ.get('PRORATION_CHUNK_SIZE', 50000))
+    SUBSCRIPTION_COUNTER_SHARDS = int(os.environ.get('SUBSCRIPTION_COUNTER_SHARDS', 8))
+    REVENUE_ROLLUP_WORKERS = int(os.environ.get('REVENUE_ROLLUP_WORKERS', 4))
+    REVENUE_ROLLUP_CHUNK_DAYS = int(os.environ.get('REVENUE_ROLLUP_CHUNK_DAYS', 31))
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '1') == '1'
+    SQL_QUERY_BUDGET = int(os.environ.get('SQL_QUERY_BUDGET', 25))
+    SQL_REPEATED_STATEMENT_THRESHOLD = int(os.environ.get('SQL_REPEATED_STATEMENT_THRESHOLD', 5))
+    SQL_SLOW_QUERY_MS = float(os.environ.get('SQL_SLOW_QUERY_MS', 250))
+    SWEEPER_CHUNK_SIZE = int(os.environ.get('SWEEPER_CHUNK_SIZE', 1000))
+    SWEEPER_PAUSE = float(os.environ.get('SWEEPER_PAUSE', 0.05))
+    IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 24 * 3600))
+    IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get('IDEMPOTENCY_LOCK_TIMEOUT', 60))
+    IDEMPOTENCY_CACHE_MAX_ENTRIES = 10000
+    WEB_WORKER_CONNECTIONS = int(os.environ.get('WEB_WORKER_CONNECTIONS', 10))
+    WARM_UP_REQUIRED = False
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 2))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 5))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 280))
+    DB_POOL_PRE_PING = True
+    SQLALCHEMY_REPLICA_URLS = [url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url]
+    REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))
+    REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 5))
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
+    TOKEN_REVOCATION_FILTER_CAPACITY = int(os.environ.get('TOKEN_REVOCATION_FILTER_CAPACITY', 100000))
+    TOKEN_REVOCATION_FILTER_ERROR_RATE = 0.001
+    TOKEN_REVOCATION_REFRESH_INTERVAL = float(os.environ.get('TOKEN_REVOCATION_REFRESH_INTERVAL', 2))
+    TOKEN_REVOCATION_REBUILD_INTERVAL = float(os.environ.get('TOKEN_REVOCATION_REBUILD_INTERVAL', 300))
 
     @staticmethod
     def init_app(app):
@@ -13,19 +57,26 @@ class Config:
 class DevelopmentConfig(Config):
     DEBUG = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('DEV_DATABASE_URL')
-    SQLALCHEMY_ECHO = True
+    SQLALCHEMY_ECHO = os.environ.get('SQLALCHEMY_ECHO') == '1'
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
 
 
 
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL')
-    SQLALCHEMY_ECHO = True
+    SQLALCHEMY_ECHO = os.environ.get('SQLALCHEMY_ECHO') == '1'
+    LAST_LOGIN_FLUSH_INTERVAL = 0
+    TOKEN_REVOCATION_REFRESH_INTERVAL = 0
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
 
 
 
 class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
+    WARM_UP_REQUIRED = os.environ.get('WARM_UP_REQUIRED', '1') == '1'
 
     @classmethod
     def init_app(cls, app):
@@ -15,13 +15,6 @@ if [ "$FLASK_ENV" = "testing" ]; then
 #   echo "Running tests..."
   exec pytest
 else
-  pip install gunicorn && pip install gevent
   echo "Starting Gunicorn..."
-  exec gunicorn server:app \
-    --worker-class gevent \
-    --worker-connections 10 \
-    --timeout 30 \
-    -b 0.0.0.0:8000 \
-    --reload \
-    --log-syslog
+  exec gunicorn server:app -c gunicorn.conf.py
 fi
@@ -0,0 +1,51 @@
+"""Production serving profile: `gunicorn server:app -c gunicorn.conf.py`.
+
+The app is imported and created once, in the master (`preload_app`), and
+shared by the forked workers. Each worker drops the database connections
+it inherited and warms up (`app.warmup`) before it accepts connections, so
+a new worker's first requests are not the ones opening connections and
+filling caches. The number of workers comes from `WEB_CONCURRENCY`.
+"""
+import os
+import time
+from config import Config
+
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gevent')
+if worker_class == 'gevent':
+    # the app is imported before the workers fork, so the standard library
+    # has to be patched before it is, not by the worker afterwards
+    from gevent import monkey
+    monkey.patch_all()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+# greenlets per worker, the same setting sizes the connection pool
+worker_connections = Config.WEB_WORKER_CONNECTIONS
+timeout = 30
+graceful_timeout = 30
+preload_app = True
+syslog = True
+
+_started = time.perf_counter()
+
+
+def when_ready(server):
+    app = server.app.wsgi()
+    startup = app.extensions['warm_up'].startup
+    server.log.info(
+        "App loaded in %.3fs (import %.3fs, create_app %.3fs)",
+        time.perf_counter() - _started, startup.get('import_seconds', 0), startup.get('create_app_seconds', 0),
+    )
+
+
+def post_fork(server, worker):
+    from app.pool import dispose_inherited_connections
+    dispose_inherited_connections()
+
+
+def post_worker_init(worker):
+    from app.warmup import warm_up
+    state = warm_up(worker.wsgi)
+    if state.error is None:
+        worker.log.info("Worker %s warmed up in %.3fs: %s", worker.pid, state.seconds, state.steps)
+    else:
+        worker.log.error("Worker %s failed to warm up in %.3fs: %s", worker.pid, state.seconds, state.error)
@@ -0,0 +1,38 @@
+"""empty message
+
+Revision ID: 5e2b9d07a6f1
+Revises: c41f7a92e0b3
+Create Date: 2026-10-18 10:03:27.551934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2b9d07a6f1'
+down_revision = 'c41f7a92e0b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the user_id foreign key needs an index with user_id leftmost at all
+    # times, so each index is swapped while the others still cover it
+    with op.batch_alter_table('subscriptions', schema=None) as batch_op:
+        batch_op.drop_index('idx_user_id')
+        batch_op.create_index('idx_user_id', ['user_id', 'created_at', 'id'], unique=False)
+        batch_op.drop_index('idx_user_id_status')
+        batch_op.create_index('idx_user_id_status', ['user_id', 'status', 'created_at', 'id'], unique=False)
+        batch_op.drop_index('idx_user_id_plan_id')
+        batch_op.create_index('idx_user_id_plan_id', ['user_id', 'plan_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('subscriptions', schema=None) as batch_op:
+        batch_op.drop_index('idx_user_id_plan_id')
+        batch_op.create_index('idx_user_id_plan_id', ['user_id', 'plan_id'], unique=False)
+        batch_op.drop_index('idx_user_id_status')
+        batch_op.create_index('idx_user_id_status', ['user_id', 'status'], unique=False)
+        batch_op.drop_index('idx_user_id')
+        batch_op.create_index('idx_user_id', ['user_id'], unique=False)
@@ -0,0 +1,39 @@
+"""enforce one active subscription per plan and single upgrades
+
+Revision ID: d2a7c5e8f310
+Revises: b6e0f3d94a21
+Create Date: 2026-10-18 16:21:40.517302
+
+Existing duplicates (two active subscriptions of a user on the same plan, or
+a subscription upgraded twice) make the unique indexes fail to build and
+have to be resolved before upgrading.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7c5e8f310'
+down_revision = 'b6e0f3d94a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('subscriptions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+        batch_op.add_column(sa.Column(
+            'active_plan_id', sa.BINARY(length=16),
+            sa.Computed("CASE WHEN status = 'active' THEN plan_id END", persisted=False),
+            nullable=True,
+        ))
+        batch_op.create_index('uq_user_active_plan', ['user_id', 'active_plan_id'], unique=True)
+        batch_op.create_index('uq_upgraded_from_subscription_id', ['upgraded_from_subscription_id'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('subscriptions', schema=None) as batch_op:
+        batch_op.drop_index('uq_upgraded_from_subscription_id')
+        batch_op.drop_index('uq_user_active_plan')
+        batch_op.drop_column('active_plan_id')
+        batch_op.drop_column('version')
@@ -0,0 +1,189 @@
+"""store uuid keys as BINARY(16)
+
+Revision ID: e83a41c6b5d0
+Revises: 9b7c3e15d2a8
+Create Date: 2026-10-18 13:40:52.904117
+
+Converts every CHAR(36) id and foreign key to BINARY(16) in three phases so
+the tables stay writable for almost the whole migration:
+
+1. expand: add a shadow `<column>_new` column next to every uuid column and
+   install triggers that keep it in sync with rows written meanwhile;
+2. backfill: fill the shadow columns in primary key ranges of BATCH_SIZE
+   rows, each one its own short autocommitted transaction that only locks
+   its own range;
+3. contract: drop the triggers, foreign keys and old columns, rename the
+   shadow columns into place and restore keys and indexes.
+
+Only the contract phase takes table locks, and the application version
+storing binary ids has to be rolled out right after it. MySQL only: on
+other databases it does nothing when the tables are empty, and fails
+otherwise.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e83a41c6b5d0'
+down_revision = '9b7c3e15d2a8'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+UUID_COLUMNS = {
+    'users': ['id'],
+    'plans': ['id'],
+    'plan_intervals': ['id', 'plan_id'],
+    'plan_interval_prices': ['id', 'interval_id'],
+    'plan_upgrades': ['old_plan_id', 'new_plan_id'],
+    'subscriptions': ['id', 'user_id', 'plan_id', 'price_id', 'upgraded_from_subscription_id'],
+}
+
+NULLABLE_COLUMNS = {('subscriptions', 'upgraded_from_subscription_id')}
+
+PRIMARY_KEYS = {
+    'users': ['id'],
+    'plans': ['id'],
+    'plan_intervals': ['id'],
+    'plan_interval_prices': ['id'],
+    'plan_upgrades': ['old_plan_id', 'new_plan_id'],
+    'subscriptions': ['id'],
+}
+
+FOREIGN_KEYS = [
+    ('plan_intervals', 'plan_id', 'plans'),
+    ('plan_interval_prices', 'interval_id', 'plan_intervals'),
+    ('plan_upgrades', 'old_plan_id', 'plans'),
+    ('plan_upgrades', 'new_plan_id', 'plans'),
+    ('subscriptions', 'user_id', 'users'),
+    ('subscriptions', 'plan_id', 'plans'),
+    ('subscriptions', 'price_id', 'plan_interval_prices'),
+    ('subscriptions', 'upgraded_from_subscription_id', 'subscriptions'),
+]
+
+# secondary indexes that contain a uuid column: (name, columns, unique)
+INDEXES = {
+    'plan_intervals': [('unique_plan_interval_plan_id', ['id', 'plan_id'], True)],
+    'plan_interval_prices': [('uq_interval_currency', ['interval_id', 'currency'], True)],
+    'subscriptions': [
+        ('idx_user_id', ['user_id', 'created_at', 'id'], False),
+        ('idx_plan_id', ['plan_id'], False),
+        ('idx_user_id_status', ['user_id', 'status', 'created_at', 'id'], False),
+        ('idx_plan_id_status', ['plan_id', 'status'], False),
+        ('idx_user_id_plan_id', ['user_id', 'plan_id', 'created_at', 'id'], False),
+    ],
+}
+
+
+def _columns(names):
+    return ', '.join(f'`{name}`' for name in names)
+
+
+def _placeholders(prefix, count):
+    return ', '.join(f':{prefix}_{index}' for index in range(count))
+
+
+def _backfill(bind, table, assignments):
+    """Fills the shadow columns of `table` range by range along its primary
+    key, remembering the last key between batches, so every batch reads and
+    locks only its own BATCH_SIZE rows."""
+    key = PRIMARY_KEYS[table]
+    key_columns = f'({_columns(key)})'
+    last = None
+    while True:
+        conditions, params = [], {}
+        if last is not None:
+            conditions.append(f'{key_columns} > ({_placeholders("last", len(key))})')
+            params.update((f'last_{index}', value) for index, value in enumerate(last))
+        where = f'WHERE {" AND ".join(conditions)} ' if conditions else ''
+        upper = bind.execute(sa.text(
+            f'SELECT {_columns(key)} FROM `{table}` {where}ORDER BY {_columns(key)} LIMIT 1 OFFSET {BATCH_SIZE - 1}'
+        ), params).first()
+
+        if upper is not None:
+            conditions.append(f'{key_columns} <= ({_placeholders("upper", len(key))})')
+            params.update((f'upper_{index}', value) for index, value in enumerate(upper))
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        bind.execute(sa.text(f'UPDATE `{table}` SET {assignments}{where}'), params)
+
+        if upper is None:
+            break
+        last = tuple(upper)
+
+
+def _convert(column_type, convert_fn):
+    bind = op.get_bind()
+    if bind.dialect.name != 'mysql':
+        # SQLite does not enforce column types, so empty CHAR(36) columns
+        # take the binary ids as they are; stored rows would need converting
+        populated = [
+            table for table in UUID_COLUMNS
+            if bind.execute(sa.text(f'SELECT 1 FROM {table} LIMIT 1')).first() is not None
+        ]
+        if populated:
+            raise RuntimeError(
+                f'converting stored uuid keys is only supported on MySQL, and {", ".join(populated)} '
+                f'already hold rows on {bind.dialect.name}'
+            )
+        return
+
+    # expand
+    for table, columns in UUID_COLUMNS.items():
+        additions = ', '.join(f'ADD COLUMN `{column}_new` {column_type} NULL' for column in columns)
+        op.execute(f'ALTER TABLE `{table}` {additions}, ALGORITHM=INPLACE, LOCK=NONE')
+
+        assignments = ', '.join(f'NEW.`{column}_new` = {convert_fn}(NEW.`{column}`)' for column in columns)
+        for event in ('INSERT', 'UPDATE'):
+            op.execute(
+                f'CREATE TRIGGER `{table}_uuid_sync_{event.lower()}` BEFORE {event} ON `{table}` '
+                f'FOR EACH ROW SET {assignments}'
+            )
+
+    # backfill
+    with op.get_context().autocommit_block():
+        for table, columns in UUID_COLUMNS.items():
+            assignments = ', '.join(f'`{column}_new` = {convert_fn}(`{column}`)' for column in columns)
+            _backfill(bind, table, assignments)
+
+    # contract
+    for table in UUID_COLUMNS:
+        for event in ('insert', 'update'):
+            op.execute(f'DROP TRIGGER `{table}_uuid_sync_{event}`')
+
+    foreign_keys = bind.execute(sa.text(
+        "SELECT TABLE_NAME, CONSTRAINT_NAME FROM information_schema.REFERENTIAL_CONSTRAINTS "
+        "WHERE CONSTRAINT_SCHEMA = DATABASE() AND TABLE_NAME IN :tables"
+    ).bindparams(sa.bindparam('tables', expanding=True)), {'tables': list(UUID_COLUMNS)}).all()
+    for table, constraint in foreign_keys:
+        op.execute(f'ALTER TABLE `{table}` DROP FOREIGN KEY `{constraint}`')
+
+    for table, columns in UUID_COLUMNS.items():
+        drops = ['DROP PRIMARY KEY']
+        drops += [f'DROP INDEX `{name}`' for name, _, _ in INDEXES.get(table, [])]
+        drops += [f'DROP COLUMN `{column}`' for column in columns]
+        op.execute(f'ALTER TABLE `{table}` {", ".join(drops)}')
+
+        changes = [
+            f'CHANGE COLUMN `{column}_new` `{column}` {column_type} '
+            f'{"NULL" if (table, column) in NULLABLE_COLUMNS else "NOT NULL"}'
+            for column in columns
+        ]
+        changes.append(f'ADD PRIMARY KEY ({_columns(PRIMARY_KEYS[table])})')
+        changes += [
+            f'ADD {"UNIQUE " if unique else ""}INDEX `{name}` ({_columns(index_columns)})'
+            for name, index_columns, unique in INDEXES.get(table, [])
+        ]
+        op.execute(f'ALTER TABLE `{table}` {", ".join(changes)}')
+
+    for table, column, referenced in FOREIGN_KEYS:
+        op.execute(f'ALTER TABLE `{table}` ADD FOREIGN KEY (`{column}`) REFERENCES `{referenced}` (`id`)')
+
+
+def upgrade():
+    _convert('BINARY(16)', 'UUID_TO_BIN')
+
+
+def downgrade():
+    _convert('CHAR(36)', 'BIN_TO_UUID')
@@ -1,5 +1,10 @@
 import os
+import time
+
+started = time.perf_counter()
 from app import create_app
+imported = time.perf_counter()
 
 env = os.getenv('FLASK_ENV', 'development')
-app = create_app(env)
\ No newline at end of file
+app = create_app(env)
+app.extensions['warm_up'].record_startup(import_seconds=imported - started, create_app_seconds=time.perf_counter() - imported)
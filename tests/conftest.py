@@ -18,6 +18,7 @@ def app():
         _db.create_all()
         yield app
         _db.session.remove()
+        app.extensions['last_login_buffer'].flush()
         _db.drop_all()
 
 @pytest.fixture
@@ -110,4 +111,11 @@ def active_subscription(app, test_user, active_plan, active_price, active_plan_i
     )
     _db.session.add(subscription)
     _db.session.commit()
-    return subscription
\ No newline at end of file
+    return subscription
+
+@pytest.fixture
+def admin_jwt_headers(test_user):
+    token = create_access_token(identity=test_user.id, additional_claims={"is_admin": True})
+    return {
+        "Authorization": f"Bearer {token}"
+    }
@@ -0,0 +1,177 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import msgpack
+import pytest
+from flask_jwt_extended import create_access_token, create_refresh_token
+from starlette.testclient import TestClient
+from app import create_app, db as _db
+from app.asgi import async_database_url, create_asgi_app
+from app.models import User, Plan, PlanInterval, PlanIntervalPrice, Subscription
+from config import config, TestingConfig
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    # the async engine opens its own connections, so both need a file
+    config['asgi'] = type('AsgiConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'asgi.db'}",
+    })
+    app = create_app('asgi')
+    with app.app_context():
+        _db.create_all()
+        yield app
+        _db.session.remove()
+        app.extensions['last_login_buffer'].flush()
+        _db.drop_all()
+
+
+@pytest.fixture
+def asgi_client(file_app):
+    with TestClient(create_asgi_app(flask_app=file_app)) as client:
+        yield client
+
+
+@pytest.fixture
+def seeded(file_app):
+    user = User(first_name="Async", last_name="Reader", email="async@example.com", password="x")
+    _db.session.add(user)
+    for index, name in enumerate(["Basic", "Pro", "Team"]):
+        plan = Plan(name=name, description=f"{name} plan", is_active=True)
+        interval = PlanInterval(plan=plan, interval="month", interval_count=1, is_active=True)
+        PlanIntervalPrice(interval=interval, currency='USD', amount=1000 * (index + 1), is_active=True)
+        PlanIntervalPrice(interval=interval, currency='EUR', amount=900 * (index + 1), is_active=True)
+        _db.session.add(plan)
+    _db.session.flush()
+
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    price = PlanIntervalPrice.query.filter_by(currency='USD').first()
+    for index in range(5):
+        _db.session.add(Subscription(
+            user_id=user.id,
+            plan_id=price.interval.plan_id,
+            price_id=price.id,
+            interval="month",
+            current_period_start=start + timedelta(days=index),
+            current_period_end=start + timedelta(days=index + 30),
+            status='cancelled' if index % 2 else 'ended',
+            amount_paid=price.amount,
+        ))
+    _db.session.commit()
+    return {"Authorization": f"Bearer {create_access_token(identity=user.id)}"}
+
+
+def test_async_database_url_swaps_the_driver():
+    assert async_database_url('sqlite:////tmp/app.db').drivername == 'sqlite+aiosqlite'
+    assert async_database_url('mysql+pymysql://u:p@db/app').drivername == 'mysql+aiomysql'
+    with pytest.raises(ValueError):
+        async_database_url('postgresql://u:p@db/app')
+
+
+@pytest.mark.parametrize('path', [
+    '/api/v1/plan',
+    '/api/v1/plan?currency=EUR',
+    '/api/v1/plan?currency=eur',
+    '/api/v1/subscription',
+    '/api/v1/subscription?status=ended',
+    '/api/v1/subscription?limit=2',
+])
+def test_responses_match_the_flask_app(file_app, asgi_client, seeded, path):
+    expected = file_app.test_client().get(path, headers=seeded)
+    response = asgi_client.get(path, headers=seeded)
+
+    assert response.status_code == expected.status_code == 200
+    assert response.headers['content-type'] == expected.headers['Content-Type']
+    assert response.content == expected.data
+
+
+def test_subscription_pages_follow_the_cursor(asgi_client, seeded):
+    seen = []
+    cursor = None
+    while True:
+        response = asgi_client.get('/api/v1/subscription', params={'limit': 2, **({'cursor': cursor} if cursor else {})}, headers=seeded)
+        assert response.status_code == 200
+        data = response.json()
+        seen += [subscription['id'] for subscription in data['subscriptions']]
+        cursor = data['next_cursor']
+        if cursor is None:
+            break
+
+    assert len(seen) == len(set(seen)) == 5
+
+
+@pytest.mark.parametrize('query, body', [
+    ({'limit': 0}, {"message": "limit must be between 1 and 200"}),
+    ({'cursor': 'not-a-cursor'}, {"message": "the cursor is not valid"}),
+    ({'plan_id': 'nope'}, {"plan_id": ["Not a valid UUID."]}),
+])
+def test_invalid_subscription_queries_are_rejected(asgi_client, seeded, query, body):
+    response = asgi_client.get('/api/v1/subscription', params=query, headers=seeded)
+
+    assert response.status_code == 400
+    assert response.json() == body
+
+
+def test_tokens_are_checked(file_app, asgi_client, seeded):
+    assert asgi_client.get('/api/v1/plan').status_code == 401
+    assert asgi_client.get('/api/v1/plan', headers={"Authorization": "Bearer garbage"}).status_code == 422
+
+    refresh = create_refresh_token(identity="someone")
+    assert asgi_client.get('/api/v1/plan', headers={"Authorization": f"Bearer {refresh}"}).status_code == 422
+
+    expired = create_access_token(identity="someone", expires_delta=timedelta(seconds=-1))
+    response = asgi_client.get('/api/v1/plan', headers={"Authorization": f"Bearer {expired}"})
+    assert response.status_code == 401
+    assert response.json() == {"msg": "Token has expired"}
+
+
+def test_plan_catalog_negotiates_msgpack(asgi_client, seeded):
+    response = asgi_client.get('/api/v1/plan', headers={**seeded, "Accept": "application/msgpack"})
+
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/msgpack'
+    assert response.headers['vary'] == 'Accept'
+    assert len(msgpack.unpackb(response.content)['plans']) == 3
+
+
+def test_plan_catalog_is_rebuilt_after_a_catalog_change(file_app, asgi_client, seeded):
+    asgi_client.app.state.plan_catalog._check_interval = 0
+    assert len(asgi_client.get('/api/v1/plan', headers=seeded).json()['plans']) == 3
+
+    Plan.query.filter_by(name="Team").update({"is_active": False})
+    _db.session.commit()
+
+    assert len(asgi_client.get('/api/v1/plan', headers=seeded).json()['plans']) == 2
+
+
+def test_revoked_tokens_are_refused(file_app, asgi_client, seeded):
+    file_app.test_client().post('/api/v1/auth/logout', headers=seeded)
+
+    response = asgi_client.get('/api/v1/subscription', headers=seeded)
+    assert response.status_code == 401
+    assert response.json() == {"msg": "Token has been revoked"}
+
+
+def test_revocations_are_not_queried_on_the_event_loop(file_app, seeded, monkeypatch):
+    revocations = file_app.extensions['token_revocations']
+    calls = []
+
+    def on_loop():
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return True
+
+    rebuild, lookup = revocations.rebuild, revocations.lookup
+    monkeypatch.setattr(revocations, 'rebuild', lambda: calls.append(('rebuild', on_loop())) or rebuild())
+    monkeypatch.setattr(revocations, 'lookup', lambda *args: calls.append(('lookup', on_loop())) or lookup(*args))
+
+    with TestClient(create_asgi_app(flask_app=file_app)) as client:
+        # the filter is built at startup, not by the first request
+        assert calls == [('rebuild', False)]
+        assert client.get('/api/v1/subscription', headers=seeded).status_code == 200
+        assert calls == [('rebuild', False)]
+
+        file_app.test_client().post('/api/v1/auth/logout-all', headers=seeded)
+        assert client.get('/api/v1/subscription', headers=seeded).status_code == 401
+        assert calls == [('rebuild', False), ('lookup', False)]
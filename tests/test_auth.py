@@ -56,4 +56,110 @@ def test_login_with_wrong_password(client, db):
     }
     response = client.post("/api/v1/auth/login", json=payload)
     assert response.status_code == 401
-    assert response.get_json()["message"] == "Invalid email or password"
\ No newline at end of file
+    assert response.get_json()["message"] == "Invalid email or password"
+
+def test_login_upgrades_outdated_password_hash(client, db):
+    user = User(
+        first_name="Ann",
+        last_name="Lee",
+        email="ann@example.com",
+        password=generate_password_hash("correctpass", method="pbkdf2:sha256:1000")
+    )
+    db.session.add(user)
+    db.session.commit()
+
+    response = client.post("/api/v1/auth/login", json={"email": "ann@example.com", "password": "correctpass"})
+    assert response.status_code == 200
+
+    refreshed = User.find_by_email("ann@example.com")
+    assert refreshed.password.startswith("scrypt:")
+
+    response = client.post("/api/v1/auth/login", json={"email": "ann@example.com", "password": "correctpass"})
+    assert response.status_code == 200
+
+
+def test_password_hasher_sheds_load_when_queue_is_full():
+    import threading
+    import pytest
+    from app.passwords import PasswordHasher, HasherBusy
+
+    hasher = PasswordHasher(executor='thread', workers=1, max_pending=1)
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow():
+        started.set()
+        release.wait()
+        return True
+
+    worker = threading.Thread(target=lambda: hasher._submit(slow))
+    worker.start()
+    started.wait()
+    try:
+        with pytest.raises(HasherBusy):
+            hasher.verify(generate_password_hash("x"), "x")
+    finally:
+        release.set()
+        worker.join()
+        hasher.shutdown()
+
+
+def test_login_buffers_last_login_until_flush(app, client, db):
+    from app.write_behind import last_login_buffer
+
+    user = User(
+        first_name="Cal",
+        last_name="Lee",
+        email="cal@example.com",
+        password=generate_password_hash("correctpass")
+    )
+    db.session.add(user)
+    db.session.commit()
+
+    response = client.post("/api/v1/auth/login", json={"email": "cal@example.com", "password": "correctpass"})
+    assert response.status_code == 200
+
+    db.session.expire_all()
+    assert User.find_by_email("cal@example.com").last_login is None
+
+    assert last_login_buffer().flush() == 1
+    db.session.expire_all()
+    assert User.find_by_email("cal@example.com").last_login is not None
+
+
+def test_apps_share_one_exit_flush(app, monkeypatch):
+    import atexit
+    import gc
+    from app import create_app
+    from app.write_behind import _buffers
+
+    registered = []
+    monkeypatch.setattr(atexit, 'register', lambda fn, *args, **kwargs: registered.append(fn) or fn)
+    gc.collect()
+    buffers = len(_buffers)
+    other = create_app("testing")
+    assert registered == []
+    assert other.extensions['last_login_buffer'] in _buffers
+
+    del other
+    gc.collect()
+    assert len(_buffers) == buffers
+
+
+def test_admin_login_token_opens_export(app, client, db):
+    user = User(
+        first_name="Ada",
+        last_name="Root",
+        email="ada@example.com",
+        password=generate_password_hash("correctpass")
+    )
+    db.session.add(user)
+    db.session.commit()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=["users", "set-admin", "ada@example.com"])
+    assert result.exit_code == 0
+
+    token = client.post("/api/v1/auth/login", json={"email": "ada@example.com", "password": "correctpass"}).get_json()["token"]
+    response = client.get("/api/v1/subscription/export", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
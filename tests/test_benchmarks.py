@@ -0,0 +1,21 @@
+import re
+from app import create_app
+from benchmarks.run import run, SCENARIOS
+
+
+def test_benchmark_harness_drives_every_route(tmp_path):
+    report = run(f"sqlite:///{tmp_path / 'benchmark.db'}", scale=20, requests=2, concurrency=1, use_wsgi=False)
+
+    assert [result['route'] for result in report['results']] == [name for name, _ in SCENARIOS]
+    for result in report['results']:
+        assert result['requests'] == 2
+        assert result['errors'] == 0, result['route']
+        assert result['p99_ms'] is not None
+
+
+def test_every_api_route_has_a_scenario():
+    scenarios = {(name.split()[0], name.split()[1].split('?')[0]) for name, _ in SCENARIOS}
+    for rule in create_app('testing').url_map.iter_rules():
+        if rule.rule.startswith('/api/v1/'):
+            for method in rule.methods - {'HEAD', 'OPTIONS'}:
+                assert (method, re.sub(r'<[^>]+>', '<id>', rule.rule)) in scenarios, rule.rule
@@ -0,0 +1,34 @@
+import threading
+import time
+from app.cache import SingleFlight, VersionedCache
+
+
+def test_single_flight_collapses_concurrent_calls():
+    flight = SingleFlight()
+    calls = []
+
+    def build():
+        calls.append(1)
+        time.sleep(0.05)
+        return "catalog"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("USD", build))) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == ["catalog"] * 10
+
+
+def test_versioned_cache_rebuilds_on_version_change():
+    version = [1]
+    cache = VersionedCache(lambda: version[0])
+
+    assert cache.get("USD", lambda: "v1") == "v1"
+    assert cache.get("USD", lambda: "ignored") == "v1"
+
+    version[0] = 2
+    assert cache.get("USD", lambda: "v2") == "v2"
@@ -0,0 +1,89 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import pytest
+from flask_jwt_extended import create_access_token
+from app import create_app, db as _db
+from app.models import User, Plan, PlanInterval, PlanIntervalPrice, PlanUpgrade, Subscription
+from config import config, TestingConfig
+
+REQUESTS = 200
+WORKERS = 16
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    # an in-memory database is one shared connection, so the races need a file
+    config['concurrency'] = type('ConcurrencyConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'concurrency.db'}",
+        'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 30}},
+    })
+    app = create_app('concurrency')
+    with app.app_context():
+        _db.create_all()
+        yield app
+        _db.session.remove()
+        app.extensions['last_login_buffer'].flush()
+        _db.drop_all()
+
+
+def make_catalog(names):
+    prices = []
+    for index, name in enumerate(names):
+        plan = Plan(name=name, is_active=True)
+        _db.session.add(plan)
+        _db.session.flush()
+        interval = PlanInterval(plan_id=plan.id, interval="month", interval_count=1, is_active=True)
+        _db.session.add(interval)
+        _db.session.flush()
+        price = PlanIntervalPrice(interval_id=interval.id, amount=1000 * (index + 1), currency='USD', is_active=True)
+        _db.session.add(price)
+        _db.session.flush()
+        prices.append(price)
+    return prices
+
+
+def hammer(app, method, path, body, headers):
+    def send(_):
+        with app.test_client() as client:
+            return client.open(path, method=method, json=body, headers=headers).status_code
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        return Counter(pool.map(send, range(REQUESTS)))
+
+
+def test_parallel_creates_leave_one_active_subscription(file_app):
+    user = User(first_name="Race", last_name="Create", email="race-create@example.com", password="x")
+    _db.session.add(user)
+    price = make_catalog(["Race"])[0]
+    _db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user.id)}"}
+
+    statuses = hammer(file_app, 'POST', '/api/v1/subscription', {"price_id": price.id}, headers)
+
+    assert statuses[201] == 1
+    assert set(statuses) <= {201, 409}
+    assert Subscription.query.filter_by(user_id=user.id, status='active').count() == 1
+
+
+def test_parallel_upgrades_upgrade_once(file_app):
+    user = User(first_name="Race", last_name="Upgrade", email="race-upgrade@example.com", password="x")
+    _db.session.add(user)
+    basic, plus = make_catalog(["Race Basic", "Race Plus"])
+    _db.session.add(PlanUpgrade(old_plan_id=basic.interval.plan_id, new_plan_id=plus.interval.plan_id, is_active=True))
+    now = datetime.now(timezone.utc)
+    subscription = Subscription(
+        user_id=user.id, plan_id=basic.interval.plan_id, price_id=basic.id, interval='month',
+        current_period_start=now, current_period_end=now + timedelta(days=30), status='active', amount_paid=1000,
+    )
+    _db.session.add(subscription)
+    _db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user.id)}"}
+
+    statuses = hammer(file_app, 'PATCH', '/api/v1/subscription_upgrade',
+                      {"subscription_id": subscription.id, "new_price_id": plus.id}, headers)
+
+    assert statuses[200] == 1
+    assert set(statuses) <= {200, 400, 409}
+    assert Subscription.query.filter_by(upgraded_from_subscription_id=subscription.id).count() == 1
+    assert Subscription.query.filter_by(user_id=user.id, status='active').count() == 1
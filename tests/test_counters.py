@@ -0,0 +1,150 @@
+from datetime import datetime, timedelta, timezone
+from itertools import count
+from sqlalchemy import event, func, select, update
+from sqlalchemy.dialects import mysql
+from app.counters import ALL_TIME, expected_counters, reconcile_subscription_counters, stored_counters
+from app.lifecycle import sweep_due_subscriptions
+from app.models import Plan, PlanInterval, PlanIntervalPrice, PlanUpgrade, Subscription, SubscriptionCounter, User
+
+_users = count()
+
+
+def make_price(db, name, amount=1000):
+    plan = Plan(name=name, is_active=True, description="desc")
+    interval = PlanInterval(plan=plan, interval="month", interval_count=1, is_active=True)
+    price = PlanIntervalPrice(interval=interval, amount=amount, currency='USD', is_active=True)
+    db.session.add(price)
+    db.session.commit()
+    return plan, price
+
+
+def make_subscription(db, plan, price, period_end, canceled=False):
+    index = next(_users)
+    user = User(first_name="Counted", last_name=str(index), email=f"counted-{index}@example.com", password="x")
+    db.session.add(user)
+    db.session.flush()
+    subscription = Subscription(
+        user_id=user.id, plan_id=plan.id, price_id=price.id, interval='month',
+        current_period_start=period_end - timedelta(days=30), current_period_end=period_end,
+        status='active', amount_paid=1000, canceled_at=period_end - timedelta(days=3) if canceled else None,
+    )
+    db.session.add(subscription)
+    return subscription
+
+
+def counts(client, headers, day=None):
+    path = '/api/v1/subscription/counters' + (f'?day={day}' if day else '')
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200
+    return {plan['plan_id']: plan for plan in response.get_json()['plans']}
+
+
+def test_api_changes_are_counted(client, db, jwt_headers, admin_jwt_headers, test_user):
+    basic, basic_price = make_price(db, "Counted Basic")
+    premium, premium_price = make_price(db, "Counted Premium", amount=2000)
+    db.session.add(PlanUpgrade(old_plan_id=basic.id, new_plan_id=premium.id, is_active=True))
+    db.session.commit()
+
+    response = client.post('/api/v1/subscription', json={'price_id': basic_price.id}, headers=jwt_headers)
+    subscription_id = response.get_json()['data']['id']
+    client.patch('/api/v1/subscription_upgrade', json={'subscription_id': subscription_id, 'new_price_id': premium_price.id}, headers=jwt_headers)
+    upgraded_id = Subscription.query.filter_by(upgraded_from_subscription_id=subscription_id).one().id
+    assert client.patch('/api/v1/subscription', json={'subscription_id': upgraded_id}, headers=jwt_headers).status_code == 200
+
+    plans = counts(client, admin_jwt_headers)
+    assert plans[basic.id]['subscriptions'] == {"active": 0, "cancelled": 0, "ended": 1}
+    assert plans[basic.id]['day'] == {"started": 1, "cancelled": 0, "ended": 1}
+    assert plans[premium.id]['subscriptions'] == {"active": 1, "cancelled": 0, "ended": 0}
+    assert plans[premium.id]['day'] == {"started": 1, "cancelled": 1, "ended": 0}
+    assert reconcile_subscription_counters()['drifted'] == 0
+
+
+def test_rolled_back_changes_are_not_counted(app, db):
+    plan, price = make_price(db, "Rolled Back")
+    make_subscription(db, plan, price, datetime.now(timezone.utc) + timedelta(days=3))
+    db.session.flush()
+    db.session.rollback()
+
+    db.session.commit()
+    assert stored_counters(db.session) == {}
+
+
+def test_sweeper_moves_the_counts(app, db):
+    plan, price = make_price(db, "Swept")
+    now = datetime.now(timezone.utc)
+    for index in range(5):
+        make_subscription(db, plan, price, now - timedelta(days=1), canceled=index < 2)
+    make_subscription(db, plan, price, now + timedelta(days=5))
+    db.session.commit()
+
+    sweep_due_subscriptions(now=now, chunk_size=2, report=lambda total, rate: None)
+
+    counted = stored_counters(db.session)
+    assert counted[(plan.id, 'active', ALL_TIME)] == 1
+    assert counted[(plan.id, 'cancelled', ALL_TIME)] == 2
+    assert counted[(plan.id, 'ended', ALL_TIME)] == 3
+    assert counted == {key: value for key, value in expected_counters(db.session).items()}
+
+
+def test_sweeper_locks_the_rows_it_counts(app, db):
+    plan, price = make_price(db, "Locked")
+    make_subscription(db, plan, price, datetime.now(timezone.utc) - timedelta(days=1))
+    db.session.commit()
+    selects = []
+
+    def capture(state):
+        if state.is_select and state.statement.get_final_froms()[0] is Subscription.__table__:
+            selects.append(state.statement)
+
+    event.listen(db.session, 'do_orm_execute', capture)
+    try:
+        sweep_due_subscriptions(report=lambda total, rate: None)
+    finally:
+        event.remove(db.session, 'do_orm_execute', capture)
+
+    # an upgrade or cancel between the read and the update would otherwise
+    # be counted twice, or as ended
+    assert selects
+    assert all('FOR UPDATE' in str(statement.compile(dialect=mysql.dialect())) for statement in selects)
+
+
+def test_counts_are_spread_over_shards(app, db):
+    app.config['SUBSCRIPTION_COUNTER_SHARDS'] = 4
+    plan, price = make_price(db, "Sharded")
+    for _ in range(40):
+        make_subscription(db, plan, price, datetime.now(timezone.utc) + timedelta(days=3))
+        db.session.commit()
+
+    shards = db.session.execute(
+        select(func.count()).select_from(SubscriptionCounter)
+        .where(SubscriptionCounter.plan_id == plan.id, SubscriptionCounter.day == ALL_TIME)
+    ).scalar()
+    assert shards > 1
+    assert stored_counters(db.session)[(plan.id, 'active', ALL_TIME)] == 40
+
+
+def test_reconcile_reports_and_fixes_drift(app, db, client, admin_jwt_headers):
+    plan, price = make_price(db, "Drifted")
+    for _ in range(3):
+        make_subscription(db, plan, price, datetime.now(timezone.utc) + timedelta(days=3))
+    db.session.commit()
+    # a bulk update the hooks cannot see
+    db.session.execute(update(Subscription).values(status='ended').execution_options(synchronize_session=False))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['subscriptions', 'reconcile-counters'])
+    assert result.exit_code == 0, result.output
+    assert '"drifted": 2' in result.output
+    assert counts(client, admin_jwt_headers)[plan.id]['subscriptions']['active'] == 3
+
+    report = reconcile_subscription_counters(fix=True)
+    assert report['fixed']
+    assert counts(client, admin_jwt_headers)[plan.id]['subscriptions'] == {"active": 0, "cancelled": 0, "ended": 3}
+    assert reconcile_subscription_counters()['drifted'] == 0
+
+
+def test_counters_endpoint_is_admin_only_and_validated(client, jwt_headers, admin_jwt_headers):
+    assert client.get('/api/v1/subscription/counters', headers=jwt_headers).status_code == 403
+    assert client.get('/api/v1/subscription/counters?day=yesterday', headers=admin_jwt_headers).status_code == 400
+    response = client.get('/api/v1/subscription/counters?day=2025-01-31', headers=admin_jwt_headers)
+    assert response.get_json() == {"message": "Successfully retrieved subscription counters", "day": "2025-01-31", "plans": []}
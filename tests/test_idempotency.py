@@ -0,0 +1,92 @@
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import event
+from app.idempotency import purge_expired_keys
+from app.models import IdempotencyKey, Subscription
+
+
+def test_replayed_request_returns_stored_response(app, client, db, jwt_headers, active_plan_setup):
+    _, _, price = active_plan_setup
+    payload = {"price_id": str(price.id)}
+    headers = dict(jwt_headers, **{"Idempotency-Key": "create-1"})
+
+    first = client.post("/api/v1/subscription", json=payload, headers=headers)
+    assert first.status_code == 201
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        second = client.post("/api/v1/subscription", json=payload, headers=headers)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+
+    assert second.status_code == 201
+    assert second.headers["Idempotent-Replayed"] == "true"
+    assert second.get_json() == first.get_json()
+    assert statements == []
+    assert Subscription.query.count() == 1
+
+    # another worker only has the table
+    app.extensions['idempotency_cache'].clear()
+    third = client.post("/api/v1/subscription", json=payload, headers=headers)
+    assert third.status_code == 201
+    assert third.get_json() == first.get_json()
+    assert Subscription.query.count() == 1
+
+
+def test_key_reused_with_different_body(client, db, jwt_headers, active_plan_setup):
+    _, _, price = active_plan_setup
+    headers = dict(jwt_headers, **{"Idempotency-Key": "create-2"})
+
+    client.post("/api/v1/subscription", json={"price_id": str(price.id)}, headers=headers)
+    response = client.post("/api/v1/subscription", json={"price_id": "00000000-0000-0000-0000-000000000000"}, headers=headers)
+    assert response.status_code == 422
+
+
+def test_key_in_progress_is_rejected(client, db, test_user, jwt_headers, active_plan_setup):
+    _, _, price = active_plan_setup
+    db.session.add(IdempotencyKey(
+        user_id=test_user.id, key="create-3", request_hash="0" * 64,
+        expires_at=datetime.now(timezone.utc) + timedelta(hours=1),
+    ))
+    db.session.commit()
+
+    headers = dict(jwt_headers, **{"Idempotency-Key": "create-3"})
+    response = client.post("/api/v1/subscription", json={"price_id": str(price.id)}, headers=headers)
+    assert response.status_code == 409
+    assert Subscription.query.count() == 0
+
+
+def test_replays_stop_when_the_key_expires(app, client, db, test_user, jwt_headers, active_plan_setup):
+    _, _, price = active_plan_setup
+    db.session.add(IdempotencyKey(
+        user_id=test_user.id, key="create-4", request_hash="0" * 64, status_code=201,
+        response_body=b'{"message": "old"}', response_mimetype="application/json",
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=1),
+    ))
+    db.session.commit()
+
+    headers = dict(jwt_headers, **{"Idempotency-Key": "create-4"})
+    # a worker loads the row near the end of its life
+    assert client.post("/api/v1/subscription", json={"price_id": str(price.id)}, headers=headers).status_code == 422
+
+    time.sleep(1.1)
+    assert purge_expired_keys() == 1
+    response = client.post("/api/v1/subscription", json={"price_id": str(price.id)}, headers=headers)
+    assert response.status_code == 201
+    assert "Idempotent-Replayed" not in response.headers
+    assert Subscription.query.count() == 1
+
+
+def test_purge_expired_keys(db, test_user):
+    now = datetime.now(timezone.utc)
+    for i in range(5):
+        db.session.add(IdempotencyKey(user_id=test_user.id, key=f"old-{i}", request_hash="0" * 64,
+                                      status_code=201, expires_at=now - timedelta(minutes=i + 1)))
+    db.session.add(IdempotencyKey(user_id=test_user.id, key="fresh", request_hash="0" * 64,
+                                  status_code=201, expires_at=now + timedelta(hours=1)))
+    db.session.commit()
+
+    assert purge_expired_keys(now=now, chunk_size=2) == 5
+    assert [row.key for row in IdempotencyKey.query.all()] == ["fresh"]
@@ -0,0 +1,41 @@
+import json
+import logging
+
+
+def test_server_timing_header_reports_queries(client, jwt_headers, active_subscription):
+    response = client.get('/api/v1/subscription', headers=jwt_headers)
+    assert response.status_code == 200
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('db;dur=')
+    assert '"1 queries"' in timing
+
+
+def test_repeated_statements_are_logged(app, client, jwt_headers, active_subscription, caplog):
+    app.config['SQL_REPEATED_STATEMENT_THRESHOLD'] = 2
+
+    @app.route('/n-plus-one')
+    def n_plus_one():
+        from app.models import Subscription
+        for _ in range(3):
+            Subscription.find_by_params(id=active_subscription.id)
+        return 'ok'
+
+    with caplog.at_level(logging.WARNING, logger='app.sql'):
+        client.get('/n-plus-one')
+
+    warnings = [json.loads(record.message) for record in caplog.records if record.name == 'app.sql']
+    assert warnings and warnings[0]['event'] == 'repeated_statement'
+    assert list(warnings[0]['repeated_statements'].values()) == [3]
+
+
+def test_slow_queries_are_logged_with_parameter_shapes(app, client, jwt_headers, active_subscription, caplog):
+    app.config['SQL_SLOW_QUERY_MS'] = 0
+
+    with caplog.at_level(logging.WARNING, logger='app.sql.slow'):
+        client.get('/api/v1/subscription', headers=jwt_headers)
+
+    records = [json.loads(r.message) for r in caplog.records if r.name == 'app.sql.slow']
+    record = [r for r in records if r['endpoint'] == 'api.get_subscriptions' and 'FROM subscriptions' in r['statement']][0]
+    assert record['event'] == 'slow_query'
+    assert 'int' in record['parameters']
+    assert str(active_subscription.user_id) not in json.dumps(record)
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta, timezone
+from app.lifecycle import sweep_due_subscriptions, load_checkpoint, SWEEP_CHECKPOINT
+from itertools import count
+from app.models import Subscription, User
+
+_users = count()
+
+
+def make_user(db):
+    # one active subscription per user and plan, so every subscription gets its own user
+    index = next(_users)
+    user = User(first_name="Sweep", last_name=str(index), email=f"sweep-{index}@example.com", password="x")
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+
+def make_subscription(db, user, plan, price, period_end, interval='month', canceled=False):
+    subscription = Subscription(
+        user_id=user.id,
+        plan_id=plan.id,
+        price_id=price.id,
+        interval=interval,
+        current_period_start=period_end - timedelta(days=30),
+        current_period_end=period_end,
+        status='active',
+        amount_paid=1000,
+        canceled_at=period_end - timedelta(days=3) if canceled else None,
+    )
+    db.session.add(subscription)
+    return subscription
+
+
+def test_sweep_transitions_due_subscriptions_in_chunks(app, db, active_plan_setup):
+    plan, _, price = active_plan_setup
+    now = datetime.now(timezone.utc)
+    expired = [make_subscription(db, make_user(db), plan, price, now - timedelta(days=i + 1)) for i in range(5)]
+    cancelled = make_subscription(db, make_user(db), plan, price, now - timedelta(hours=1), canceled=True)
+    current = make_subscription(db, make_user(db), plan, price, now + timedelta(days=10))
+    one_time = make_subscription(db, make_user(db), plan, price, now - timedelta(days=2), interval='one_time')
+    db.session.commit()
+    ids = {s.id: s for s in expired + [cancelled, current, one_time]}
+
+    stats = sweep_due_subscriptions(now=now, chunk_size=2, report=lambda total, rate: None)
+    assert stats['swept'] == 6
+
+    statuses = {s.id: s.status for s in Subscription.query.filter(Subscription.id.in_(ids))}
+    assert all(statuses[s.id] == 'ended' for s in expired)
+    assert statuses[cancelled.id] == 'cancelled'
+    assert statuses[current.id] == 'active'
+    assert statuses[one_time.id] == 'active'
+    assert load_checkpoint(SWEEP_CHECKPOINT) is None
+
+    assert sweep_due_subscriptions(now=now, chunk_size=2, report=lambda total, rate: None)['swept'] == 0
+
+
+def test_a_finished_sweep_picks_up_rows_due_behind_it(app, db, active_plan_setup):
+    plan, _, price = active_plan_setup
+    now = datetime.now(timezone.utc)
+    for days in (1, 2, 3):
+        make_subscription(db, make_user(db), plan, price, now - timedelta(days=days))
+    db.session.commit()
+
+    sweep_due_subscriptions(now=now, chunk_size=2, report=lambda total, rate: None)
+    assert load_checkpoint(SWEEP_CHECKPOINT) is None
+
+    # due before every row swept so far, behind where the run ended
+    backdated = make_subscription(db, make_user(db), plan, price, now - timedelta(days=30))
+    db.session.commit()
+
+    assert sweep_due_subscriptions(now=now, chunk_size=2, report=lambda total, rate: None)['swept'] == 1
+    assert db.session.get(Subscription, backdated.id).status == 'ended'
+
+
+def test_an_interrupted_sweep_resumes_from_its_checkpoint(app, db, active_plan_setup):
+    plan, _, price = active_plan_setup
+    now = datetime.now(timezone.utc)
+    subscriptions = [make_subscription(db, make_user(db), plan, price, now - timedelta(days=days)) for days in (3, 2, 1)]
+    db.session.commit()
+
+    def interrupt(total, rate):
+        raise KeyboardInterrupt
+
+    try:
+        sweep_due_subscriptions(now=now, chunk_size=2, report=interrupt)
+    except KeyboardInterrupt:
+        pass
+    assert load_checkpoint(SWEEP_CHECKPOINT)[1] == subscriptions[1].id
+
+
+def test_sweep_cli(app, db, active_plan_setup):
+    plan, _, price = active_plan_setup
+    make_subscription(db, make_user(db), plan, price, datetime.now(timezone.utc) - timedelta(days=1))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['subscriptions', 'sweep', '--chunk-size', '10', '--pause', '0'])
+    assert result.exit_code == 0
+    assert "done: 1 subscriptions" in result.output
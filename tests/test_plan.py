@@ -81,3 +81,112 @@ def test_get_all_plans(client, db, jwt_headers):
     assert response.status_code == 200
     data = response.get_json()
     assert isinstance(data['plans'], list)
+
+
+def test_get_plans_cache_invalidated_on_create(client, db, jwt_headers):
+    response = client.get("/api/v1/plan", headers=jwt_headers)
+    assert response.get_json()['plans'] == []
+
+    payload = {
+        "name": "Basic",
+        "description": "Best plan for students",
+        "intervals": [
+            {
+                "interval": "month",
+                "interval_count": 1,
+                "prices": [
+                    {"currency": "USD", "amount": 1000}
+                ]
+            }
+        ]
+    }
+    client.post("/api/v1/plan", json=payload, headers=jwt_headers)
+
+    response = client.get("/api/v1/plan", headers=jwt_headers)
+    assert [plan['name'] for plan in response.get_json()['plans']] == ["Basic"]
+
+
+def test_get_plans_cache_served_without_query(client, db, jwt_headers, active_price):
+    from sqlalchemy import event
+
+    client.get("/api/v1/plan?currency=USD", headers=jwt_headers)
+
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        response = client.get("/api/v1/plan?currency=USD", headers=jwt_headers)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+
+    assert response.status_code == 200
+    assert len(response.get_json()['plans']) == 1
+    assert not any("plan_interval_prices" in statement for statement in statements)
+
+
+def test_create_plans_bulk(client, db, jwt_headers):
+    existing_plan = Plan(name="Basic", description="desc")
+    db.session.add(existing_plan)
+    db.session.commit()
+
+    def plan_payload(name):
+        return {
+            "name": name,
+            "description": "Regional plan",
+            "intervals": [
+                {"interval": "month", "interval_count": 1, "prices": [{"currency": "usd", "amount": 1000}, {"currency": "EUR", "amount": 900}]},
+                {"interval": "year", "interval_count": 1, "prices": [{"currency": "USD", "amount": 10000}]},
+            ]
+        }
+
+    payload = {"plans": [
+        plan_payload("Pro EU"),
+        plan_payload("Basic"),
+        {"name": "Broken", "description": "No intervals", "intervals": []},
+        plan_payload("Pro US"),
+        plan_payload("Pro EU"),
+    ]}
+    response = client.post("/api/v1/plan/bulk", json=payload, headers=jwt_headers)
+    assert response.status_code == 207
+    statuses = [result['status'] for result in response.get_json()['results']]
+    assert statuses == ["created", "error", "error", "created", "error"]
+
+    response = client.get("/api/v1/plan?currency=USD", headers=jwt_headers)
+    plans = {plan['name']: plan for plan in response.get_json()['plans']}
+    assert set(plans) == {"Pro EU", "Pro US"}
+    assert len(plans["Pro US"]['intervals']) == 2
+
+
+def test_get_plans_msgpack(client, db, jwt_headers, active_price):
+    import msgpack
+
+    json_response = client.get("/api/v1/plan", headers=jwt_headers)
+    response = client.get("/api/v1/plan", headers=dict(jwt_headers, Accept="application/msgpack"))
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/msgpack"
+    assert "Accept" in response.headers["Vary"]
+    assert msgpack.unpackb(response.get_data()) == json_response.get_json()
+
+
+def test_get_plans_groups_prices_under_interval(client, db, jwt_headers):
+    payload = {
+        "name": "Basic",
+        "description": "Best plan for students",
+        "intervals": [
+            {
+                "interval": "month",
+                "interval_count": 1,
+                "prices": [
+                    {"currency": "USD", "amount": 1000},
+                    {"currency": "EUR", "amount": 900}
+                ]
+            }
+        ]
+    }
+    client.post("/api/v1/plan", json=payload, headers=jwt_headers)
+
+    plans = client.get("/api/v1/plan", headers=jwt_headers).get_json()['plans']
+    assert len(plans) == 1
+    assert len(plans[0]['intervals']) == 1
+    assert sorted(price['currency'] for price in plans[0]['intervals'][0]['prices']) == ["EUR", "USD"]
@@ -0,0 +1,139 @@
+import json
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import delete, event, select
+from app.models import Plan, PlanCatalog, PlanInterval, PlanIntervalPrice
+from app.plan_catalog import ALL_CURRENCIES, plan_catalog_payload, plan_catalog_statement, refresh_plan_catalog
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def seed_plans(db, count=4):
+    plans = []
+    for index in range(count):
+        plan = Plan(name=f"Plan {index}", description="desc", is_active=True, created_at=START + timedelta(minutes=index))
+        interval = PlanInterval(plan=plan, interval="month", interval_count=1, is_active=True)
+        db.session.add(PlanIntervalPrice(interval=interval, currency="USD", amount=1000 + index, is_active=True))
+        if index % 2:
+            db.session.add(PlanIntervalPrice(interval=interval, currency="EUR", amount=900 + index, is_active=True))
+        plans.append(plan)
+    db.session.commit()
+    return plans
+
+
+def stored_documents(db):
+    return {
+        currency: json.loads(document)
+        for currency, document in db.session.execute(select(PlanCatalog.currency, PlanCatalog.document))
+    }
+
+
+def rendered_documents(db):
+    """What a full render from the catalog tables gives, per stored currency."""
+    rows = db.session.execute(plan_catalog_statement()).all()
+    documents = {ALL_CURRENCIES: plan_catalog_payload(rows)}
+    for currency in {price.currency for _, _, price in rows}:
+        documents[currency] = plan_catalog_payload([row for row in rows if row[2].currency == currency])
+    return documents
+
+
+def capture_statements(engine, fn):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        fn()
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    return statements
+
+
+def test_documents_are_written_with_the_change(client, db, jwt_headers):
+    seed_plans(db)
+    payload = {
+        "name": "Created",
+        "description": "desc",
+        "intervals": [{"interval": "year", "interval_count": 1, "prices": [{"currency": "GBP", "amount": 5000}]}],
+    }
+    assert client.post("/api/v1/plan", json=payload, headers=jwt_headers).status_code == 201
+
+    assert stored_documents(db) == rendered_documents(db)
+    assert set(stored_documents(db)) == {ALL_CURRENCIES, "USD", "EUR", "GBP"}
+
+
+def test_activation_changes_only_rerender_the_touched_plan(app, db):
+    plans = seed_plans(db)
+    price = PlanIntervalPrice.query.filter_by(interval_id=plans[1].intervals[0].id, currency="EUR").one()
+
+    def deactivate():
+        price.is_active = False
+        db.session.commit()
+
+    statements = capture_statements(db.engine, deactivate)
+
+    catalog_reads = [s for s in statements if "FROM plans JOIN plan_intervals" in s]
+    assert len(catalog_reads) == 1 and "plans.id IN" in catalog_reads[0]
+    documents = stored_documents(db)
+    assert documents == rendered_documents(db)
+    assert [plan['name'] for plan in documents["EUR"]['plans']] == ["Plan 3"]
+
+    plans[3].is_active = False
+    db.session.commit()
+    assert "EUR" not in stored_documents(db)
+    assert stored_documents(db) == rendered_documents(db)
+
+
+def test_bulk_writes_refresh_the_documents(client, db, jwt_headers):
+    seed_plans(db)
+    payload = {"plans": [
+        {"name": f"Bulk {index}", "description": "desc",
+         "intervals": [{"interval": "month", "interval_count": 1, "prices": [{"currency": "JPY", "amount": 100}]}]}
+        for index in range(3)
+    ]}
+    assert client.post("/api/v1/plan/bulk", json=payload, headers=jwt_headers).status_code == 201
+    assert len(stored_documents(db)["JPY"]['plans']) == 3
+
+    Plan.query.filter(Plan.name.like("Bulk%")).update({"is_active": False}, synchronize_session=False)
+    db.session.commit()
+    assert "JPY" not in stored_documents(db)
+    assert stored_documents(db) == rendered_documents(db)
+
+
+def test_get_plans_is_a_primary_key_read(app, client, db, jwt_headers):
+    seed_plans(db)
+    expected = app.json.encode(plan_catalog_payload(db.session.execute(plan_catalog_statement("EUR")).all()))
+
+    statements = capture_statements(db.engine, lambda: client.get("/api/v1/plan?currency=EUR", headers=jwt_headers))
+    response = client.get("/api/v1/plan?currency=EUR", headers=jwt_headers)
+
+    assert response.get_data() == expected
+    assert not any("plan_interval_prices" in statement for statement in statements)
+    assert any("FROM plan_catalog" in statement for statement in statements)
+    assert client.get("/api/v1/plan?currency=XXX", headers=jwt_headers).get_json() == {
+        "message": "Successfully retrieved plans", "plans": [],
+    }
+
+
+def test_currencies_are_matched_in_any_case(client, db, jwt_headers):
+    seed_plans(db)
+    expected = client.get("/api/v1/plan?currency=EUR", headers=jwt_headers).get_data()
+
+    response = client.get("/api/v1/plan?currency=eur", headers=jwt_headers)
+    assert response.get_data() == expected
+    assert response.get_json()["plans"]
+
+
+def test_unbuilt_table_falls_back_and_is_rebuilt_by_the_cli(app, client, db, jwt_headers):
+    seed_plans(db)
+    db.session.execute(delete(PlanCatalog))
+    db.session.commit()
+
+    response = client.get("/api/v1/plan", headers=jwt_headers)
+    assert len(response.get_json()['plans']) == 4
+
+    # an incremental refresh of an unbuilt table builds it whole
+    assert refresh_plan_catalog(db.session, {"no-such-plan"}) == 3
+    db.session.rollback()
+
+    result = app.test_cli_runner().invoke(args=['catalog', 'rebuild'])
+    assert result.exit_code == 0, result.output
+    assert stored_documents(db) == rendered_documents(db)
@@ -0,0 +1,34 @@
+from app.pool import InstrumentedQueuePool, pool_stats
+
+
+def test_pool_stats_endpoint_requires_admin(client, jwt_headers, admin_jwt_headers):
+    assert client.get('/internal/pool', headers=jwt_headers).status_code == 403
+
+    response = client.get('/internal/pool', headers=admin_jwt_headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['pid']
+    assert 'status' in data['pools']['default']
+
+
+def test_instrumented_pool_counts_waits_overflow_and_timeouts(tmp_path):
+    import pytest
+    from sqlalchemy import create_engine, exc, text
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}", poolclass=InstrumentedQueuePool,
+                           pool_size=1, max_overflow=1, pool_timeout=0.05)
+    first = engine.connect()
+    second = engine.connect()
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    first.close()
+    second.close()
+    with engine.connect() as connection:
+        connection.execute(text('select 1'))
+
+    stats = engine.pool.stats.as_dict()
+    assert stats['checkouts'] == 3
+    assert stats['overflow_checkouts'] == 1
+    assert stats['timeouts'] == 1
+    assert stats['wait_ms_max'] >= 50
+    engine.dispose()
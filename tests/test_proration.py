@@ -0,0 +1,160 @@
+import csv
+import itertools
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from fractions import Fraction
+import numpy as np
+from app.models import User, Plan, PlanInterval, PlanIntervalPrice, Subscription
+from app.proration import prorate, prorate_batch
+
+NOW = datetime(2025, 6, 1, 12, 0, tzinfo=timezone.utc)
+_users = itertools.count()
+
+
+def exact_charge(amount_paid, total_days, days_left, new_amount):
+    return int(new_amount - Fraction(amount_paid * days_left, total_days))
+
+
+def random_periods(count, seed=7):
+    rng = random.Random(seed)
+    for _ in range(count):
+        start = NOW - timedelta(days=rng.randint(0, 400), seconds=rng.randint(0, 86399))
+        end = start + timedelta(days=rng.choice([0, 1, 7, 30, 31, 365]), seconds=rng.randint(0, 86399))
+        yield rng.randint(0, 500_000), start, end, rng.randint(0, 900_000)
+
+
+def test_prorate_uses_whole_days_and_exact_integers():
+    start = NOW - timedelta(days=10)
+    end = start + timedelta(days=30)
+
+    proration = prorate(3000, start, end, 6000, now=NOW)
+
+    assert (proration.total_days, proration.days_left) == (30, 20)
+    assert proration.charge == 4000
+    assert proration.credit == 2000
+    # 366 / 365 * 365 is 366.00000000000006 in floats, the old formula charged 1 too little
+    assert prorate(366, NOW, NOW + timedelta(days=365, hours=1), 866, now=NOW).charge == 500
+    assert prorate(3000, start, NOW, 6000, now=NOW) is None
+    assert prorate(3000, start, None, 6000, now=NOW) is None
+
+
+def test_prorate_matches_exact_rational_arithmetic():
+    for amount_paid, start, end, new_amount in random_periods(2000):
+        proration = prorate(amount_paid, start, end, new_amount, now=NOW)
+        total_days, days_left = (end - start).days, (end - NOW).days
+        if total_days <= 0 or days_left <= 0:
+            assert proration is None
+        else:
+            assert proration.charge == exact_charge(amount_paid, total_days, days_left, new_amount)
+
+
+def test_batch_matches_the_scalar_rules():
+    cases = list(random_periods(5000, seed=11))
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    micros = lambda value: (value - epoch) // timedelta(microseconds=1)
+    new_amount = 4321
+
+    eligible, credit, charge = prorate_batch(
+        np.array([case[0] for case in cases], dtype=np.int64),
+        np.array([micros(case[1]) for case in cases], dtype=np.int64),
+        np.array([micros(case[2]) for case in cases], dtype=np.int64),
+        new_amount,
+        micros(NOW),
+    )
+
+    for index, (amount_paid, start, end, _) in enumerate(cases):
+        proration = prorate(amount_paid, start, end, new_amount, now=NOW)
+        assert bool(eligible[index]) == (proration is not None)
+        if proration is not None:
+            assert (int(credit[index]), int(charge[index])) == (proration.credit, proration.charge)
+
+
+def seed_plan(db, interval='month', amount=1000):
+    plan = Plan(name=f"Prorated {next(_users)}", is_active=True)
+    plan_interval = PlanInterval(plan=plan, interval=interval, interval_count=1 if interval != 'one_time' else 0, is_active=True)
+    price = PlanIntervalPrice(interval=plan_interval, currency='USD', amount=amount, is_active=True)
+    db.session.add(plan)
+    db.session.flush()
+    return plan, price
+
+
+def subscribe(db, plan, price, interval, amount_paid, start, end):
+    index = next(_users)
+    user = User(first_name="Prorated", last_name=str(index), email=f"prorated-{index}@example.com", password="x")
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Subscription(
+        user_id=user.id, plan_id=plan.id, price_id=price.id, interval=interval,
+        current_period_start=start, current_period_end=end, status='active', amount_paid=amount_paid,
+    ))
+
+
+def seed_subscribers(db):
+    plan, price = seed_plan(db)
+    now = datetime.now(timezone.utc)
+    expected = []
+    for index in range(20):
+        start = now - timedelta(days=index)
+        end = start + timedelta(days=30, hours=1)
+        subscribe(db, plan, price, 'month', 1000 + index, start, end)
+        expected.append(prorate(1000 + index, start, end, 2500, now=now))
+    subscribe(db, plan, price, 'month', 1000, now - timedelta(days=40), now - timedelta(days=10))
+    subscribe(db, plan, price, 'year', 9000, now, now + timedelta(days=365))
+    subscribe(db, plan, price, 'one_time', 500, now, now + timedelta(days=30))
+    _, target = seed_plan(db, amount=2500)
+    db.session.commit()
+    return plan, target, expected
+
+
+def test_admin_endpoint_aggregates_the_impact(client, db, admin_jwt_headers):
+    plan, target, expected = seed_subscribers(db)
+
+    response = client.get(
+        f'/api/v1/subscription/proration-impact?plan_id={plan.id}&new_price_id={target.id}', headers=admin_jwt_headers
+    )
+
+    assert response.status_code == 200
+    impact = response.json['impact']
+    assert impact['subscriptions'] == 23
+    assert impact['eligible'] == 20
+    assert impact['skipped'] == {"one_time": 1, "interval_mismatch": 1, "ended": 1}
+    assert impact['new_amount'] == 2500
+    assert impact['charge_total'] == sum(p.charge for p in expected)
+    assert impact['credit_total'] == sum(p.credit for p in expected)
+    assert impact['charge_min'] == min(p.charge for p in expected)
+    assert impact['charge_max'] == max(p.charge for p in expected)
+    assert impact['amount_paid_total'] == sum(range(1000, 1020))
+
+
+def test_proration_impact_is_admin_only_and_validated(client, db, jwt_headers, admin_jwt_headers):
+    plan, target, _ = seed_subscribers(db)
+    path = '/api/v1/subscription/proration-impact'
+
+    assert client.get(f'{path}?plan_id={plan.id}&amount=10', headers=jwt_headers).status_code == 403
+    assert client.get(f'{path}?amount=10', headers=admin_jwt_headers).status_code == 400
+    assert client.get(f'{path}?plan_id={plan.id}', headers=admin_jwt_headers).status_code == 400
+    assert client.get(f'{path}?plan_id={plan.id}&amount=10&new_price_id={target.id}', headers=admin_jwt_headers).status_code == 400
+    assert client.get(f'{path}?plan_id={plan.id}&new_price_id={plan.id}', headers=admin_jwt_headers).status_code == 404
+
+    response = client.get(f'{path}?plan_id={plan.id}&amount=2500', headers=admin_jwt_headers)
+    assert response.status_code == 200
+    assert response.json['impact']['eligible'] == 21
+    assert response.json['impact']['skipped']['interval_mismatch'] == 0
+
+
+def test_cli_writes_every_subscription(app, db, tmp_path):
+    plan, target, expected = seed_subscribers(db)
+    output = tmp_path / 'impact.csv'
+
+    result = app.test_cli_runner().invoke(args=[
+        'subscriptions', 'proration-impact', '--plan', plan.id, '--to-price', target.id,
+        '--chunk-size', '7', '--output', str(output),
+    ])
+
+    assert result.exit_code == 0, result.output
+    assert json.loads(result.output)['charge_total'] == sum(p.charge for p in expected)
+    with open(output) as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 21
+    assert sum(int(row['charge']) for row in rows) == sum(p.charge for p in expected)
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from flask_jwt_extended import create_access_token
+from app import create_app, db as _db
+from app.models import User, Plan, PlanInterval, PlanIntervalPrice, Subscription
+from app.replicas import read_only
+from config import config, TestingConfig
+
+
+@pytest.fixture
+def replicated_app(tmp_path):
+    # three SQLite files stand in for a primary and two replicas that never catch up
+    config['replicated'] = type('ReplicatedConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'primary.db'}",
+        'SQLALCHEMY_REPLICA_URLS': [f"sqlite:///{tmp_path / 'replica-a.db'}", f"sqlite:///{tmp_path / 'replica-b.db'}"],
+        'REPLICA_CHECK_INTERVAL': 0,
+    })
+    app = create_app('replicated')
+    with app.app_context():
+        for engine in _db.engines.values():
+            _db.metadata.create_all(engine)
+        yield app
+        _db.session.remove()
+        app.extensions['last_login_buffer'].flush()
+        for engine in _db.engines.values():
+            _db.metadata.drop_all(engine)
+    # the db object is shared by every app, forget the binds only this one has
+    for bind in ('replica_0', 'replica_1'):
+        _db.metadatas.pop(bind, None)
+
+
+def add_subscription(user_id):
+    plan = Plan(name="Replicated", is_active=True)
+    _db.session.add(plan)
+    _db.session.flush()
+    interval = PlanInterval(plan_id=plan.id, interval="month", interval_count=1, is_active=True)
+    _db.session.add(interval)
+    _db.session.flush()
+    price = PlanIntervalPrice(interval_id=interval.id, amount=1000, currency='USD', is_active=True)
+    _db.session.add(price)
+    _db.session.flush()
+    now = datetime.now(timezone.utc)
+    _db.session.add(Subscription(
+        user_id=user_id, plan_id=plan.id, price_id=price.id, interval='month', current_period_start=now,
+        current_period_end=now + timedelta(days=30), status='active', amount_paid=1000,
+    ))
+    _db.session.commit()
+
+
+def test_read_only_views_read_from_replicas_with_fallback(replicated_app):
+    user = User(first_name="Rep", last_name="Lica", email="replica@example.com", password="x")
+    _db.session.add(user)
+    _db.session.commit()
+    add_subscription(user.id)
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user.id)}"}
+    client = replicated_app.test_client()
+
+    # the replicas are empty
+    assert client.get('/api/v1/subscription', headers=headers).get_json()['subscriptions'] == []
+
+    router = replicated_app.extensions['replica_router']
+    router._lag_probe = lambda connection: 60
+    assert len(client.get('/api/v1/subscription', headers=headers).get_json()['subscriptions']) == 1
+
+
+def test_replicas_are_used_round_robin_and_skipped_when_down(replicated_app):
+    router = replicated_app.extensions['replica_router']
+    replica_a, replica_b = _db.engines['replica_0'], _db.engines['replica_1']
+
+    picks = [router.pick() for _ in range(4)]
+    assert picks.count(replica_a) == 2 and picks.count(replica_b) == 2
+
+    router.mark_down(replica_a)
+    router._check_interval = 60
+    assert {router.pick() for _ in range(4)} == {replica_b}
+
+
+def test_reads_after_a_write_stick_to_the_primary(replicated_app):
+    @read_only()
+    def view():
+        binds = [_db.session.get_bind(Plan)]
+        _db.session.add(Plan(name="Written", is_active=True))
+        _db.session.flush()
+        binds.append(_db.session.get_bind(Plan))
+        _db.session.rollback()
+        return binds
+
+    with replicated_app.test_request_context():
+        first, after_write = view()
+        assert first is not _db.engine
+        assert after_write is _db.engine
+        assert _db.session.get_bind(Plan) is _db.engine
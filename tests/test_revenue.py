@@ -0,0 +1,190 @@
+from datetime import datetime, time, timedelta, timezone
+from itertools import count
+import pytest
+from sqlalchemy import delete, select
+from app import create_app, db as _db, revenue
+from app.lifecycle import sweep_due_subscriptions
+from app.models import Plan, PlanInterval, PlanIntervalPrice, RevenueRollup, Subscription, User
+from app.revenue import backfill_revenue, monthly_amount, roll_up_revenue
+from config import config, TestingConfig
+
+TODAY = datetime.now(timezone.utc).date()
+FIRST_DAY = TODAY - timedelta(days=20)
+_users = count()
+
+
+def at(day, hour=12):
+    return datetime.combine(day, time(hour), timezone.utc)
+
+
+def make_price(db, interval='month', interval_count=1, amount=1000, currency='USD'):
+    plan = Plan(name=f"Revenue {next(_users)}", is_active=True, description="desc")
+    plan_interval = PlanInterval(plan=plan, interval=interval, interval_count=interval_count, is_active=True)
+    price = PlanIntervalPrice(interval=plan_interval, amount=amount, currency=currency, is_active=True)
+    db.session.add(price)
+    db.session.flush()
+    return price
+
+
+def subscribe(db, price, amount_paid, created, ended=None, upgraded_from=None):
+    index = next(_users)
+    user = User(first_name="Revenue", last_name=str(index), email=f"revenue-{index}@example.com", password="x")
+    db.session.add(user)
+    db.session.flush()
+    subscription = Subscription(
+        user_id=user.id, plan_id=price.interval.plan_id, price_id=price.id, interval=price.interval.interval,
+        current_period_start=created, current_period_end=created + timedelta(days=30),
+        status='ended' if ended else 'active', amount_paid=amount_paid, created_at=created, ended_at=ended,
+        upgraded_from_subscription_id=upgraded_from.id if upgraded_from else None,
+    )
+    db.session.add(subscription)
+    db.session.flush()
+    return subscription
+
+
+def seed(db):
+    monthly, yearly = make_price(db), make_price(db, 'year', amount=12000)
+    quarterly, euro = make_price(db, 'month', 3, 3000), make_price(db, currency='EUR')
+    one_time = make_price(db, 'one_time', 0, 5000)
+
+    subscribe(db, monthly, 1000, at(FIRST_DAY))
+    subscribe(db, yearly, 12000, at(FIRST_DAY, 18))
+    subscribe(db, quarterly, 3000, at(FIRST_DAY + timedelta(days=2)), ended=at(FIRST_DAY + timedelta(days=9)))
+    upgraded = subscribe(db, monthly, 1000, at(FIRST_DAY + timedelta(days=3)), ended=at(FIRST_DAY + timedelta(days=5)))
+    subscribe(db, yearly, 18000, at(FIRST_DAY + timedelta(days=5)), upgraded_from=upgraded)
+    subscribe(db, euro, 900, at(FIRST_DAY + timedelta(days=4)))
+    subscribe(db, one_time, 5000, at(FIRST_DAY + timedelta(days=4)))
+    db.session.commit()
+
+
+def brute_force(db, day):
+    """MRR and active subscriptions per currency at the end of `day`."""
+    totals = {}
+    for subscription in Subscription.query.all():
+        price = db.session.get(PlanIntervalPrice, subscription.price_id)
+        value = monthly_amount(subscription.amount_paid, subscription.interval, price.interval.interval_count)
+        if value is None or subscription.created_at.date() > day:
+            continue
+        if subscription.ended_at is not None and subscription.ended_at.date() <= day:
+            continue
+        mrr, active = totals.get(price.currency, (0, 0))
+        totals[price.currency] = (mrr + value, active + 1)
+    return totals
+
+
+def rolled_up(db, day):
+    totals = {}
+    for row in db.session.execute(select(RevenueRollup).where(RevenueRollup.day <= day).order_by(RevenueRollup.day)).scalars():
+        totals[row.currency] = (row.mrr, row.active_subscriptions)
+    return {currency: total for currency, total in totals.items() if total != (0, 0)}
+
+
+def rows(db):
+    return [
+        (row.day, row.currency, row.mrr, row.new_mrr, row.expansion_mrr, row.churned_mrr, row.active_subscriptions)
+        for row in db.session.execute(select(RevenueRollup).order_by(RevenueRollup.day, RevenueRollup.currency)).scalars()
+    ]
+
+
+def test_monthly_amount_uses_the_plan_interval_lengths():
+    assert monthly_amount(1000, 'month', 1) == 1000
+    assert monthly_amount(3000, 'month', 3) == 1000
+    assert monthly_amount(12000, 'year', 1) == 1000
+    assert monthly_amount(700, 'week', 1) == 3044
+    assert monthly_amount(100, 'day', 1) == 3044
+    assert monthly_amount(5000, 'one_time', 0) is None
+
+
+def test_backfill_buckets_every_movement(app, db):
+    seed(db)
+
+    backfill_revenue(FIRST_DAY, TODAY + timedelta(days=1), chunk_days=4)
+
+    by_day = {(row[0], row[1]): row for row in rows(db)}
+    assert by_day[(FIRST_DAY, 'USD')][2:] == (2000, 2000, 0, 0, 2)
+    # the upgrade: 1000 a month replaced by 18000 a year
+    assert by_day[(FIRST_DAY + timedelta(days=5), 'USD')][4] == 500
+    assert by_day[(FIRST_DAY + timedelta(days=9), 'USD')][5] == 1000
+    for offset in range(21):
+        day = FIRST_DAY + timedelta(days=offset)
+        assert rolled_up(db, day) == brute_force(db, day), day
+
+
+def test_rollup_only_reads_changed_subscriptions(app, db, monkeypatch):
+    monkeypatch.setattr(revenue, 'WATERMARK_OVERLAP', timedelta(0))
+    seed(db)
+    assert roll_up_revenue()['days'] == 21
+
+    active = Subscription.query.filter_by(status='active', interval='month').first()
+    active.status, active.ended_at = 'ended', at(TODAY - timedelta(days=2))
+    subscribe(db, make_price(db, currency='GBP', amount=700), 700, at(TODAY - timedelta(days=1)))
+    db.session.commit()
+
+    stats = roll_up_revenue()
+    assert stats['subscriptions'] == 2
+    assert rolled_up(db, TODAY) == brute_force(db, TODAY)
+
+    incremental = rows(db)
+    db.session.execute(delete(RevenueRollup))
+    backfill_revenue(FIRST_DAY, TODAY + timedelta(days=1))
+    assert rows(db) == incremental
+
+
+def test_rollup_during_a_sweep_misses_no_chunk(app, db, monkeypatch):
+    monkeypatch.setattr(revenue, 'WATERMARK_OVERLAP', timedelta(0))
+    seed(db)
+    price = make_price(db)
+    for days in (6, 7, 8, 9):
+        subscription = subscribe(db, price, 1000, at(FIRST_DAY + timedelta(days=days)))
+        subscription.current_period_end = at(FIRST_DAY + timedelta(days=days + 2))
+    db.session.commit()
+    roll_up_revenue()
+
+    # the rollup runs after the first chunk is committed, and the second
+    # is updated after its watermark
+    sweep_due_subscriptions(chunk_size=2, resume=False, report=lambda total, rate: roll_up_revenue())
+
+    assert Subscription.query.filter_by(status='active', price_id=price.id).count() == 0
+    assert rolled_up(db, TODAY) == brute_force(db, TODAY)
+    incremental = rows(db)
+    db.session.execute(delete(RevenueRollup))
+    backfill_revenue(FIRST_DAY, TODAY + timedelta(days=1))
+    assert rows(db) == incremental
+
+
+def test_rollup_cli(app, db):
+    seed(db)
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['revenue', 'rollup', '--workers', '1'])
+    assert result.exit_code == 0, result.output
+    result = runner.invoke(args=['revenue', 'backfill', '--start', str(TODAY), '--end', str(FIRST_DAY)])
+    assert result.exit_code != 0
+    assert rolled_up(db, TODAY) == brute_force(db, TODAY)
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    config['revenue_file'] = type('RevenueFileConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'revenue.db'}",
+    })
+    app = create_app('revenue_file')
+    with app.app_context():
+        _db.create_all()
+        yield app
+        _db.session.remove()
+        app.extensions['last_login_buffer'].flush()
+        _db.drop_all()
+    del config['revenue_file']
+
+
+def test_parallel_backfill_matches_a_serial_one(file_app):
+    seed(_db)
+    backfill_revenue(FIRST_DAY, TODAY + timedelta(days=1), workers=1, chunk_days=3)
+    serial = rows(_db)
+
+    _db.session.execute(delete(RevenueRollup))
+    _db.session.commit()
+    backfill_revenue(FIRST_DAY, TODAY + timedelta(days=1), workers=3, chunk_days=3)
+
+    assert rows(_db) == serial
@@ -0,0 +1,136 @@
+from datetime import datetime, timedelta, timezone
+from flask_jwt_extended import create_access_token, decode_token
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+from app.models import User, TokenRevocation
+from app.revocation import BloomFilter, RevocationList
+
+
+def make_user(db, email):
+    user = User(first_name="Token", last_name="Holder", email=email, password="x")
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def earlier_token(identity):
+    """A token issued in the previous second, which a revocation of all the
+    user's tokens made now covers."""
+    issued_at = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(seconds=1)
+    return create_access_token(identity=identity, additional_claims={"iat": issued_at})
+
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def count_statements(engine, fn):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        fn()
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+    return len(statements)
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.001)
+    for index in range(1000):
+        bloom.add(f'jti:{index}')
+
+    assert all(f'jti:{index}' in bloom for index in range(1000))
+    false_positives = sum(f'jti:other-{index}' in bloom for index in range(10000))
+    assert false_positives < 50
+
+    # refreshes add the rows inside their overlap again, which must not
+    # bring the filter closer to a rebuild
+    count = bloom.count
+    bloom.add('jti:0')
+    assert bloom.count == count
+
+
+def test_logout_revokes_only_the_current_token(client, db, test_user):
+    token = create_access_token(identity=test_user.id)
+    other = create_access_token(identity=test_user.id)
+
+    assert client.get('/api/v1/subscription', headers=bearer(token)).status_code == 200
+    assert client.post('/api/v1/auth/logout', headers=bearer(token)).status_code == 200
+
+    response = client.get('/api/v1/subscription', headers=bearer(token))
+    assert response.status_code == 401
+    assert response.json == {"msg": "Token has been revoked"}
+    assert client.get('/api/v1/subscription', headers=bearer(other)).status_code == 200
+
+
+def test_logout_all_revokes_every_earlier_token_of_the_user(client, db, test_user):
+    tokens = [create_access_token(identity=test_user.id)] + [earlier_token(test_user.id) for _ in range(2)]
+    bystander = create_access_token(identity=make_user(db, "bystander@example.com").id)
+
+    assert client.post('/api/v1/auth/logout-all', headers=bearer(tokens[0])).status_code == 200
+
+    for token in tokens:
+        assert client.get('/api/v1/subscription', headers=bearer(token)).status_code == 401
+    assert client.get('/api/v1/subscription', headers=bearer(bystander)).status_code == 200
+
+
+def test_logging_in_again_right_after_logout_all_works(client, db):
+    user = User(first_name="Token", last_name="Holder", email="again@example.com", password=generate_password_hash("secret1"))
+    db.session.add(user)
+    db.session.commit()
+    token = create_access_token(identity=user.id)
+    assert client.post('/api/v1/auth/logout-all', headers=bearer(token)).status_code == 200
+
+    response = client.post('/api/v1/auth/login', json={"email": "again@example.com", "password": "secret1"})
+    assert response.status_code == 200
+    assert client.get('/api/v1/subscription', headers=bearer(response.json["token"])).status_code == 200
+    assert client.get('/api/v1/subscription', headers=bearer(token)).status_code == 401
+
+
+def test_admin_can_revoke_a_users_sessions(client, db, admin_jwt_headers, jwt_headers):
+    target = make_user(db, "target@example.com")
+    token = earlier_token(target.id)
+
+    assert client.post('/api/v1/auth/revoke', json={"user_id": target.id}, headers=bearer(token)).status_code == 403
+    assert client.post('/api/v1/auth/revoke', json={"user_id": "00000000-0000-0000-0000-000000000000"}, headers=admin_jwt_headers).status_code == 404
+    assert client.post('/api/v1/auth/revoke', json={"user_id": target.id}, headers=admin_jwt_headers).status_code == 200
+
+    assert client.get('/api/v1/subscription', headers=bearer(token)).status_code == 401
+    assert client.get('/api/v1/subscription', headers=jwt_headers).status_code == 200
+
+
+def test_unrevoked_tokens_are_checked_without_queries(app, db, test_user):
+    revocations = app.extensions['token_revocations']
+    revoked = create_access_token(identity=make_user(db, "revoked@example.com").id)
+    client = app.test_client()
+    client.post('/api/v1/auth/logout', headers=bearer(revoked))
+
+    payload = decode_token(create_access_token(identity=test_user.id))
+    assert count_statements(db.engine, lambda: revocations.is_revoked(payload)) == 0
+    assert count_statements(db.engine, lambda: revocations.is_revoked(decode_token(revoked))) == 1
+
+
+def test_other_workers_see_revocations_after_a_refresh(app, db, test_user):
+    worker = RevocationList(app, capacity=1000, refresh_interval=0)
+    token = create_access_token(identity=test_user.id)
+    payload = decode_token(token)
+    assert not worker.is_revoked(payload)
+
+    app.test_client().post('/api/v1/auth/logout', headers=bearer(token))
+    assert not worker.is_revoked(payload)
+
+    assert worker.refresh() == 1
+    assert worker.is_revoked(payload)
+
+
+def test_rebuild_drops_expired_revocations(app, db):
+    now = datetime.now(timezone.utc)
+    db.session.add(TokenRevocation(jti="expired", expires_at=now - timedelta(minutes=1)))
+    db.session.add(TokenRevocation(jti="live", expires_at=now + timedelta(minutes=1)))
+    db.session.commit()
+
+    worker = RevocationList(app, capacity=1000, refresh_interval=0)
+    assert worker.rebuild() == 1
+    assert worker.is_revoked({"jti": "live", "sub": "someone"})
+    assert not worker.is_revoked({"jti": "expired", "sub": "someone"})
@@ -0,0 +1,26 @@
+from datetime import datetime, timedelta, timezone
+from flask import json
+from app.serialization import format_datetime, format_isoformat
+
+
+def test_format_datetime_matches_strftime():
+    value = datetime(2024, 2, 9, 7, 5, 3, 120, tzinfo=timezone.utc)
+    assert format_datetime(value) == value.strftime("%Y-%m-%d %H:%M:%S")
+    assert format_datetime(datetime(999, 1, 1)) == "0999-01-01 00:00:00"
+    assert format_datetime(None) is None
+
+
+def test_format_isoformat_keeps_offset():
+    utc = datetime(2024, 2, 9, 12, tzinfo=timezone.utc)
+    shifted = utc.astimezone(timezone(timedelta(hours=2)))
+    assert format_isoformat(utc) == utc.isoformat()
+    assert format_isoformat(shifted) == shifted.isoformat()
+
+
+def test_json_output_matches_default_provider(app):
+    obj = {"b": 1, "a": [None, True, 1.5, "é"], "at": datetime(2024, 2, 9, tzinfo=timezone.utc)}
+    with app.app_context():
+        assert json.loads(json.dumps(obj)) == {
+            "a": [None, True, 1.5, "é"], "at": "Fri, 09 Feb 2024 00:00:00 GMT", "b": 1
+        }
+        assert json.dumps(obj).index('"a"') < json.dumps(obj).index('"b"')
@@ -1,5 +1,6 @@
 import time
-from app.models import User, Plan, PlanInterval, PlanIntervalPrice, PlanUpgrade
+from datetime import datetime, timedelta, timezone
+from app.models import User, Plan, PlanInterval, PlanIntervalPrice, PlanUpgrade, Subscription
 
 
 
@@ -14,6 +15,15 @@ def test_create_subscription_success(client, jwt_headers, test_user, active_plan
     assert data["data"]["status"] == "active"
 
 
+def test_create_duplicate_subscription_conflicts(client, jwt_headers, test_user, active_plan_setup):
+    _, _, price = active_plan_setup
+
+    assert client.post("/api/v1/subscription", json={"price_id": str(price.id)}, headers=jwt_headers).status_code == 201
+    response = client.post("/api/v1/subscription", json={"price_id": str(price.id)}, headers=jwt_headers)
+    assert response.status_code == 409
+    assert response.get_json() == {"message": "You have an active subscription with this plan"}
+
+
 def test_upgrade_subscription(client, jwt_headers, active_subscription, active_plan_setup, db):
     # Create a new plan and price for upgrade
     plan = Plan(name="Premium", is_active=True, description="Premium plan")
@@ -65,10 +75,171 @@ def test_get_subscriptions(client, jwt_headers, active_subscription):
     assert any(sub['id'] == str(active_subscription.id) for sub in data['subscriptions'])
 
 
+def test_get_subscriptions_paginates_with_cursor(client, jwt_headers, test_user, active_plan_setup, db):
+    from datetime import datetime, timedelta, timezone
+    from app.models import Subscription
+
+    plan, interval, price = active_plan_setup
+    created = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for i in range(5):
+        db.session.add(Subscription(
+            user_id=test_user.id,
+            plan_id=plan.id,
+            price_id=price.id,
+            interval=interval.interval,
+            current_period_start=created,
+            current_period_end=created + timedelta(days=30),
+            status='ended',
+            amount_paid=1000,
+            created_at=created + timedelta(minutes=i % 3),
+        ))
+    db.session.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        url = '/api/v1/subscription?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        data = client.get(url, headers=jwt_headers).get_json()
+        assert len(data['subscriptions']) <= 2
+        seen.extend(sub['id'] for sub in data['subscriptions'])
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+
+    expected = [sub.id for sub in Subscription.query.order_by(Subscription.created_at, Subscription.id)]
+    assert seen == expected
+
+
+def test_get_subscriptions_invalid_cursor(client, jwt_headers):
+    response = client.get('/api/v1/subscription?cursor=not-a-cursor', headers=jwt_headers)
+    assert response.status_code == 400
+
+
 def test_get_subscriptions_performance(client, jwt_headers):
     start_time = time.time()
     response = client.get('/api/v1/subscription', headers=jwt_headers)
     end_time = time.time()
     duration = end_time - start_time
     assert response.status_code == 200
-    assert duration < 0.5  
\ No newline at end of file
+    assert duration < 0.5  
+
+def test_resolve_price_cached_and_invalidated_on_deactivation(app, db, active_plan_setup):
+    from app.catalog import resolve_price
+
+    plan, interval, price = active_plan_setup
+    snapshot = resolve_price(price.id)
+    assert snapshot[0].id == plan.id
+    assert snapshot[2].amount == 1000
+    assert resolve_price(price.id) is snapshot
+
+    price.is_active = False
+    db.session.commit()
+    assert resolve_price(price.id) is None
+
+
+def test_get_subscriptions_invalid_plan_id(client, jwt_headers):
+    response = client.get('/api/v1/subscription?plan_id=not-a-uuid', headers=jwt_headers)
+    assert response.status_code == 400
+    assert "plan_id" in response.get_json()
+
+
+def test_export_subscriptions_streams_ndjson(app, client, db, test_user, active_plan_setup, admin_jwt_headers):
+    import json
+    plan, interval, price = active_plan_setup
+    app.config['SUBSCRIPTION_EXPORT_BATCH_SIZE'] = 2
+    now = datetime.now(timezone.utc)
+    for i, status in enumerate(['active', 'active', 'ended', 'active', 'cancelled']):
+        user = User(first_name="Export", last_name=str(i), email=f"export-{i}@example.com", password="x")
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Subscription(
+            user_id=user.id, plan_id=plan.id, price_id=price.id, interval='month',
+            current_period_start=now, current_period_end=now + timedelta(days=30),
+            status=status, amount_paid=1000,
+        ))
+    db.session.commit()
+
+    response = client.get('/api/v1/subscription/export', headers=admin_jwt_headers)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(rows) == 5
+    assert [row['id'] for row in rows] == sorted(row['id'] for row in rows)
+
+    response = client.get(f'/api/v1/subscription/export?after={rows[1]["id"]}', headers=admin_jwt_headers)
+    assert [json.loads(line)['id'] for line in response.get_data(as_text=True).splitlines()] == [row['id'] for row in rows[2:]]
+
+    response = client.get(f'/api/v1/subscription/export?status=active&plan_id={plan.id}', headers=admin_jwt_headers)
+    assert len(response.get_data(as_text=True).splitlines()) == 3
+
+    since = (now + timedelta(days=1)).isoformat()
+    response = client.get('/api/v1/subscription/export', query_string={'since': since}, headers=admin_jwt_headers)
+    assert response.get_data(as_text=True) == ''
+
+
+def test_export_subscriptions_requires_admin(client, jwt_headers, admin_jwt_headers):
+    response = client.get('/api/v1/subscription/export', headers=jwt_headers)
+    assert response.status_code == 403
+
+    response = client.get('/api/v1/subscription/export?status=paused', headers=admin_jwt_headers)
+    assert response.status_code == 400
+    assert 'status' in response.get_json()
+
+
+def make_plan(db, name, prices):
+    plan = Plan(name=name, is_active=True, description=name)
+    db.session.add(plan)
+    db.session.flush()
+    for interval_name, currency, amount in prices:
+        interval = PlanInterval.query.filter_by(plan_id=plan.id, interval=interval_name).first()
+        if interval is None:
+            interval = PlanInterval(plan_id=plan.id, interval=interval_name, interval_count=1, is_active=True)
+            db.session.add(interval)
+            db.session.flush()
+        db.session.add(PlanIntervalPrice(interval_id=interval.id, amount=amount, currency=currency, is_active=True))
+    db.session.flush()
+    return plan
+
+
+def test_get_subscription_upgrades(client, jwt_headers, active_subscription, db):
+    plus = make_plan(db, "Plus", [("month", "USD", 2000), ("month", "EUR", 500), ("year", "USD", 20000)])
+    pro = make_plan(db, "Pro", [("month", "USD", 3000)])
+    db.session.add(PlanUpgrade(old_plan_id=active_subscription.plan_id, new_plan_id=plus.id, is_active=True))
+    db.session.add(PlanUpgrade(old_plan_id=plus.id, new_plan_id=pro.id, is_active=True))
+    db.session.commit()
+
+    url = f'/api/v1/subscription/{active_subscription.id}/upgrades'
+    upgrades = client.get(url, headers=jwt_headers).get_json()['upgrades']
+    assert [(u['plan']['name'], u['price']['currency'], u['price']['amount']) for u in upgrades] == [("Plus", "USD", 2000)]
+    assert upgrades[0]['path'] == [plus.id]
+
+    upgrades = client.get(f'{url}?max_hops=2', headers=jwt_headers).get_json()['upgrades']
+    assert [u['plan']['name'] for u in upgrades] == ["Plus", "Pro"]
+    assert upgrades[1]['path'] == [plus.id, pro.id]
+
+    PlanUpgrade.query.filter_by(old_plan_id=active_subscription.plan_id).update({'is_active': False})
+    db.session.commit()
+    assert client.get(url, headers=jwt_headers).get_json()['upgrades'] == []
+
+    response = client.patch('/api/v1/subscription_upgrade', json={
+        'subscription_id': str(active_subscription.id),
+        'new_price_id': str(PlanIntervalPrice.query.filter_by(amount=2000).first().id)
+    }, headers=jwt_headers)
+    assert response.status_code == 400
+
+
+def test_get_subscription_upgrades_not_found(client, jwt_headers):
+    response = client.get('/api/v1/subscription/00000000-0000-0000-0000-000000000000/upgrades', headers=jwt_headers)
+    assert response.status_code == 404
+    response = client.get('/api/v1/subscription/not-a-uuid/upgrades', headers=jwt_headers)
+    assert response.status_code == 404
+
+
+def test_upgrade_graph_shortest_path():
+    from app.upgrades import UpgradeGraph
+
+    graph = UpgradeGraph({'a': {'b', 'c'}, 'b': {'d'}, 'c': {'d'}, 'd': {'e'}}, {})
+    assert graph.allows('a', 'b') and not graph.allows('a', 'd')
+    assert graph.shortest_path('a', 'e') == ('b', 'd', 'e')
+    assert graph.shortest_path('a', 'e', max_hops=2) is None
+    assert graph.shortest_path('e', 'a') is None
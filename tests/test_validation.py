@@ -0,0 +1,79 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from marshmallow import ValidationError
+from app.api.auth import LoginSchema, RevokeSessionsSchema, SignupSchema
+from app.api.plan import BulkCreatePlanSchema, CreatePlanSchema
+from app.api.subscription import (
+    CancelSubscriptionSchema, CreateSubscriptionSchema, ExportSubscriptionSchema, ListSubscriptionSchema,
+    ProrationImpactSchema, SubscriptionCountersSchema, UpgradeSubscriptionSchema,
+)
+from app.validation import FlatValidator, validator
+
+FLAT = [
+    CreateSubscriptionSchema, UpgradeSubscriptionSchema, CancelSubscriptionSchema, RevokeSessionsSchema,
+    ExportSubscriptionSchema, SubscriptionCountersSchema,
+]
+ID = str(uuid.uuid4())
+PAYLOADS = [
+    None, [], "price", 42,
+    {},
+    {"price_id": ID},
+    {"price_id": uuid.UUID(ID).bytes},
+    {"price_id": "not-a-uuid"},
+    {"price_id": None},
+    {"price_id": 7},
+    {"price_id": ID, "extra": 1, "other": None},
+    {"subscription_id": ID, "new_price_id": ID},
+    {"subscription_id": ID, "new_price_id": "x"},
+    {"user_id": "{" + ID + "}"},
+    {"since": "2025-01-01T00:00:00", "status": "paused", "plan_id": ID, "after": "nope"},
+    {"since": "yesterday", "status": "active"},
+    {"day": "2025-02-30"},
+    {"day": "2025-01-31", "plan_id": ID},
+]
+
+
+def outcome(load, data):
+    try:
+        return "ok", load(data)
+    except ValidationError as err:
+        return "error", err.messages
+
+
+@pytest.mark.parametrize("schema_class", FLAT)
+def test_flat_schemas_load_like_marshmallow(schema_class):
+    fast = validator(schema_class)
+    assert isinstance(fast, FlatValidator)
+    for data in PAYLOADS:
+        assert outcome(fast.load, data) == outcome(schema_class().load, data), data
+
+
+def test_other_schemas_are_shared_marshmallow_instances():
+    for schema_class in (SignupSchema, LoginSchema, CreatePlanSchema, BulkCreatePlanSchema, ListSubscriptionSchema, ProrationImpactSchema):
+        assert isinstance(validator(schema_class), schema_class)
+        assert validator(schema_class) is validator(schema_class)
+
+
+def test_a_shared_schema_can_load_concurrently():
+    schema = validator(CreatePlanSchema)
+
+    def plan(index):
+        interval = "month" if index % 2 else "fortnight"
+        return {"name": f"  Plan {index} ", "description": "desc", "intervals": [
+            {"interval": interval, "interval_count": 1, "prices": [{"currency": "USD", "amount": index}]},
+        ]}
+
+    payloads = [plan(index) for index in range(400)]
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda data: outcome(schema.load, data), payloads))
+    assert results == [outcome(CreatePlanSchema().load, data) for data in payloads]
+
+
+def test_error_bodies_are_unchanged(client, jwt_headers):
+    response = client.post('/api/v1/subscription', json={"price_id": "nope", "plan": 1}, headers=jwt_headers)
+    assert response.status_code == 400
+    assert response.get_json() == {"price_id": ["Not a valid UUID."], "plan": ["Unknown field."]}
+
+    response = client.post('/api/v1/subscription', json=[ID], headers=jwt_headers)
+    assert response.get_json() == {"_schema": ["Invalid input type."]}
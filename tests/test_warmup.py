@@ -0,0 +1,50 @@
+from app import warmup
+from app.warmup import warm_up
+
+STEPS = {'connections', 'catalog_version', 'plan_catalog', 'upgrade_graph', 'token_revocations', 'validators', 'password_hasher'}
+
+
+def test_warm_up_runs_every_step_and_primes_the_caches(app, client, active_price):
+    state = warm_up(app)
+
+    assert state.ready and state.error is None
+    assert set(state.steps) == STEPS
+    assert state.steps['connections']['count'] >= 1
+    assert state.steps['validators']['count'] >= 12
+    built = []
+    app.extensions['plan_catalog_cache'].get((None, 'application/json'), lambda: built.append(1))
+    assert built == []
+
+    # a second call does not redo the work
+    assert warm_up(app).steps is state.steps
+
+
+def test_readiness_waits_for_a_required_warm_up(app, client):
+    assert client.get('/internal/ready').status_code == 200
+    app.extensions['warm_up'].required = True
+
+    response = client.get('/internal/ready')
+    assert response.status_code == 503
+    assert response.get_json()['warm_up'] == {"seconds": None, "steps": None, "error": None}
+
+    warm_up(app)
+    response = client.get('/internal/ready')
+    assert response.status_code == 200
+    assert response.get_json()['ready'] is True
+
+
+def test_a_failed_warm_up_is_retried_by_the_readiness_check(app, client, monkeypatch):
+    app.extensions['warm_up'].required = True
+
+    def unreachable():
+        raise ConnectionError("database unreachable")
+
+    monkeypatch.setattr(warmup, 'open_connections', unreachable)
+    state = warm_up(app)
+    assert not state.ready and state.error == "database unreachable"
+    assert client.get('/internal/ready').status_code == 503
+
+    monkeypatch.undo()
+    response = client.get('/internal/ready')
+    assert response.status_code == 200
+    assert response.get_json()['warm_up']['error'] is None